@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -11,11 +11,124 @@ class Settings(BaseSettings):
     aws_secret_access_key: Optional[str] = None
     s3_bucket_name: str
     use_iam_role: bool = False
+    # S3-compatible endpoint (MinIO, LocalStack); None means AWS
+    s3_endpoint_url: Optional[str] = None
+    
+    # S3 I/O: blocking boto3 calls run on a bounded thread pool
+    s3_max_workers: int = 32
+    s3_max_pool_connections: int = 32
+    
+    # S3 retries ("standard" or "adaptive", which also rate-limits itself when throttled)
+    # and per-attempt timeouts, so one stuck connection cannot hold a request for long
+    s3_retry_mode: str = "adaptive"
+    s3_max_attempts: int = 4
+    s3_connect_timeout: float = 2.0
+    s3_read_timeout: float = 5.0
+    
+    # Read requests give up with 504 after request_deadline seconds (0 = no deadline);
+    # metadata reads still running after the recent s3_hedge_quantile latency are sent
+    # again, for at most s3_hedge_max_ratio of reads
+    request_deadline: float = 10.0
+    s3_hedge_reads: bool = False
+    s3_hedge_quantile: float = 0.95
+    s3_hedge_min_delay: float = 0.005
+    s3_hedge_max_ratio: float = 0.1
+    
+    # S3 health: background probe interval, and the circuit breaker that fails fast
+    # after circuit_breaker_failure_threshold consecutive outage errors
+    health_check_interval: float = 10.0
+    health_check_timeout: float = 3.0
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_reset_timeout: float = 30.0
     
     # Application Configuration
     app_env: str = "development"
     log_level: str = "INFO"
     
+    # Uploads: bodies are copied to a temp file in chunks, then streamed to S3
+    max_upload_size: int = 10 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+    upload_tmp_dir: Optional[str] = None
+    s3_multipart_threshold: int = 8 * 1024 * 1024
+    s3_multipart_chunksize: int = 8 * 1024 * 1024
+    presigned_post_ttl: int = 600
+    # Store identical uploads once (by SHA-256) and reference-count the shared objects
+    dedup_uploads: bool = True
+    
+    # Post-upload processing: with defer_derivatives, uploads return once the original and
+    # metadata are stored and thumbnails, renditions and hashes are made by job workers.
+    # Deferring needs the durable "sqlite" backend (job_db_path, shared with worker processes:
+    # python -m app.services.jobs worker); "memory" serves this process only and loses its
+    # jobs on restart, so it is for synchronous processing. job_workers = in-process workers
+    defer_derivatives: bool = True
+    job_backend: str = "sqlite"
+    job_db_path: str = "jobs.sqlite3"
+    job_workers: int = 2
+    job_max_attempts: int = 5
+    job_retry_delay: float = 2.0
+    job_lease: float = 300.0
+    job_poll_interval: float = 1.0
+    job_retention: float = 86400.0
+    
+    # Bulk uploads
+    bulk_upload_concurrency: int = 8
+    bulk_upload_max_items: int = 1000
+    max_bulk_archive_size: int = 1024 * 1024 * 1024
+    bulk_update_concurrency: int = 32
+    bulk_max_ids: int = 10_000
+    
+    # Thumbnails (0 workers = one per available CPU)
+    thumbnail_workers: int = 0
+    max_image_pixels: int = 50_000_000
+    
+    # Thumbnail proxy: serve thumbnails from this app through a local disk cache
+    # instead of handing out presigned S3 URLs (no dir = under the system temp dir)
+    thumbnail_proxy: bool = False
+    thumbnail_cache_dir: Optional[str] = None
+    thumbnail_cache_max_bytes: int = 512 * 1024 * 1024
+    thumbnail_cache_max_age: int = 31_536_000
+    
+    # Renditions: resized copies per width and format
+    rendition_widths: List[int] = [160, 480, 1280]
+    rendition_formats: List[str] = ["webp", "avif"]
+    rendition_quality: int = 80
+    
+    # On-demand renders (/render): only these sizes, qualities and formats are accepted
+    render_sizes: List[int] = [64, 128, 160, 240, 320, 480, 640, 800, 960, 1080, 1280, 1600, 1920, 2048]
+    render_qualities: List[int] = [50, 60, 70, 80, 90]
+    render_formats: List[str] = ["webp", "avif", "jpeg"]
+    render_cache_dir: Optional[str] = None
+    render_cache_max_bytes: int = 1024 * 1024 * 1024
+    
+    # Presigned URLs are reused until fewer than refresh_margin seconds remain
+    presigned_url_ttl: int = 3600
+    presigned_url_refresh_margin: int = 600
+    presigned_url_cache_size: int = 50_000
+    
+    # Metadata cache: entries younger than max_age skip S3, older ones revalidate by ETag
+    metadata_cache_size: int = 10_000
+    metadata_cache_max_age: float = 5.0
+    
+    # HTTP caching: list/detail ETags roll over every window seconds, which must not
+    # exceed presigned_url_refresh_margin so a revalidated body only holds live URLs
+    http_cache_window: int = 300
+    gzip_minimum_size: int = 1024
+    
+    # Pagination; pages with at least json_stream_min_items items are streamed
+    default_page_size: int = 50
+    max_page_size: int = 200
+    json_stream_min_items: int = 100
+    
+    # Near-duplicates: default perceptual-hash distances (bits of 64) for /similar and /duplicates
+    similar_max_distance: int = 10
+    duplicate_max_distance: int = 4
+    
+    # Metadata Index: time-ordered partitions split once they exceed this many images
+    metadata_index_partition_size: int = 1000
+    
+    # Storage inventory gauges and search indexes are refreshed from the metadata index this often
+    inventory_reconcile_interval: float = 300.0
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
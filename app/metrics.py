@@ -50,16 +50,168 @@ image_deletions_total = Counter(
     ['status']
 )
 
+bulk_upload_items_total = Counter(
+    'bulk_upload_items_total',
+    'Total number of images processed by bulk uploads',
+    ['status']
+)
+
+bulk_upload_images_per_second = Gauge(
+    'bulk_upload_images_per_second',
+    'Throughput of the most recent bulk upload'
+)
+
+bulk_upload_throughput = Histogram(
+    'bulk_upload_throughput_images_per_second',
+    'Throughput of bulk uploads in images per second',
+    buckets=[0.5, 1, 2, 5, 10, 20, 50, 100, 200]
+)
+
 images_stored_total = Gauge(
     'images_stored_total',
     'Current number of images in storage'
 )
 
+storage_bytes = Gauge(
+    'storage_bytes',
+    'Bytes stored, by object kind (original, thumbnail, rendition)',
+    ['kind']
+)
+
+storage_derivative_overhead_ratio = Gauge(
+    'storage_derivative_overhead_ratio',
+    'Thumbnail and rendition bytes per byte of original'
+)
+
+inventory_reconcile_drift_images = Gauge(
+    'inventory_reconcile_drift_images',
+    'Image count correction applied by the most recent inventory reconcile'
+)
+
+inventory_last_reconcile_timestamp = Gauge(
+    'inventory_last_reconcile_timestamp_seconds',
+    'Unix time of the most recent inventory reconcile'
+)
+
+# S3 API calls, recorded by botocore event hooks (app/services/s3_instrumentation.py)
 s3_operation_duration_seconds = Histogram(
     's3_operation_duration_seconds',
-    'Duration of S3 operations',
-    ['operation'],
-    buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0]
+    'Duration of S3 API calls, including retries',
+    ['operation', 'outcome'],
+    buckets=[
+        0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.04, 0.05,
+        0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0
+    ]
+)
+
+s3_retries_total = Counter(
+    's3_retries_total',
+    'Retries botocore made for S3 API calls',
+    ['operation']
+)
+
+s3_bytes_sent_total = Counter(
+    's3_bytes_sent_total',
+    'Request body bytes sent to S3',
+    ['operation']
+)
+
+s3_bytes_received_total = Counter(
+    's3_bytes_received_total',
+    'Response body bytes received from S3 (Content-Length)',
+    ['operation']
+)
+
+s3_pool_wait_seconds = Histogram(
+    's3_pool_wait_seconds',
+    'Time S3 calls waited for a free worker thread (and with it an HTTP connection)',
+    buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+# Hedged reads and request deadlines
+s3_hedges_total = Counter(
+    's3_hedges_total',
+    'Hedged S3 reads by outcome (won: the hedge answered first, lost: the original did, failed: both failed)',
+    ['operation', 'outcome']
+)
+
+s3_hedge_delay_seconds = Gauge(
+    's3_hedge_delay_seconds',
+    'Current hedge delay (recent latency quantile) per operation',
+    ['operation']
+)
+
+s3_deadline_exceeded_total = Counter(
+    's3_deadline_exceeded_total',
+    'S3 calls abandoned because the request deadline passed',
+    ['operation']
+)
+
+# Post-upload job queue (app/services/jobs.py)
+jobs_total = Counter(
+    'jobs_total',
+    'Finished job attempts by outcome (succeeded, retried, failed)',
+    ['kind', 'outcome']
+)
+
+job_duration_seconds = Histogram(
+    'job_duration_seconds',
+    'Duration of one job attempt',
+    ['kind'],
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+)
+
+job_wait_seconds = Histogram(
+    'job_wait_seconds',
+    'Time a job was due before a worker picked it up',
+    ['kind'],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0]
+)
+
+job_queue_depth = Gauge(
+    'job_queue_depth',
+    'Jobs in the queue by status (queued, running)',
+    ['status']
+)
+
+thumbnail_stage_duration_seconds = Histogram(
+    'thumbnail_stage_duration_seconds',
+    'Duration of each thumbnail generation stage',
+    ['stage'],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+# Local disk caches (thumbnails, rendered variants)
+disk_cache_total = Counter(
+    'disk_cache_total',
+    'Disk cache lookups (hit, miss, coalesced onto a running fill)',
+    ['cache', 'result']
+)
+
+disk_cache_bytes = Gauge(
+    'disk_cache_bytes',
+    'Bytes held in a disk cache',
+    ['cache']
+)
+
+disk_cache_files = Gauge(
+    'disk_cache_files',
+    'Files held in a disk cache',
+    ['cache']
+)
+
+# Presigned URLs
+presigned_url_cache_total = Counter(
+    'presigned_url_cache_total',
+    'Presigned URL cache lookups',
+    ['result']
+)
+
+# Metadata cache
+metadata_cache_total = Counter(
+    'metadata_cache_total',
+    'Metadata cache lookups (hit, revalidated via 304, miss)',
+    ['result']
 )
 
 # Connection pool
@@ -68,6 +220,39 @@ s3_connection_errors_total = Counter(
     'Total S3 connection errors'
 )
 
+# Circuit breaker
+CIRCUIT_BREAKER_STATES = ('closed', 'half_open', 'open')
+
+circuit_breaker_state = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state (1 for the current state)',
+    ['name', 'state']
+)
+
+circuit_breaker_transitions_total = Counter(
+    'circuit_breaker_transitions_total',
+    'Circuit breaker state transitions',
+    ['name', 'state']
+)
+
+circuit_breaker_rejections_total = Counter(
+    'circuit_breaker_rejections_total',
+    'Calls rejected without being attempted because the circuit was open',
+    ['name']
+)
+
+# Background health probe
+health_probe_duration_seconds = Histogram(
+    'health_probe_duration_seconds',
+    'Duration of background S3 health probes',
+    buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+)
+
+health_probe_last_success_timestamp = Gauge(
+    'health_probe_last_success_timestamp_seconds',
+    'Unix time of the last successful S3 health probe'
+)
+
 
 def track_image_upload(status: str, size: int):
     """Track image upload metrics"""
@@ -76,11 +261,64 @@ def track_image_upload(status: str, size: int):
         image_upload_size_bytes.observe(size)
 
 
+def track_bulk_upload(succeeded: int, failed: int, duration: float):
+    """Track bulk upload results and throughput"""
+    bulk_upload_items_total.labels(status='created').inc(succeeded)
+    bulk_upload_items_total.labels(status='failed').inc(failed)
+    if duration > 0 and succeeded:
+        throughput = succeeded / duration
+        bulk_upload_images_per_second.set(throughput)
+        bulk_upload_throughput.observe(throughput)
+
+
 def track_image_deletion(status: str):
     """Track image deletion metrics"""
     image_deletions_total.labels(status=status).inc()
 
 
+def track_thumbnail_stages(timings: dict):
+    """Track thumbnail decode/resize/encode durations"""
+    for stage, duration in timings.items():
+        thumbnail_stage_duration_seconds.labels(stage=stage).observe(duration)
+
+
+def track_disk_cache(cache: str, result: str):
+    """Track disk cache hit/miss/coalesced"""
+    disk_cache_total.labels(cache=cache, result=result).inc()
+
+
+def track_disk_cache_size(cache: str, size: int, files: int):
+    """Publish a disk cache's size"""
+    disk_cache_bytes.labels(cache=cache).set(size)
+    disk_cache_files.labels(cache=cache).set(files)
+
+
+def track_presigned_url_cache(result: str):
+    """Track presigned URL cache hit/miss"""
+    presigned_url_cache_total.labels(result=result).inc()
+
+
+def track_metadata_cache(result: str):
+    """Track metadata cache hit/revalidated/miss"""
+    metadata_cache_total.labels(result=result).inc()
+
+
+def track_inventory(images: int, bytes_by_kind: dict):
+    """Publish storage inventory totals"""
+    images_stored_total.set(images)
+    for kind, size in bytes_by_kind.items():
+        storage_bytes.labels(kind=kind).set(size)
+    original = bytes_by_kind.get('original', 0)
+    derivatives = sum(size for kind, size in bytes_by_kind.items() if kind != 'original')
+    storage_derivative_overhead_ratio.set(derivatives / original if original else 0)
+
+
+def track_inventory_reconcile(drift: int):
+    """Track an inventory reconcile and the correction it applied"""
+    inventory_reconcile_drift_images.set(drift)
+    inventory_last_reconcile_timestamp.set_to_current_time()
+
+
 def track_health_check(s3_healthy: bool):
     """Track health check"""
     status = 'healthy' if s3_healthy else 'unhealthy'
@@ -88,20 +326,78 @@ def track_health_check(s3_healthy: bool):
     health_check_s3_status.set(1 if s3_healthy else 0)
 
 
+def track_health_probe(s3_healthy: bool, duration: float):
+    """Track a background health probe"""
+    health_probe_duration_seconds.observe(duration)
+    health_check_s3_status.set(1 if s3_healthy else 0)
+    if s3_healthy:
+        health_probe_last_success_timestamp.set_to_current_time()
+
+
+def track_circuit_breaker_state(name: str, state: str):
+    """Track a circuit breaker entering `state`"""
+    for candidate in CIRCUIT_BREAKER_STATES:
+        circuit_breaker_state.labels(name=name, state=candidate).set(1 if candidate == state else 0)
+    circuit_breaker_transitions_total.labels(name=name, state=state).inc()
+
+
+def track_circuit_breaker_rejection(name: str):
+    """Track a call rejected by an open circuit"""
+    circuit_breaker_rejections_total.labels(name=name).inc()
+
+
 def track_s3_connection_error():
     """Track S3 connection error"""
     s3_connection_errors_total.inc()
 
 
-def track_s3_operation(operation: str):
-    """Context manager to track S3 operation duration"""
-    class S3OperationTimer:
-        def __enter__(self):
-            self.start = time.time()
-            return self
-        
-        def __exit__(self, *args):
-            duration = time.time() - self.start
-            s3_operation_duration_seconds.labels(operation=operation).observe(duration)
-    
-    return S3OperationTimer()
+def track_s3_call(
+    operation: str,
+    outcome: str,
+    duration: float,
+    retries: int,
+    bytes_sent: int,
+    bytes_received: int
+):
+    """Track one S3 API call"""
+    s3_operation_duration_seconds.labels(operation=operation, outcome=outcome).observe(duration)
+    if retries:
+        s3_retries_total.labels(operation=operation).inc(retries)
+    if bytes_sent:
+        s3_bytes_sent_total.labels(operation=operation).inc(bytes_sent)
+    if bytes_received:
+        s3_bytes_received_total.labels(operation=operation).inc(bytes_received)
+
+
+def track_s3_pool_wait(duration: float):
+    """Track how long an S3 call queued for a worker thread"""
+    s3_pool_wait_seconds.observe(duration)
+
+
+def track_hedge(operation: str, outcome: str):
+    """Track a hedged S3 read (won/lost/failed)"""
+    s3_hedges_total.labels(operation=operation, outcome=outcome).inc()
+
+
+def track_hedge_delay(operation: str, delay: float):
+    """Publish the current hedge delay"""
+    s3_hedge_delay_seconds.labels(operation=operation).set(delay)
+
+
+def track_deadline_exceeded(operation: str):
+    """Track an S3 call abandoned at the request deadline"""
+    s3_deadline_exceeded_total.labels(operation=operation).inc()
+
+
+def track_job(kind: str, outcome: str, duration: float, wait: float):
+    """Track one job attempt and how long it waited for a worker"""
+    jobs_total.labels(kind=kind, outcome=outcome).inc()
+    job_duration_seconds.labels(kind=kind).observe(duration)
+    job_wait_seconds.labels(kind=kind).observe(wait)
+
+
+def track_job_queue_depth(depth: dict):
+    """Publish the number of jobs per status"""
+    for status in ('queued', 'running'):
+        job_queue_depth.labels(status=status).set(depth.get(status, 0))
+
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 
@@ -10,6 +10,15 @@ class ImageMetadata(BaseModel):
     tags: List[str] = Field(default_factory=list)
 
 
+class Rendition(BaseModel):
+    """Model for a resized copy of an image"""
+    url: str
+    width: int
+    height: int
+    format: str
+    content_type: str
+
+
 class ImageResponse(BaseModel):
     """Model for image response"""
     id: str
@@ -18,9 +27,21 @@ class ImageResponse(BaseModel):
     tags: List[str] = []
     url: str
     thumbnail_url: Optional[str] = None
+    renditions: List[Rendition] = []
     created_at: str
     size: int
     content_type: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # "processing" until a deferred upload's derivatives exist (see job_id), then "ready"
+    status: str = "ready"
+    job_id: Optional[str] = None
+
+
+class ImagePage(BaseModel):
+    """Model for a page of images"""
+    items: List[ImageResponse]
+    next_cursor: Optional[str] = None
 
 
 class ImageUpdate(BaseModel):
@@ -30,8 +51,108 @@ class ImageUpdate(BaseModel):
     tags: Optional[List[str]] = None
 
 
+class UploadRequest(BaseModel):
+    """Model for requesting a direct-to-S3 upload"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str
+
+
+class UploadTicket(BaseModel):
+    """Presigned POST policy for a direct-to-S3 upload"""
+    image_id: str
+    url: str
+    fields: Dict[str, str]
+    expires_in: int
+    max_size: int
+
+
+class BulkUploadItem(BaseModel):
+    """Result for one file of a bulk upload"""
+    filename: str
+    status: str
+    image: Optional[ImageResponse] = None
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    """Bulk upload results"""
+    items: List[BulkUploadItem]
+    succeeded: int
+    failed: int
+    duration_seconds: float
+
+
+class BulkDeleteRequest(BaseModel):
+    """Model for deleting many images"""
+    ids: List[str] = Field(..., min_length=1)
+
+
+class BulkUpdateRequest(BaseModel):
+    """Model for applying one metadata change to many images"""
+    ids: List[str] = Field(..., min_length=1)
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    description: Optional[str] = Field(None, max_length=1000)
+    tags: Optional[List[str]] = None
+    add_tags: Optional[List[str]] = None
+    remove_tags: Optional[List[str]] = None
+
+
+class BulkResultItem(BaseModel):
+    """Outcome for one image of a batch operation"""
+    id: str
+    status: str
+
+
+class BulkResult(BaseModel):
+    """Batch operation results"""
+    results: List[BulkResultItem]
+    succeeded: int
+    failed: int
+
+
+class SimilarImage(BaseModel):
+    """An image and its perceptual-hash distance from the queried one"""
+    image: ImageResponse
+    distance: int
+
+
+class SimilarImages(BaseModel):
+    """Near-duplicates of one image, closest first"""
+    items: List[SimilarImage]
+
+
+class DuplicateCluster(BaseModel):
+    """Images whose perceptual hashes are linked within the distance limit"""
+    ids: List[str]
+    size: int
+
+
+class DuplicateReport(BaseModel):
+    """Near-duplicate clusters across the gallery, largest first"""
+    clusters: List[DuplicateCluster]
+    cluster_count: int
+    duplicate_images: int
+    images_hashed: int
+
+
+class JobResponse(BaseModel):
+    """State of a background job"""
+    id: str
+    kind: str
+    status: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    updated_at: datetime
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
     timestamp: str
     s3_connection: bool
+    s3_checked_at: Optional[str] = None
+    circuit_breaker: str = "closed"
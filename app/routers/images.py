@@ -1,21 +1,121 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
-from app.models.schemas import ImageResponse, ImageUpdate
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import hashlib
+import mimetypes
+import zipfile
+from app.config import settings
+from app.models.schemas import (
+    BulkDeleteRequest, BulkResult, BulkUpdateRequest, BulkUploadResponse, DuplicateReport,
+    ImageMetadata, ImagePage, ImageResponse, ImageUpdate, SimilarImages, UploadRequest, UploadTicket
+)
+from app.routers.responses import FileRangeResponse, page_response
+from app.services.bulk import BulkItem, bulk_upload
+from app.services.circuit_breaker import S3UnavailableError
+from app.services.deadline import DeadlineExceeded, deadline
+from app.services.renders import RenderSpec
 from app.services.s3_service import s3_service
-from app.metrics import track_image_upload, track_image_deletion, track_s3_operation
+from app.services.thumbnails import ImageRejectedError
+from app.services.uploads import (
+    MalformedUploadError, UploadTooLargeError, extract_zip_member, list_zip_images, spool_form, spool_upload
+)
+from app.metrics import track_image_upload, track_image_deletion
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/images", tags=["images"])
+router = APIRouter(prefix="/api/images", tags=["images"], default_response_class=ORJSONResponse)
 
 
-@router.get("/", response_model=List[ImageResponse])
-async def list_images():
-    """Get all images from gallery"""
+def _s3_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Storage is temporarily unavailable",
+        headers={"Retry-After": str(int(settings.circuit_breaker_reset_timeout))}
+    )
+
+
+def _deadline_exceeded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail="Storage did not answer in time"
+    )
+
+
+async def _read_deadline():
+    """Bound the S3 time of a read request by settings.request_deadline"""
+    with deadline(settings.request_deadline):
+        yield
+
+
+# Presigned URLs are bearer credentials, so only the browser may cache, and must revalidate
+CACHE_CONTROL = "private, no-cache"
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+
+def _not_modified_since(request: Request, last_modified: float) -> bool:
+    """If-Modified-Since check; only consulted when the client sent no If-None-Match"""
+    header = request.headers.get("if-modified-since")
+    if not header or "if-none-match" in request.headers:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _cache_headers(etag: str, last_modified: Optional[float] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+@router.get("/", response_model=ImagePage, dependencies=[Depends(_read_deadline)])
+async def list_images(
+    request: Request,
+    limit: int = Query(settings.default_page_size, ge=1, le=settings.max_page_size),
+    cursor: Optional[str] = None,
+    tag: Optional[str] = Query(None, max_length=100),
+    q: Optional[str] = Query(None, max_length=200)
+):
+    """
+    Get a page of images from gallery, newest first, optionally filtered by tag and text
+    
+    Answers 304 without touching S3 while the collection version is unchanged.
+    The page is encoded with orjson (streamed for large pages) rather than
+    validated item by item against ImagePage.
+    """
+    etag = s3_service.list_etag()
+    last_modified = s3_service.list_last_modified()
+    headers = _cache_headers(etag, last_modified)
+    if _etag_matches(request, etag) or _not_modified_since(request, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     try:
-        images = await s3_service.list_images()
-        return images
+        page = await s3_service.list_images(limit=limit, cursor=cursor, tag=tag, q=q)
+        return page_response(page, settings.json_stream_min_items, headers=headers)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except DeadlineExceeded:
+        raise _deadline_exceeded()
     except Exception as e:
         logger.error(f"Error listing images: {e}")
         raise HTTPException(
@@ -24,11 +124,42 @@ async def list_images():
         )
 
 
-@router.get("/{image_id}", response_model=ImageResponse)
-async def get_image(image_id: str):
-    """Get single image by ID"""
+@router.get("/duplicates", response_model=DuplicateReport, dependencies=[Depends(_read_deadline)])
+async def duplicate_report(
+    max_distance: int = Query(settings.duplicate_max_distance, ge=0, le=8),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Clusters of near-duplicate images (resized or recompressed copies), largest first
+    
+    Two images belong to one cluster when a chain of perceptual hashes
+    links them, each step at most `max_distance` bits apart.
+    """
     try:
-        image = await s3_service.get_image(image_id)
+        return await s3_service.duplicate_clusters(max_distance=max_distance, limit=limit)
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except DeadlineExceeded:
+        raise _deadline_exceeded()
+    except Exception as e:
+        logger.error(f"Error building duplicate report: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to build duplicate report"
+        )
+
+
+@router.get("/{image_id}", response_model=ImageResponse, dependencies=[Depends(_read_deadline)])
+async def get_image(image_id: str, request: Request, response: Response):
+    """Get single image by ID; answers 304 while its metadata ETag is unchanged"""
+    try:
+        etag = await s3_service.get_image_etag(image_id)
+        image = None
+        if etag is not None:
+            headers = _cache_headers(etag)
+            if _etag_matches(request, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            image = await s3_service.get_image(image_id)
         
         if not image:
             raise HTTPException(
@@ -36,9 +167,14 @@ async def get_image(image_id: str):
                 detail="Image not found"
             )
         
+        response.headers.update(headers)
         return image
     except HTTPException:
         raise
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except DeadlineExceeded:
+        raise _deadline_exceeded()
     except Exception as e:
         logger.error(f"Error getting image: {e}")
         raise HTTPException(
@@ -47,56 +183,242 @@ async def get_image(image_id: str):
         )
 
 
-@router.post("/", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
-async def upload_image(
-    file: UploadFile = File(...),
-    title: str = Form(...),
-    description: Optional[str] = Form(None),
-    tags: Optional[str] = Form(None)
+@router.get("/{image_id}/similar", response_model=SimilarImages, dependencies=[Depends(_read_deadline)])
+async def similar_images(
+    image_id: str,
+    max_distance: int = Query(settings.similar_max_distance, ge=0, le=32),
+    limit: int = Query(20, ge=1, le=settings.max_page_size)
 ):
-    """Upload new image to gallery"""
+    """Images that look like this one (perceptual hash within `max_distance` bits), closest first"""
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
+        items = await s3_service.similar_images(image_id, max_distance=max_distance, limit=limit)
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except DeadlineExceeded:
+        raise _deadline_exceeded()
+    except Exception as e:
+        logger.error(f"Error finding similar images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to find similar images"
+        )
+    if items is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    return {"items": items}
+
+
+def _range_header(request: Request, etag: str) -> Optional[str]:
+    """The Range header, unless an If-Range names a different version"""
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    return request.headers.get("range")
+
+
+def _immutable_headers(key: str) -> dict:
+    """
+    Caching headers for derived image files
+    
+    A thumbnail or variant never changes once its key exists (keys derive
+    from the image ID and render parameters), so the key alone identifies
+    the bytes and caches may keep them for THUMBNAIL_CACHE_MAX_AGE.
+    """
+    return {
+        "ETag": '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"',
+        "Cache-Control": f"public, max-age={settings.thumbnail_cache_max_age}, immutable"
+    }
+
+
+@router.get("/{image_id}/thumbnail", response_class=FileRangeResponse, status_code=status.HTTP_200_OK)
+async def get_thumbnail(image_id: str, request: Request):
+    """
+    Serve a thumbnail from the local disk cache (thumbnail proxy)
+    
+    Answers 304 on a matching If-None-Match without touching disk or S3,
+    and honours single byte ranges (If-Range is compared to the ETag).
+    """
+    headers = _immutable_headers(f"thumbnails/{image_id}")
+    etag = headers["ETag"]
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    try:
+        thumbnail = await s3_service.open_thumbnail(image_id)
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error getting thumbnail: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get thumbnail"
+        )
+    if thumbnail is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    
+    file, content_type = thumbnail
+    return FileRangeResponse(file, content_type, range_header=_range_header(request, etag), headers=headers)
+
+
+@router.get("/{image_id}/render", response_class=FileRangeResponse, status_code=status.HTTP_200_OK)
+async def render_image(
+    image_id: str,
+    request: Request,
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fit: str = "contain",
+    fmt: str = "webp",
+    q: int = settings.rendition_quality
+):
+    """
+    Serve a resized variant of an image, rendering it on first request
+    
+    Only the sizes, qualities and formats configured in the render
+    settings are accepted. Variants are cached on local disk and in S3,
+    so repeat requests never decode the original again.
+    """
+    try:
+        spec = RenderSpec.parse(
+            w, h, fit, fmt, q,
+            sizes=settings.render_sizes,
+            qualities=settings.render_qualities,
+            formats=s3_service.thumbnails.render_formats
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    headers = _immutable_headers(spec.key(image_id))
+    etag = headers["ETag"]
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    try:
+        variant = await s3_service.open_variant(image_id, spec)
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error rendering image: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to render image"
+        )
+    if variant is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    
+    file, content_type = variant
+    return FileRangeResponse(file, content_type, range_header=_range_header(request, etag), headers=headers)
+
+
+# Text fields and multipart framing allowed on top of MAX_UPLOAD_SIZE
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file", "title"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "title": {"type": "string"},
+                "description": {"type": "string"},
+                "tags": {"type": "string", "description": "Comma-separated"}
+            }
+        }}}
+    }
+}
+
+
+@router.post(
+    "/",
+    response_model=ImageResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=UPLOAD_FORM_SCHEMA
+)
+async def upload_image(request: Request):
+    """
+    Upload new image to gallery
+    
+    The form is parsed as it arrives rather than by Starlette, so an
+    oversized upload is refused from its Content-Length, or as soon as
+    MAX_UPLOAD_SIZE bytes of file have been received, and the file is
+    written to disk once.
+    """
+    try:
+        declared = request.headers.get('content-length', '')
+        if declared.isdigit() and int(declared) > settings.max_upload_size + UPLOAD_FORM_OVERHEAD:
+            raise UploadTooLargeError(
+                f"File size must be less than {settings.max_upload_size // (1024 * 1024)}MB"
+            )
+        form = await spool_form(
+            request.stream(),
+            request.headers.get('content-type', ''),
+            file_field='file',
+            max_size=settings.max_upload_size,
+            max_fields_size=UPLOAD_FORM_OVERHEAD,
+            tmp_dir=settings.upload_tmp_dir
+        )
+    except (UploadTooLargeError, MalformedUploadError) as e:
+        track_image_upload('failed', 0)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    upload = form.file
+    try:
+        if upload is None or not form.fields.get('title'):
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File must be an image"
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="file and title are required"
             )
         
-        # Validate file size (max 10MB)
-        file_data = await file.read()
-        if len(file_data) > 10 * 1024 * 1024:
+        # Validate file type
+        if not (upload.content_type or '').startswith('image/'):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File size must be less than 10MB"
+                detail="File must be an image"
             )
         
-        # Parse tags
-        tags_list = []
-        if tags:
-            tags_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
-        
         # Upload to S3
         metadata = await s3_service.upload_image(
-            file_data=file_data,
-            filename=file.filename,
-            content_type=file.content_type,
-            title=title,
-            description=description,
-            tags=tags_list
+            file_path=upload.path,
+            size=upload.size,
+            filename=upload.filename,
+            content_type=upload.content_type,
+            title=form.fields['title'],
+            description=form.fields.get('description'),
+            tags=_parse_tags(form.fields.get('tags')),
+            content_hash=upload.sha256
         )
         
         # Track successful upload
-        track_image_upload('success', len(file_data))
+        track_image_upload('success', upload.size)
         
-        # Get full metadata with URLs
-        image = await s3_service.get_image(metadata['id'])
-        
-        return image
+        # Build the response from the metadata just written
+        return s3_service.with_urls(metadata)
         
     except HTTPException:
         track_image_upload('failed', 0)
         raise
+    except ImageRejectedError as e:
+        track_image_upload('failed', 0)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except S3UnavailableError:
+        raise _s3_unavailable()
     except Exception as e:
         logger.error(f"Error uploading image: {e}")
         track_image_upload('error', 0)
@@ -104,6 +426,235 @@ async def upload_image(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload image: {str(e)}"
         )
+    finally:
+        if upload is not None:
+            upload.close()
+
+
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+def _parse_tags(tags: Optional[str]) -> List[str]:
+    if not tags:
+        return []
+    return [tag.strip() for tag in tags.split(',') if tag.strip()]
+
+
+def _spool_opener(file: UploadFile):
+    async def open_upload():
+        return await spool_upload(
+            file,
+            max_size=settings.max_upload_size,
+            chunk_size=settings.upload_chunk_size,
+            tmp_dir=settings.upload_tmp_dir
+        )
+    return open_upload
+
+
+def _zip_member_opener(archive_path: str, member: zipfile.ZipInfo):
+    async def open_member():
+        return await asyncio.to_thread(
+            extract_zip_member,
+            archive_path,
+            member,
+            settings.max_upload_size,
+            settings.upload_chunk_size,
+            settings.upload_tmp_dir
+        )
+    return open_member
+
+
+@router.post("/bulk", response_model=BulkUploadResponse)
+async def bulk_upload_images(
+    files: List[UploadFile] = File(...),
+    description: Optional[str] = Form(None),
+    tags: Optional[str] = Form(None)
+):
+    """Upload many images (or zip archives of images) in one request"""
+    archives = []
+    try:
+        items = []
+        for file in files:
+            is_zip = file.content_type in ZIP_CONTENT_TYPES or (file.filename or '').lower().endswith('.zip')
+            if not is_zip:
+                items.append(BulkItem(file.filename, file.content_type or '', _spool_opener(file)))
+                continue
+            
+            # Archives are spooled once; members are extracted lazily by the workers
+            archive = await spool_upload(
+                file,
+                max_size=settings.max_bulk_archive_size,
+                chunk_size=settings.upload_chunk_size,
+                tmp_dir=settings.upload_tmp_dir
+            )
+            archives.append(archive)
+            try:
+                members = await asyncio.to_thread(
+                    list_zip_images, archive.path, settings.bulk_upload_max_items
+                )
+            except zipfile.BadZipFile:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{file.filename} is not a valid zip archive"
+                )
+            for member in members:
+                content_type = mimetypes.guess_type(member.filename)[0]
+                items.append(BulkItem(member.filename, content_type, _zip_member_opener(archive.path, member)))
+        
+        if len(items) > settings.bulk_upload_max_items:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {settings.bulk_upload_max_items} images per request"
+            )
+        
+        return await bulk_upload(
+            items,
+            description=description,
+            tags=_parse_tags(tags),
+            concurrency=settings.bulk_upload_concurrency
+        )
+        
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error in bulk upload: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process bulk upload"
+        )
+    finally:
+        for archive in archives:
+            archive.close()
+
+
+def _bulk_result(statuses: dict, success: str) -> dict:
+    results = [{"id": image_id, "status": outcome} for image_id, outcome in statuses.items()]
+    succeeded = sum(1 for outcome in statuses.values() if outcome == success)
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+
+def _check_bulk_size(ids: List[str]):
+    if len(ids) > settings.bulk_max_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.bulk_max_ids} ids per request"
+        )
+
+
+@router.post("/bulk-delete", response_model=BulkResult)
+async def bulk_delete_images(delete_request: BulkDeleteRequest):
+    """Delete many images in one request"""
+    _check_bulk_size(delete_request.ids)
+    try:
+        statuses = await s3_service.delete_images(delete_request.ids)
+        for outcome in statuses.values():
+            track_image_deletion('success' if outcome == 'deleted' else 'failed')
+        return _bulk_result(statuses, 'deleted')
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error deleting images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete images"
+        )
+
+
+@router.patch("/bulk", response_model=BulkResult)
+async def bulk_update_images(update_request: BulkUpdateRequest):
+    """Apply one metadata change (title, description, tags) to many images"""
+    _check_bulk_size(update_request.ids)
+    try:
+        statuses = await s3_service.update_images(
+            update_request.ids,
+            title=update_request.title,
+            description=update_request.description,
+            tags=update_request.tags,
+            add_tags=update_request.add_tags,
+            remove_tags=update_request.remove_tags
+        )
+        return _bulk_result(statuses, 'updated')
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error updating images: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update images"
+        )
+
+
+@router.post("/uploads", response_model=UploadTicket, status_code=status.HTTP_201_CREATED)
+async def create_upload(upload_request: UploadRequest):
+    """Get a presigned POST policy to upload an image straight to S3"""
+    if not upload_request.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an image"
+        )
+    
+    try:
+        return await s3_service.create_upload(
+            filename=upload_request.filename,
+            content_type=upload_request.content_type
+        )
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error creating upload: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create upload"
+        )
+
+
+@router.post("/uploads/{image_id}/complete", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
+async def complete_upload(image_id: str, image_metadata: ImageMetadata):
+    """Store an image uploaded via presigned POST like any other upload (dedup, derivatives or their job)"""
+    try:
+        metadata = await s3_service.finalize_upload(
+            image_id=image_id,
+            title=image_metadata.title,
+            description=image_metadata.description,
+            tags=image_metadata.tags
+        )
+        
+        if not metadata:
+            track_image_upload('failed', 0)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Uploaded image not found"
+            )
+        
+        track_image_upload('success', metadata['size'])
+        
+        # Build the response from the metadata just written
+        return s3_service.with_urls(metadata)
+        
+    except HTTPException:
+        raise
+    except ImageRejectedError as e:
+        track_image_upload('failed', 0)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except S3UnavailableError:
+        raise _s3_unavailable()
+    except Exception as e:
+        logger.error(f"Error completing upload: {e}")
+        track_image_upload('error', 0)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to complete upload: {str(e)}"
+        )
 
 
 @router.put("/{image_id}", response_model=ImageResponse)
@@ -111,8 +662,7 @@ async def update_image(image_id: str, update_data: ImageUpdate):
     """Update image metadata"""
     try:
         # Check if image exists
-        existing_image = await s3_service.get_image(image_id)
-        if not existing_image:
+        if not await s3_service.image_exists(image_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Image not found"
@@ -132,13 +682,13 @@ async def update_image(image_id: str, update_data: ImageUpdate):
                 detail="Failed to update image"
             )
         
-        # Get full metadata with URLs
-        image = await s3_service.get_image(image_id)
-        
-        return image
+        # Build the response from the metadata just written
+        return s3_service.with_urls(updated_metadata)
         
     except HTTPException:
         raise
+    except S3UnavailableError:
+        raise _s3_unavailable()
     except Exception as e:
         logger.error(f"Error updating image: {e}")
         raise HTTPException(
@@ -152,8 +702,7 @@ async def delete_image(image_id: str):
     """Delete image from gallery"""
     try:
         # Check if image exists
-        existing_image = await s3_service.get_image(image_id)
-        if not existing_image:
+        if not await s3_service.image_exists(image_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Image not found"
@@ -174,6 +723,8 @@ async def delete_image(image_id: str):
         
     except HTTPException:
         raise
+    except S3UnavailableError:
+        raise _s3_unavailable()
     except Exception as e:
         logger.error(f"Error deleting image: {e}")
         track_image_deletion('error')
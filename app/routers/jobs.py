@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import ORJSONResponse
+from app.models.schemas import JobResponse
+from app.services.s3_service import s3_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"], default_response_class=ORJSONResponse)
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Status of a background job, such as the derivatives of an upload
+    
+    Finished jobs can be looked up for JOB_RETENTION seconds.
+    """
+    try:
+        job = await s3_service.jobs.get(job_id)
+    except Exception as e:
+        logger.error(f"Error getting job: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get job"
+        )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
@@ -0,0 +1,172 @@
+import os
+from email.utils import formatdate
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import anyio
+import orjson
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.models.schemas import ImageResponse, Rendition
+
+# Records built by S3Service already have the response types, so they are
+# projected onto the response models' fields instead of being re-validated
+IMAGE_FIELDS = tuple(ImageResponse.model_fields.items())
+RENDITION_FIELDS = tuple(Rendition.model_fields.items())
+
+# Items per chunk of a streamed array
+STREAM_CHUNK_ITEMS = 64
+
+
+def _project(record: Dict, fields) -> Dict:
+    return {
+        name: record[name] if name in record else field.get_default(call_default_factory=True)
+        for name, field in fields
+    }
+
+
+def public_image(metadata: Dict) -> Dict:
+    """Reduce a metadata record (with URLs) to the fields of ImageResponse"""
+    image = _project(metadata, IMAGE_FIELDS)
+    image['renditions'] = [_project(rendition, RENDITION_FIELDS) for rendition in image['renditions']]
+    return image
+
+
+def _stream_page(items: List[Dict], next_cursor: Optional[str]) -> Iterator[bytes]:
+    yield b'{"items":['
+    for start in range(0, len(items), STREAM_CHUNK_ITEMS):
+        chunk = b','.join(
+            orjson.dumps(public_image(item)) for item in items[start:start + STREAM_CHUNK_ITEMS]
+        )
+        yield chunk if start == 0 else b',' + chunk
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b'}'
+
+
+def page_response(page: Dict, stream_min_items: int, headers: Optional[Dict] = None):
+    """
+    Serialize an ImagePage with orjson, skipping pydantic validation
+
+    Pages of at least `stream_min_items` items are streamed as a JSON array
+    in chunks, so the encoded body never exists as one large buffer.
+    """
+    items = page['items']
+    if len(items) >= stream_min_items:
+        return StreamingResponse(
+            _stream_page(items, page['next_cursor']),
+            media_type="application/json",
+            headers=headers
+        )
+    return ORJSONResponse(
+        {"items": [public_image(item) for item in items], "next_cursor": page['next_cursor']},
+        headers=headers
+    )
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range `Range: bytes=...` header into inclusive (start, end)
+
+    Returns None when the whole file should be sent: no header, another
+    unit, several ranges (which servers may ignore) or a malformed spec,
+    which RFC 7233 says to ignore. Raises ValueError for a well-formed
+    range that cannot be satisfied (start past the end, or an empty or
+    zero-length suffix).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, dash, last = header[len("bytes="):].strip().partition("-")
+    if not dash or not (first or last) or not _is_digits(first or "0") or not _is_digits(last or "0"):
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _is_digits(value: str) -> bool:
+    # int() would also take signs, spaces, underscores and non-ASCII digits
+    return value.isascii() and value.isdigit()
+
+
+class FileRangeResponse(Response):
+    """
+    Serve an open file, honouring a single byte range
+
+    When the server offers the ASGI `http.response.zerocopysend` extension
+    the body is handed over as the file descriptor, so the server can use
+    sendfile(2); otherwise it is read with pread on a worker thread. The
+    file is closed once the response is sent.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        media_type: str,
+        range_header: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        self.file = file
+        self.background = None
+        stat = os.fstat(file.fileno())
+        size = stat.st_size
+        self.status_code = 200
+        self.start, self.length = 0, size
+
+        extra = {"Accept-Ranges": "bytes", "Last-Modified": formatdate(stat.st_mtime, usegmt=True)}
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            byte_range = None
+            self.status_code = 416
+            self.length = 0
+            extra["Content-Range"] = f"bytes */{size}"
+        if byte_range is not None:
+            self.status_code = 206
+            self.start, end = byte_range
+            self.length = end - self.start + 1
+            extra["Content-Range"] = f"bytes {self.start}-{end}/{size}"
+
+        self.media_type = media_type
+        self.init_headers({**(headers or {}), **extra, "Content-Length": str(self.length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if self.length == 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False
+                })
+            else:
+                fd = self.file.fileno()
+                offset, remaining = self.start, self.length
+                while remaining:
+                    chunk = await anyio.to_thread.run_sync(os.pread, fd, min(self.chunk_size, remaining), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining:
+                    # The file shrank underneath us; end the body
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.file.close()
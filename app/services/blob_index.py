@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class BlobIndex:
+    """
+    Content-hash index of stored originals, with reference counts
+
+    One JSON object per distinct upload content (`blobs/sha256/{hash}.json`)
+    records the keys of the original, thumbnail and renditions made from
+    it and the IDs of every image that points at them. An upload whose
+    hash is already indexed only adds a reference; deleting an image
+    removes its reference, and the shared objects go with the last one.
+
+    Each record is read-modified-written under a per-hash lock, which
+    also keeps two identical uploads in this process from both storing
+    the file. Writers on other pods are not serialised; a lost update
+    there can only leak objects, never delete ones still referenced
+    through this process.
+
+    The S3 client is blocking; `run` is the owner's coroutine that executes
+    a blocking callable off the event loop.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name: str,
+        run: Callable[..., Awaitable[Any]],
+        prefix: str = "blobs/sha256/"
+    ):
+        self.s3_client = s3_client
+        self._run = run
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{digest}.json"
+
+    @asynccontextmanager
+    async def locked(self, digest: str) -> AsyncIterator[None]:
+        """Hold the lock for one content hash (dropped once nobody waits on it)"""
+        lock = self._locks.setdefault(digest, asyncio.Lock())
+        self._lock_users[digest] = self._lock_users.get(digest, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[digest] -= 1
+            if not self._lock_users[digest]:
+                del self._lock_users[digest]
+                del self._locks[digest]
+
+    def _get_record(self, digest: str) -> Optional[Dict]:
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._key(digest))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(obj["Body"].read())
+
+    def _put_record(self, digest: str, record: Dict):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self._key(digest),
+            Body=json.dumps(record, separators=(",", ":")),
+            ContentType="application/json"
+        )
+
+    async def get(self, digest: str) -> Optional[Dict]:
+        """The blob record for `digest`, or None if that content is not stored"""
+        return await self._run(self._get_record, digest)
+
+    async def add_reference(self, digest: str, image_id: str) -> Optional[Dict]:
+        """
+        Reference the stored blob for `digest` from a new image
+
+        Returns the blob record (its object keys and sizes), or None if
+        this content is not stored yet. Call while holding `locked(digest)`.
+        """
+        record = await self._run(self._get_record, digest)
+        if record is None:
+            return None
+        if image_id not in record["refs"]:
+            record["refs"].append(image_id)
+            await self._run(self._put_record, digest, record)
+        return record
+
+    async def create(self, digest: str, image_id: str, metadata: Dict):
+        """Index freshly stored objects under their hash; call while holding `locked(digest)`"""
+        record = {
+            "image_key": metadata["image_key"],
+            "thumbnail_key": metadata["thumbnail_key"],
+            "thumbnail_size": metadata.get("thumbnail_size", 0),
+            "renditions": metadata.get("renditions", []),
+            "content_type": metadata["content_type"],
+            "size": metadata["size"],
+            "phash": metadata.get("phash"),
+            "width": metadata.get("width"),
+            "height": metadata.get("height"),
+            "refs": [image_id]
+        }
+        if metadata.get("job_id"):
+            # Derivatives are still being made; duplicates until then share the job
+            record["job_id"] = metadata["job_id"]
+        await self._run(self._put_record, digest, record)
+
+    async def set_derivatives(self, digest: str, derivatives: Dict) -> Optional[Dict]:
+        """
+        Record derivatives made after the blob was stored; call while holding `locked(digest)`
+
+        Clears the pending job. Returns the updated record (with the IDs of
+        every image to update), or None if no image references it anymore.
+        """
+        record = await self._run(self._get_record, digest)
+        if record is None:
+            return None
+        record.update(derivatives)
+        record.pop("job_id", None)
+        await self._run(self._put_record, digest, record)
+        return record
+
+    async def remove_references(self, digest: str, image_ids: List[str]) -> Optional[Dict]:
+        """
+        Drop references to a blob; call while holding `locked(digest)`
+
+        Returns the record if no references remain (its index entry is
+        then removed and the caller deletes the objects), otherwise None.
+        An unindexed hash returns None, so its objects are kept.
+        """
+        record = await self._run(self._get_record, digest)
+        if record is None:
+            return None
+        record["refs"] = [ref for ref in record["refs"] if ref not in image_ids]
+        if record["refs"]:
+            await self._run(self._put_record, digest, record)
+            return None
+        await self._run(
+            self.s3_client.delete_object,
+            Bucket=self.bucket_name,
+            Key=self._key(digest)
+        )
+        return record
+
+    async def release(self, digest: str, image_ids: List[str]) -> Optional[Dict]:
+        """`remove_references` under the hash's lock"""
+        async with self.locked(digest):
+            return await self.remove_references(digest, image_ids)
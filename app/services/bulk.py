@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.metrics import track_bulk_upload, track_image_upload
+from app.services.s3_service import s3_service
+from app.services.thumbnails import ImageRejectedError
+from app.services.uploads import SpooledUpload, UploadTooLargeError
+
+logger = logging.getLogger(__name__)
+
+
+class BulkItem:
+    """One image of a bulk upload; `open` spools it to a local file on demand"""
+
+    def __init__(self, filename: str, content_type: str, open: Callable[[], Awaitable[SpooledUpload]]):
+        self.filename = filename
+        self.content_type = content_type
+        self.open = open
+
+
+def title_from_filename(filename: str) -> str:
+    """Default title for bulk uploads: the file name without directories or extension"""
+    stem = os.path.splitext(os.path.basename(filename))[0].strip()
+    return (stem or filename)[:200]
+
+
+async def bulk_upload(
+    items: List[BulkItem],
+    description: Optional[str] = None,
+    tags: List[str] = [],
+    concurrency: int = 8
+) -> Dict:
+    """
+    Upload many images through a bounded pool of concurrent workers
+
+    Up to `concurrency` items are in flight at once, so one item's S3
+    writes overlap with another's thumbnail work on the process pool.
+    Items are only spooled to disk once a worker picks them up. Every
+    item gets its own result; one failure never aborts the batch.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ingest(item: BulkItem) -> Dict:
+        async with semaphore:
+            result = {"filename": item.filename, "status": "failed", "image": None, "error": None}
+            try:
+                if not item.content_type.startswith('image/'):
+                    raise ImageRejectedError("File must be an image")
+                with await item.open() as upload:
+                    metadata = await s3_service.upload_image(
+                        file_path=upload.path,
+                        size=upload.size,
+                        filename=os.path.basename(item.filename),
+                        content_type=item.content_type,
+                        title=title_from_filename(item.filename),
+                        description=description,
+                        tags=tags,
+                        content_hash=upload.sha256
+                    )
+                track_image_upload('success', upload.size)
+                result.update(status="created", image=s3_service.with_urls(metadata))
+            except (ImageRejectedError, UploadTooLargeError) as e:
+                track_image_upload('failed', 0)
+                result["error"] = str(e)
+            except Exception as e:
+                logger.error(f"Error uploading {item.filename} in bulk: {e}")
+                track_image_upload('error', 0)
+                result["error"] = "Failed to upload image"
+            return result
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(ingest(item) for item in items))
+    duration = time.perf_counter() - start
+
+    succeeded = sum(1 for result in results if result["status"] == "created")
+    track_bulk_upload(succeeded, len(results) - succeeded, duration)
+    logger.info(f"Bulk upload: {succeeded}/{len(results)} images in {duration:.2f}s")
+
+    return {
+        "items": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duration_seconds": duration
+    }
@@ -0,0 +1,77 @@
+import logging
+import time
+
+from app.metrics import track_circuit_breaker_rejection, track_circuit_breaker_state
+
+logger = logging.getLogger(__name__)
+
+
+class S3UnavailableError(Exception):
+    """Raised instead of calling S3 while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a dependency is down
+
+    After `failure_threshold` consecutive outage errors the circuit opens
+    and calls raise S3UnavailableError without touching the network. Once
+    `reset_timeout` seconds have passed one trial call is let through
+    (half-open): success closes the circuit, failure re-opens it. A
+    successful health probe closes it as well.
+
+    All methods are called from the event loop thread.
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._state = self.CLOSED
+        track_circuit_breaker_state(name, self._state)
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str):
+        if state != self._state:
+            logger.warning(f"Circuit breaker {self.name}: {self._state} -> {state}")
+            self._state = state
+            track_circuit_breaker_state(self.name, state)
+
+    def before_call(self):
+        """Raise S3UnavailableError if the call must not be attempted"""
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        track_circuit_breaker_rejection(self.name)
+        raise S3UnavailableError(f"{self.name} is unavailable (circuit {state})")
+
+    def record_success(self):
+        self._failures = 0
+        self._trial_in_flight = False
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def release(self):
+        """End a call whose outcome says nothing about the dependency's health"""
+        self._trial_in_flight = False
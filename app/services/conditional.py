@@ -0,0 +1,41 @@
+from botocore.exceptions import ClientError
+
+# PutObject preconditions S3 accepts but older botocore models do not declare
+_CONDITIONS = {'IfMatch': 'If-Match', 'IfNoneMatch': 'If-None-Match'}
+
+
+def is_precondition_failed(error: ClientError) -> bool:
+    """True when a conditional write lost a race (the object changed or already exists)"""
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('PreconditionFailed', 'ConditionalRequestConflict') or status in (409, 412)
+
+
+def _stash_conditions(params, model, context, **kwargs):
+    # Runs before parameter validation, which would reject the unknown names
+    members = model.input_shape.members
+    for name in _CONDITIONS:
+        if name in params and name not in members:
+            context.setdefault('put_conditions', {})[name] = params.pop(name)
+
+
+def _add_condition_headers(params, context, **kwargs):
+    for name, value in context.get('put_conditions', {}).items():
+        params['headers'][_CONDITIONS[name]] = value
+
+
+def enable_conditional_writes(client):
+    """
+    Let `put_object` take `IfMatch` / `IfNoneMatch` on any botocore version
+
+    Newer botocore declares both parameters and these hooks step aside;
+    older ones get the headers added to the request directly.
+    """
+    events = client.meta.events
+    events.register(
+        'before-parameter-build.s3.PutObject', _stash_conditions, unique_id='conditional-stash'
+    )
+    events.register(
+        'before-call.s3.PutObject', _add_condition_headers, unique_id='conditional-headers'
+    )
+    return client
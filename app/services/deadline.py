@@ -0,0 +1,61 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from app.metrics import track_deadline_exceeded
+
+# Monotonic time by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar('s3_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the current request's deadline passes before an S3 call completes"""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Give S3 calls made inside the block a shared time budget
+
+    Nested blocks can only shorten the budget. `None` or 0 leaves it as is.
+    """
+    current = _deadline.get()
+    if seconds:
+        expires = time.monotonic() + seconds
+        current = expires if current is None else min(current, expires)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def check(operation: str = 'unknown'):
+    """Raise DeadlineExceeded if the current deadline has passed"""
+    left = remaining()
+    if left is not None and left <= 0:
+        track_deadline_exceeded(operation)
+        raise DeadlineExceeded(f"Deadline exceeded before {operation}")
+
+
+def _before_send(request, event_name: str, **kwargs):
+    # Runs before every HTTP attempt, so retries stop once the budget is spent
+    check(event_name.rsplit('.', 1)[-1])
+
+
+def enforce_deadlines(client):
+    """
+    Make a botocore client give up on retries once the caller's deadline passes
+
+    The deadline is read from the calling thread's context, so calls must
+    run in a copy of the request's context (S3Service does this).
+    """
+    client.meta.events.register('before-send.s3', _before_send, unique_id='deadline-before-send')
+    return client
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Awaitable, BinaryIO, Callable, Dict, Optional, Union
+
+from app.metrics import track_disk_cache, track_disk_cache_size
+
+logger = logging.getLogger(__name__)
+
+
+class DiskLRUCache:
+    """
+    Bounded least-recently-used cache of files in one local directory
+
+    Files are named by the SHA-256 of their key, so the cache survives
+    restarts: existing files are re-indexed (oldest modification first)
+    when the cache is created. Misses are filled by a `fetch` callable that
+    writes the content to a given path, either a blocking function (run
+    through `run`) or a coroutine function; concurrent misses for one key
+    share a single fill.
+
+    The index is only touched from the event loop, and `open` hands out
+    an open file, so an entry evicted while it is being served stays
+    readable until the response is finished.
+    """
+
+    def __init__(self, name: str, directory: str, max_bytes: int, run: Callable):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._run = run
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._fills: Dict[str, asyncio.Future] = {}
+        self.size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.'):
+                # Leftover partial download
+                os.unlink(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.size += size
+        self._evict()
+        logger.info(f"Disk cache {self.name}: {len(self._entries)} files, {self.size} bytes in {self.directory}")
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Open a cached file for reading and mark it recently used; None on a miss"""
+        digest = self._digest(key)
+        if digest not in self._entries:
+            return None
+        try:
+            file = open(self._path(digest), 'rb')
+        except FileNotFoundError:
+            self._drop(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return file
+
+    async def get_or_fill(self, key: str, fetch: Callable[[str], Union[None, Awaitable[None]]]) -> BinaryIO:
+        """Open a cached file, filling it with `fetch(path)` on a miss"""
+        file = self.open(key)
+        if file is not None:
+            track_disk_cache(self.name, 'hit')
+            return file
+
+        digest = self._digest(key)
+        pending = self._fills.get(digest)
+        if pending is not None:
+            track_disk_cache(self.name, 'coalesced')
+            await asyncio.shield(pending)
+        else:
+            track_disk_cache(self.name, 'miss')
+            pending = asyncio.get_running_loop().create_future()
+            self._fills[digest] = pending
+            try:
+                await self._fill(digest, fetch)
+                pending.set_result(None)
+            except BaseException as e:
+                pending.set_exception(e)
+                # Waiters re-raise it; make sure nobody is left with an unretrieved exception
+                pending.exception()
+                raise
+            finally:
+                del self._fills[digest]
+
+        file = self.open(key)
+        if file is None:
+            raise FileNotFoundError(key)
+        return file
+
+    async def _fill(self, digest: str, fetch: Callable[[str], Union[None, Awaitable[None]]]):
+        fd, tmp_path = tempfile.mkstemp(prefix='.fill-', dir=self.directory)
+        os.close(fd)
+        try:
+            if asyncio.iscoroutinefunction(fetch):
+                await fetch(tmp_path)
+            else:
+                await self._run(fetch, tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(digest))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self.size += size - self._entries.pop(digest, 0)
+        self._entries[digest] = size
+        self._evict(keep=digest)
+
+    def _drop(self, digest: str):
+        self.size -= self._entries.pop(digest, 0)
+        try:
+            os.unlink(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: Optional[str] = None):
+        while self.size > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+        track_disk_cache_size(self.name, self.size, len(self._entries))
+
+    def invalidate(self, key: str):
+        """Remove a cached file (the object was deleted)"""
+        digest = self._digest(key)
+        if digest in self._entries:
+            self._drop(digest)
+            track_disk_cache_size(self.name, self.size, len(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from app.metrics import track_health_probe
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """
+    Refreshes a dependency's health on an interval in the background
+
+    `/health` answers from the last result instead of calling S3 itself,
+    so probes cost nothing and a slow S3 cannot make them time out. A
+    probe that takes longer than `timeout` counts as unhealthy.
+    """
+
+    def __init__(self, check: Callable[[], Awaitable[bool]], interval: float = 10.0, timeout: float = 3.0):
+        self._check = check
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy = False
+        self.checked_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe(self) -> bool:
+        """Run one check now and store its result"""
+        start = time.perf_counter()
+        try:
+            healthy = await asyncio.wait_for(self._check(), self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Health probe timed out after {self.timeout}s")
+            healthy = False
+        except Exception as e:
+            logger.error(f"Health probe failed: {e}")
+            healthy = False
+
+        if healthy != self.healthy:
+            logger.info(f"Health changed: {'healthy' if healthy else 'unhealthy'}")
+        self.healthy = healthy
+        self.checked_at = datetime.utcnow()
+        track_health_probe(healthy, time.perf_counter() - start)
+        return healthy
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.probe()
+
+    async def start(self) -> bool:
+        """Probe once, then keep probing in the background; returns the first result"""
+        healthy = await self.probe()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        return healthy
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
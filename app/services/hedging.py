@@ -0,0 +1,111 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from app.metrics import track_hedge, track_hedge_delay
+
+T = TypeVar('T')
+
+
+class Hedger:
+    """
+    Hedged requests for one idempotent operation
+
+    If a call has not finished after the recent `quantile` latency of the
+    operation, the same call is sent again and whichever answers first
+    wins; a slow object or a slow connection then costs about one p95
+    instead of a full tail. Hedges are limited to `max_ratio` of calls,
+    so an overloaded backend is never sent much extra work.
+
+    Latencies come from every completed call, losers included, over the
+    last `window` calls. Until `min_samples` are seen nothing is hedged.
+    """
+
+    def __init__(
+        self,
+        operation: str,
+        quantile: float = 0.95,
+        min_delay: float = 0.005,
+        max_ratio: float = 0.1,
+        window: int = 1000,
+        min_samples: int = 50
+    ):
+        self.operation = operation
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self._delay: Optional[float] = None
+        self._since_update = 0
+        self._calls = 0
+        self._hedges = 0
+
+    def _record(self, duration: float):
+        self._latencies.append(duration)
+        self._since_update += 1
+        # Re-sorting the window on every call would cost more than it saves
+        if self._since_update >= 20 and len(self._latencies) >= self.min_samples:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)
+            self._delay = max(self.min_delay, ordered[index])
+            self._since_update = 0
+            track_hedge_delay(self.operation, self._delay)
+
+    @property
+    def delay(self) -> Optional[float]:
+        """Current hedge delay in seconds, None while there are too few samples"""
+        return self._delay
+
+    def _may_hedge(self) -> bool:
+        return self._hedges < self.max_ratio * self._calls
+
+    async def _timed(self, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await call()
+        self._record(time.perf_counter() - start)
+        return result
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Await `call()`, starting a second `call()` if the first is slower than the hedge delay"""
+        self._calls += 1
+        if self._calls >= 10_000:
+            # Let the budget follow recent traffic
+            self._calls //= 2
+            self._hedges //= 2
+
+        primary = asyncio.ensure_future(self._timed(call))
+        delay = self._delay
+        if delay is None or not self._may_hedge():
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self._hedges += 1
+        hedge = asyncio.ensure_future(self._timed(call))
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        track_hedge(self.operation, 'won' if task is hedge else 'lost')
+                        return task.result()
+                    if first_error is None or task is primary:
+                        first_error = task.exception()
+            track_hedge(self.operation, 'failed')
+            raise first_error
+        finally:
+            # The blocking call keeps running on its thread; only stop waiting for it
+            for task in pending:
+                task.add_done_callback(_consume)
+
+
+def _consume(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+
+from app.metrics import track_inventory, track_inventory_reconcile
+
+logger = logging.getLogger(__name__)
+
+
+class StorageInventory:
+    """
+    Running totals of stored images and bytes, exported as gauges
+
+    Upload and delete paths apply each image's sizes (from its metadata
+    record) as they happen; `reconcile` replaces the totals with a fresh
+    count from the metadata index, which corrects drift from writes made
+    by other replicas. Nothing here lists the bucket.
+
+    Deduplicated uploads share their objects, so the bytes of one
+    `content_hash` are counted once, while any image references them.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.bytes = {'original': 0, 'thumbnail': 0, 'rendition': 0}
+        self._blob_refs: Dict[str, int] = {}
+
+    @staticmethod
+    def _sizes(metadata: Dict) -> Dict[str, int]:
+        # Records written before thumbnail sizes were recorded count as 0
+        return {
+            'original': metadata.get('size') or 0,
+            'thumbnail': metadata.get('thumbnail_size') or 0,
+            'rendition': sum(rendition.get('size') or 0 for rendition in metadata.get('renditions', [])),
+        }
+
+    def _apply(self, metadata: Dict, sign: int):
+        self.images += sign
+        digest = metadata.get('content_hash')
+        if digest:
+            refs = self._blob_refs.get(digest, 0) + sign
+            if refs > 0:
+                self._blob_refs[digest] = refs
+            else:
+                self._blob_refs.pop(digest, None)
+            if refs > 1 or (sign < 0 and refs > 0):
+                return
+        for kind, size in self._sizes(metadata).items():
+            self.bytes[kind] += sign * size
+
+    def add(self, metadata: Dict):
+        """Count a newly stored image"""
+        self._apply(metadata, 1)
+        self.publish()
+
+    def remove(self, metadata: Dict):
+        """Stop counting a deleted image"""
+        self._apply(metadata, -1)
+        self.publish()
+
+    def update(self, rewrites: Iterable[Tuple[Dict, Dict]]):
+        """
+        Count the new sizes of rewritten images, given (previous, current) records
+
+        Images sharing a `content_hash` share their derivatives too, so the
+        size change of one blob is applied once, however many of its images
+        were rewritten.
+        """
+        seen = set()
+        for previous, metadata in rewrites:
+            digest = metadata.get('content_hash')
+            if digest:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            before, after = self._sizes(previous), self._sizes(metadata)
+            for kind in self.bytes:
+                self.bytes[kind] += after[kind] - before[kind]
+        self.publish()
+
+    def reconcile(self, records: Iterable[Dict]):
+        """Replace the running totals with a full count of `records`"""
+        before = self.images
+        self.images = 0
+        self.bytes = dict.fromkeys(self.bytes, 0)
+        self._blob_refs = {}
+        for metadata in records:
+            self._apply(metadata, 1)
+        track_inventory_reconcile(self.images - before)
+        self.publish()
+
+    def publish(self):
+        track_inventory(self.images, self.bytes)
+
+
+async def reconcile_periodically(reconcile: Callable[[], Awaitable[bool]], interval: float):
+    """Run `reconcile` every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reconcile()
+        except Exception as e:
+            logger.error(f"Inventory reconcile failed: {e}")
@@ -0,0 +1,438 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.metrics import track_job, track_job_queue_depth
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict], Awaitable[Optional[Dict]]]
+
+# How often idle workers publish the queue depth and purge old finished jobs
+DEPTH_INTERVAL = 1.0
+PURGE_INTERVAL = 60.0
+
+
+class JobFailed(Exception):
+    """Raised by a job handler for errors that retrying cannot fix"""
+
+
+class MemoryJobBackend:
+    """
+    Jobs held in this process
+
+    Nothing survives a restart and only this process's workers see the
+    jobs, which suits development and single-process deployments.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}
+        # (run_at, sequence, job ID) of every queued job
+        self._ready: List = []
+        self._sequence = itertools.count()
+
+    async def add(self, job: Dict):
+        self._jobs[job["id"]] = dict(job)
+        heapq.heappush(self._ready, (job["run_at"], next(self._sequence), job["id"]))
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def claim(self, now: float, lease: float) -> Optional[Dict]:
+        if not self._ready or self._ready[0][0] > now:
+            return None
+        _, _, job_id = heapq.heappop(self._ready)
+        job = self._jobs[job_id]
+        job.update(status="running", attempts=job["attempts"] + 1, updated_at=now, lease_until=now + lease)
+        return dict(job)
+
+    async def complete(self, job_id: str, result: Optional[Dict], now: float):
+        self._jobs[job_id].update(status="succeeded", result=result, error=None, updated_at=now)
+
+    async def fail(self, job_id: str, error: str, now: float):
+        self._jobs[job_id].update(status="failed", error=error, updated_at=now)
+
+    async def requeue(self, job_id: str, error: Optional[str], run_at: float, now: float, refund: bool = False):
+        job = self._jobs[job_id]
+        job.update(status="queued", error=error, run_at=run_at, updated_at=now)
+        if refund:
+            job["attempts"] -= 1
+        heapq.heappush(self._ready, (run_at, next(self._sequence), job_id))
+
+    async def depth(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0}
+        for job in self._jobs.values():
+            if job["status"] in counts:
+                counts[job["status"]] += 1
+        return counts
+
+    async def purge(self, before: float) -> int:
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in ("succeeded", "failed") and job["updated_at"] < before
+        ]
+        for job_id in finished:
+            del self._jobs[job_id]
+        return len(finished)
+
+    def close(self):
+        pass
+
+
+class SQLiteJobBackend:
+    """
+    Jobs in a SQLite file, shared by every process on the host
+
+    The web app and worker processes (`python -m app.services.jobs
+    worker`) enqueue and claim through the same table. A claim is one
+    IMMEDIATE transaction, so a job goes to exactly one worker; a running
+    job whose lease expired (its worker died) is handed out again.
+
+    sqlite3 is blocking, so every statement runs on one dedicated thread
+    that owns the connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            max_attempts INTEGER NOT NULL,
+            error TEXT,
+            result TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            run_at REAL NOT NULL,
+            lease_until REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            # Readers do not block the writer, and the other processes' claims
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def _execute(self, sql: str, *params) -> int:
+        return self._connect().execute(sql, params).rowcount
+
+    async def add(self, job: Dict):
+        await self._run(
+            self._execute,
+            "INSERT INTO jobs (id, kind, payload, status, attempts, max_attempts, error, result,"
+            " created_at, updated_at, run_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            job["id"], job["kind"], json.dumps(job["payload"]), job["status"], job["attempts"],
+            job["max_attempts"], job["error"], None, job["created_at"], job["updated_at"], job["run_at"]
+        )
+
+    def _get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._run(self._get, job_id)
+
+    def _claim(self, now: float, lease: float) -> Optional[Dict]:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE (status = 'queued' AND run_at <= ?)"
+                " OR (status = 'running' AND lease_until <= ?) ORDER BY run_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?,"
+                " lease_until = ? WHERE id = ?",
+                (now, now + lease, row["id"])
+            )
+            job = self._get(row["id"])
+            connection.execute("COMMIT")
+            return job
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    async def claim(self, now: float, lease: float) -> Optional[Dict]:
+        return await self._run(self._claim, now, lease)
+
+    async def complete(self, job_id: str, result: Optional[Dict], now: float):
+        await self._run(
+            self._execute,
+            "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+            json.dumps(result) if result is not None else None, now, job_id
+        )
+
+    async def fail(self, job_id: str, error: str, now: float):
+        await self._run(
+            self._execute,
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+            error, now, job_id
+        )
+
+    async def requeue(self, job_id: str, error: Optional[str], run_at: float, now: float, refund: bool = False):
+        await self._run(
+            self._execute,
+            "UPDATE jobs SET status = 'queued', error = ?, run_at = ?, updated_at = ?,"
+            " attempts = attempts - ? WHERE id = ?",
+            error, run_at, now, int(refund), job_id
+        )
+
+    def _depth(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+        ).fetchall()
+        return {"queued": 0, "running": 0, **{status: count for status, count in rows}}
+
+    async def depth(self) -> Dict[str, int]:
+        return await self._run(self._depth)
+
+    async def purge(self, before: float) -> int:
+        return await self._run(
+            self._execute,
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            before
+        )
+
+    def close(self):
+        def close_connection():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        self._executor.submit(close_connection)
+        self._executor.shutdown(wait=True)
+
+
+def create_backend(kind: str, path: str):
+    """Job backend for the JOB_BACKEND setting ("memory" or "sqlite")"""
+    if kind == "memory":
+        return MemoryJobBackend()
+    if kind == "sqlite":
+        return SQLiteJobBackend(path)
+    raise ValueError(f"Unknown job backend: {kind}")
+
+
+class JobQueue:
+    """
+    Background jobs with retries, run by asyncio worker tasks
+
+    A job is a kind (naming a registered handler) and a JSON payload.
+    Handlers are coroutines that return a small JSON result. A handler
+    that raises is retried with exponential backoff from `retry_delay`,
+    up to `max_attempts` attempts; JobFailed fails the job at once.
+    Handlers must be idempotent: a job whose worker dies mid-run is
+    claimed again once its `lease` expires.
+
+    Idle workers poll the backend every `poll_interval` seconds (jobs
+    enqueued in this process wake them at once). Finished jobs are kept
+    for `retention` seconds so their status can be looked up.
+    """
+
+    def __init__(
+        self,
+        backend,
+        max_attempts: int = 5,
+        retry_delay: float = 2.0,
+        lease: float = 300.0,
+        poll_interval: float = 1.0,
+        retention: float = 86400.0
+    ):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._depth_published = 0.0
+        self._purged = 0.0
+
+    def register(self, kind: str, handler: JobHandler):
+        """Run `handler(payload)` for jobs of this kind"""
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: Dict, job_id: Optional[str] = None) -> Dict:
+        """Queue a job to run as soon as a worker is free; returns the job record"""
+        now = time.time()
+        job = {
+            "id": job_id or uuid.uuid4().hex,
+            "kind": kind,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "error": None,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+            "run_at": now
+        }
+        await self.backend.add(job)
+        self._wakeup.set()
+        await self._publish_depth(now)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Job record by ID, or None if it is unknown (or purged)"""
+        return await self.backend.get(job_id)
+
+    def start(self, workers: int):
+        """Start `workers` worker tasks on the running event loop"""
+        for _ in range(workers):
+            self._workers.append(asyncio.create_task(self._work()))
+        logger.info(f"Started {workers} job workers")
+
+    async def stop(self):
+        """Stop the workers; jobs they were running go back to the queue without using up an attempt"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            try:
+                # Cleared before claiming, so an enqueue after the claim still wakes us
+                self._wakeup.clear()
+                job = await self.backend.claim(time.time(), self.lease)
+                if job is not None:
+                    await self._execute(job)
+                    continue
+                await self._housekeeping()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: Dict):
+        kind = job["kind"]
+        start = time.time()
+        wait = max(0.0, start - job["run_at"])
+        handler = self._handlers.get(kind)
+        if handler is None:
+            await self.backend.fail(job["id"], f"No handler for job kind {kind}", start)
+            track_job(kind, "failed", 0.0, wait)
+            return
+        if job["attempts"] > job["max_attempts"]:
+            # Only a lease expiry gets here: the job keeps killing its worker
+            await self.backend.fail(job["id"], job["error"] or "Worker lost", start)
+            track_job(kind, "failed", 0.0, wait)
+            return
+
+        try:
+            result = await handler(job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down; let another worker (or the next start) run it, without using up an attempt
+            await self.backend.requeue(job["id"], job["error"], time.time(), time.time(), refund=True)
+            raise
+        except JobFailed as e:
+            outcome = "failed"
+            await self.backend.fail(job["id"], str(e), time.time())
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= job["max_attempts"]:
+                outcome = "failed"
+                await self.backend.fail(job["id"], error, time.time())
+            else:
+                outcome = "retried"
+                delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+                await self.backend.requeue(job["id"], error, time.time() + delay, time.time())
+            logger.warning(f"Job {job['id']} ({kind}) attempt {job['attempts']} failed: {error}")
+        else:
+            outcome = "succeeded"
+            await self.backend.complete(job["id"], result, time.time())
+
+        track_job(kind, outcome, time.time() - start, wait)
+        await self._housekeeping()
+
+    async def _publish_depth(self, now: float):
+        if now - self._depth_published >= DEPTH_INTERVAL:
+            self._depth_published = now
+            track_job_queue_depth(await self.backend.depth())
+
+    async def _housekeeping(self):
+        now = time.time()
+        await self._publish_depth(now)
+        if now - self._purged >= PURGE_INTERVAL:
+            self._purged = now
+            purged = await self.backend.purge(now - self.retention)
+            if purged:
+                logger.info(f"Purged {purged} finished jobs")
+
+    async def run(self, workers: int):
+        """Run `workers` workers until cancelled (the worker process entry point)"""
+        self.start(workers)
+        try:
+            await asyncio.gather(*self._workers)
+        finally:
+            await self.stop()
+
+    def close(self):
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python -m app.services.jobs worker
+    import signal
+    import sys
+    from app.config import settings
+    from app.services.s3_service import s3_service
+
+    if sys.argv[1:] != ["worker"]:
+        print("usage: python -m app.services.jobs worker")
+        sys.exit(2)
+    if settings.job_backend == "memory":
+        print("The memory job backend is per process; set JOB_BACKEND=sqlite to run separate workers")
+        sys.exit(2)
+
+    async def work():
+        # On SIGTERM, hand running jobs back to the queue before exiting
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        await s3_service.jobs.run(max(1, settings.job_workers))
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(work())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        s3_service.close()
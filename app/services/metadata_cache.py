@@ -0,0 +1,59 @@
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class MetadataCache:
+    """
+    Bounded LRU of parsed image metadata and the S3 ETag it was read at
+
+    Entries younger than `max_age` seconds are trusted as-is; older ones
+    are revalidated by the caller with a conditional GET (`IfNoneMatch`),
+    which costs a 304 instead of a download and a JSON parse. Records are
+    copied in and out so callers can mutate what they get back.
+    """
+
+    def __init__(self, max_size: int = 10_000, max_age: float = 5.0):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, Tuple[str, Dict, float]]" = OrderedDict()
+
+    def get(self, image_id: str) -> Optional[Tuple[str, Dict, bool]]:
+        """Return (etag, metadata, fresh) or None if not cached"""
+        entry = self._entries.get(image_id)
+        if entry is None:
+            return None
+        self._entries.move_to_end(image_id)
+        etag, metadata, stored_at = entry
+        fresh = time.monotonic() - stored_at < self.max_age
+        return etag, copy.deepcopy(metadata), fresh
+
+    def etag(self, image_id: str) -> Optional[str]:
+        """The S3 ETag a cached record was read at, without copying the record"""
+        entry = self._entries.get(image_id)
+        return entry[0] if entry is not None else None
+
+    def put(self, image_id: str, etag: str, metadata: Dict):
+        """Store a record read or written at `etag`"""
+        self._entries[image_id] = (etag, copy.deepcopy(metadata), time.monotonic())
+        self._entries.move_to_end(image_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def touch(self, image_id: str):
+        """Mark a record as just revalidated"""
+        entry = self._entries.get(image_id)
+        if entry is not None:
+            self._entries[image_id] = (entry[0], entry[1], time.monotonic())
+
+    def contains_fresh(self, image_id: str) -> bool:
+        """True if the record is cached and young enough to trust without S3"""
+        entry = self._entries.get(image_id)
+        return entry is not None and time.monotonic() - entry[2] < self.max_age
+
+    def invalidate(self, image_id: str):
+        self._entries.pop(image_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,582 @@
+import asyncio
+import bisect
+import json
+import logging
+import random
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from app.services.conditional import is_precondition_failed
+from app.services.thumbnails import RENDITION_CONTENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Image ID -> compact entry, or None to remove the image
+Changes = Dict[str, Optional[Dict]]
+
+# Record fields only the image's own operations need
+UNINDEXED_FIELDS = ("id", "variant_keys")
+
+
+def _rendition_base(image_key: str, image_id: str) -> str:
+    # Renditions are stored under the ID their original was uploaded as
+    return image_key[len("images/"):] if image_key.startswith("images/") else image_id
+
+
+def compact_entry(metadata: Dict) -> Dict:
+    """
+    Shrink a metadata record to its index entry
+
+    The ID becomes the entry's key, and keys and values that follow from
+    the ID (object keys, file name, rendition content types) or from the
+    defaults (ready status, empty fields) are dropped. `expand_entry`
+    restores them. UNINDEXED_FIELDS are left out altogether.
+    """
+    image_id = metadata["id"]
+    entry = {
+        field: value for field, value in metadata.items()
+        if field not in UNINDEXED_FIELDS and value is not None and value != []
+    }
+    if entry.get("image_key") == f"images/{image_id}":
+        del entry["image_key"]
+    if entry.get("thumbnail_key") == f"thumbnails/{image_id}":
+        del entry["thumbnail_key"]
+    if entry.get("filename") == image_id.partition("_")[2]:
+        del entry["filename"]
+    if entry.get("status") == "ready":
+        del entry["status"]
+
+    if "renditions" in entry:
+        base = _rendition_base(metadata.get("image_key", ""), image_id)
+        entry["renditions"] = [
+            [r["width"], r["height"], r["format"], r.get("size")]
+            if r.get("key") == f"renditions/{base}/{r['width']}.{r['format']}"
+            and r.get("content_type") == RENDITION_CONTENT_TYPES.get(r["format"])
+            and set(r) <= {"key", "width", "height", "format", "content_type", "size"}
+            else r
+            for r in entry["renditions"]
+        ]
+    return entry
+
+
+def expand_entry(image_id: str, entry: Dict) -> Dict:
+    """Rebuild the metadata record an index entry was made from (see `compact_entry`)"""
+    metadata = {"id": image_id, "description": None, "tags": [], **entry}
+    metadata.setdefault("filename", image_id.partition("_")[2])
+    metadata.setdefault("image_key", f"images/{image_id}")
+    metadata.setdefault("thumbnail_key", f"thumbnails/{image_id}")
+    metadata.setdefault("status", "ready")
+    metadata["tags"] = list(metadata["tags"])
+
+    if "renditions" in entry:
+        base = _rendition_base(metadata["image_key"], image_id)
+        renditions = []
+        for rendition in entry["renditions"]:
+            if isinstance(rendition, list):
+                width, height, fmt, size = rendition
+                rendition = {
+                    "key": f"renditions/{base}/{width}.{fmt}",
+                    "width": width,
+                    "height": height,
+                    "format": fmt,
+                    "content_type": RENDITION_CONTENT_TYPES[fmt]
+                }
+                if size is not None:
+                    rendition["size"] = size
+            renditions.append(dict(rendition))
+        metadata["renditions"] = renditions
+    return metadata
+
+
+class MetadataIndex:
+    """
+    Time-ordered, range-partitioned index of image metadata
+
+    Image IDs start with the upload timestamp, so the index is a list of
+    partitions, each holding the compact entries (`compact_entry`) of one
+    contiguous ID range. The manifest (`index/manifest.json`) lists the
+    partitions by their lowest ID; a page of the newest-first listing
+    reads the manifest and only the partition(s) the page falls in.
+    Objects are cached with their ETag and revalidated with conditional
+    GETs, so an unchanged partition costs a 304, not a download.
+
+    Writes are read-modify-writes guarded by the partition's ETag
+    (`IfMatch`) and retried on conflict, so writers on other pods cannot
+    lose each other's updates. Concurrent writes in this process to the
+    same partition are applied together in one write. A partition that
+    grows past `partition_size` splits: the upper IDs move to a new
+    partition, the old one keeps a pointer to it (written in the same
+    conditional write), and the new partition is then linked into the
+    manifest. Readers follow pointers the manifest is missing and link
+    them, which repairs a split interrupted before the manifest update.
+
+    The per-image `metadata/{id}.json` objects stay the source of truth.
+    A missing or outdated manifest is rebuilt from them on first use;
+    `rebuild()` does the same on demand.
+
+    The S3 client is blocking; `run` is the owner's coroutine that executes
+    a blocking callable off the event loop.
+    """
+
+    MANIFEST_VERSION = 2
+    MAX_ATTEMPTS = 8
+
+    def __init__(
+        self,
+        s3_client,
+        bucket_name: str,
+        run: Callable[..., Awaitable[Any]],
+        partition_size: int = 1000,
+        prefix: str = "index/",
+        cache_size: int = 256
+    ):
+        self.s3_client = s3_client
+        self._run = run
+        self.bucket_name = bucket_name
+        self.partition_size = partition_size
+        self.prefix = prefix
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[str, List[Tuple[Changes, asyncio.Future]]] = {}
+        self._build_lock = asyncio.Lock()
+
+    @property
+    def manifest_key(self) -> str:
+        return f"{self.prefix}manifest.json"
+
+    def _new_partition_key(self) -> str:
+        return f"{self.prefix}part-{uuid.uuid4().hex}.json"
+
+    # S3 objects
+
+    def _get_sync(self, key: str, etag: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+        """GET a JSON object, conditionally when an ETag is known; (etag, None) means unchanged"""
+        kwargs = {"IfNoneMatch": etag} if etag else {}
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, **kwargs)
+        except ClientError as e:
+            if etag and e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304:
+                return etag, None
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        return obj["ETag"], json.loads(obj["Body"].read())
+
+    def _put_sync(self, key: str, data: Dict, condition: Dict[str, str]) -> str:
+        response = self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=json.dumps(data, separators=(",", ":")),
+            ContentType="application/json",
+            **condition
+        )
+        return response["ETag"]
+
+    def _remember(self, key: str, etag: str, data: Dict):
+        self._cache[key] = (etag, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _read(self, key: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """
+        Current (etag, object) of an index object, or (None, None) if it does not exist
+
+        The returned object may be shared with the cache; copy before changing it.
+        """
+        cached = self._cache.get(key)
+        etag, data = await self._run(self._get_sync, key, cached[0] if cached else None)
+        if etag is None:
+            self._cache.pop(key, None)
+            return None, None
+        if data is None:
+            self._cache.move_to_end(key)
+            return cached
+        self._remember(key, etag, data)
+        return etag, data
+
+    async def _write(self, key: str, data: Dict, etag: Optional[str]) -> str:
+        """
+        Write an index object only if it is still at `etag` (or still absent when `etag` is None)
+
+        Raises ClientError when another writer got there first (see `is_precondition_failed`).
+        """
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        new_etag = await self._run(self._put_sync, key, data, condition)
+        self._remember(key, new_etag, data)
+        return new_etag
+
+    async def _delete(self, keys: List[str]):
+        for key in keys:
+            self._cache.pop(key, None)
+        for start in range(0, len(keys), 1000):
+            await self._run(
+                self.s3_client.delete_objects,
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True}
+            )
+
+    @staticmethod
+    async def _backoff(attempt: int):
+        await asyncio.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    # Manifest
+
+    async def _manifest(self) -> Dict:
+        """The current manifest, built from metadata/ first if it is missing or outdated"""
+        etag, manifest = await self._read(self.manifest_key)
+        if manifest and manifest.get("version") == self.MANIFEST_VERSION:
+            return manifest
+
+        async with self._build_lock:
+            etag, manifest = await self._read(self.manifest_key)
+            if manifest and manifest.get("version") == self.MANIFEST_VERSION:
+                return manifest
+            logger.warning("Metadata index missing or outdated, rebuilding it from metadata/")
+            await self._build(etag)
+        _, manifest = await self._read(self.manifest_key)
+        return manifest
+
+    @staticmethod
+    def _starts(manifest: Dict) -> List[str]:
+        return [partition["start"] for partition in manifest["partitions"]]
+
+    def _locate(self, manifest: Dict, image_id: str) -> int:
+        """Position in the manifest of the partition whose range holds `image_id`"""
+        return max(bisect.bisect_right(self._starts(manifest), image_id) - 1, 0)
+
+    async def _link(self, start: str, key: str):
+        """Add a split-off partition to the manifest (a no-op if it is already there)"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            etag, manifest = await self._read(self.manifest_key)
+            if manifest is None or any(p["key"] == key for p in manifest["partitions"]):
+                return
+            partitions = list(manifest["partitions"])
+            position = bisect.bisect_right(self._starts(manifest), start)
+            partitions.insert(position, {"start": start, "key": key})
+            try:
+                await self._write(self.manifest_key, dict(manifest, partitions=partitions), etag)
+                return
+            except ClientError as e:
+                if not is_precondition_failed(e):
+                    raise
+            await self._backoff(attempt)
+        logger.error(f"Could not link index partition {key}; readers still follow its pointer")
+
+    # Reads
+
+    async def _entries(self, manifest: Dict, position: int) -> Dict[str, Dict]:
+        """Entries of one manifest partition's ID range, following pointers the manifest lacks"""
+        partitions = manifest["partitions"]
+        start = partitions[position]["start"]
+        end = partitions[position + 1]["start"] if position + 1 < len(partitions) else None
+        linked = {partition["key"] for partition in partitions}
+
+        entries: Dict[str, Dict] = {}
+        pending = [partitions[position]["key"]]
+        while pending:
+            key = pending.pop()
+            _, partition = await self._read(key)
+            if partition is None:
+                continue
+            entries.update(partition["images"])
+            for moved in partition.get("moved", []):
+                if moved["key"] not in linked and start <= moved["start"] and (end is None or moved["start"] < end):
+                    linked.add(moved["key"])
+                    pending.append(moved["key"])
+                    await self._link(moved["start"], moved["key"])
+
+        return {
+            image_id: entry for image_id, entry in entries.items()
+            if start <= image_id and (end is None or image_id < end)
+        }
+
+    async def page(self, limit: int, before: Optional[str] = None) -> List[Dict]:
+        """
+        Up to `limit` + 1 records, newest first, with IDs below `before`
+
+        Reads partitions from the one holding `before` (or the newest)
+        backwards until the page is full; the extra record tells the
+        caller whether another page follows.
+        """
+        manifest = await self._manifest()
+        position = self._locate(manifest, before) if before is not None else len(manifest["partitions"]) - 1
+
+        records: List[Dict] = []
+        while position >= 0 and len(records) <= limit:
+            entries = await self._entries(manifest, position)
+            image_ids = sorted(
+                (image_id for image_id in entries if before is None or image_id < before),
+                reverse=True
+            )
+            for image_id in image_ids[:limit + 1 - len(records)]:
+                records.append(expand_entry(image_id, entries[image_id]))
+            position -= 1
+        return records
+
+    async def load_all(self) -> List[Dict]:
+        """Load every indexed record (unchanged partitions are revalidated, not downloaded)"""
+        manifest = await self._manifest()
+        partitions = await asyncio.gather(*(
+            self._entries(manifest, position) for position in range(len(manifest["partitions"]))
+        ))
+        return [
+            expand_entry(image_id, entry)
+            for entries in partitions
+            for image_id, entry in entries.items()
+        ]
+
+    # Writes
+
+    async def upsert(self, metadata: Dict):
+        """Add or replace an image record"""
+        await self.upsert_many([metadata])
+
+    async def remove(self, image_id: str):
+        """Drop an image record"""
+        await self.remove_many([image_id])
+
+    async def upsert_many(self, records: List[Dict]):
+        """Add or replace many records with one conditional write per touched partition"""
+        await self._apply({metadata["id"]: compact_entry(metadata) for metadata in records})
+
+    async def remove_many(self, image_ids: List[str]):
+        """Drop many records with one conditional write per touched partition"""
+        await self._apply(dict.fromkeys(image_ids))
+
+    async def _apply(self, changes: Changes):
+        """Route changes to their partitions by the manifest, and again if a partition went away"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            manifest = await self._manifest()
+            groups: Dict[str, Changes] = {}
+            for image_id, entry in changes.items():
+                key = manifest["partitions"][self._locate(manifest, image_id)]["key"]
+                groups.setdefault(key, {})[image_id] = entry
+
+            results = await asyncio.gather(*(
+                self._commit(key, group) for key, group in groups.items()
+            ))
+            changes = {image_id: entry for rerouted in results for image_id, entry in rerouted.items()}
+            if not changes:
+                return
+        raise RuntimeError(f"Could not route {len(changes)} index changes; run an index rebuild")
+
+    async def _commit(self, key: str, changes: Changes) -> Changes:
+        """
+        Apply changes to one partition, batched with concurrent callers in this process
+
+        Returns the changes that must be routed again (the partition was
+        replaced by a rebuild).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append((changes, future))
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            if not future.done():
+                batch = self._pending.pop(key, [])
+                merged: Changes = {}
+                for batch_changes, _ in batch:
+                    merged.update(batch_changes)
+                try:
+                    leftover = await self._update_partition(key, merged)
+                except Exception as e:
+                    for _, waiter in batch:
+                        waiter.set_exception(e)
+                except BaseException:
+                    # Cancelled: the other callers are still queued on the lock and write their own changes
+                    others = [item for item in batch if item[1] is not future]
+                    self._pending[key] = others + self._pending.get(key, [])
+                    raise
+                else:
+                    for batch_changes, waiter in batch:
+                        waiter.set_result({
+                            image_id: entry for image_id, entry in batch_changes.items()
+                            if image_id in leftover
+                        })
+        return await future
+
+    async def _update_partition(self, key: str, changes: Changes) -> Changes:
+        """Conditionally read-modify-write one partition, following and splitting as needed"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            etag, partition = await self._read(key)
+            if partition is None:
+                return changes
+
+            # IDs that a split moved on belong to the partition it points to
+            moved = partition.get("moved", [])
+            starts = [pointer["start"] for pointer in moved]
+            forwarded: Dict[str, Changes] = {}
+            images = dict(partition["images"])
+            changed = False
+            for image_id, entry in changes.items():
+                pointer = bisect.bisect_right(starts, image_id) - 1
+                if pointer >= 0:
+                    forwarded.setdefault(moved[pointer]["key"], {})[image_id] = entry
+                elif entry is None:
+                    changed |= images.pop(image_id, None) is not None
+                elif images.get(image_id) != entry:
+                    images[image_id] = entry
+                    changed = True
+
+            if changed:
+                updated = dict(partition, images=images)
+                split = None
+                if len(images) > self.partition_size:
+                    updated, split = await self._split(updated)
+                try:
+                    await self._write(key, updated, etag)
+                except ClientError as e:
+                    if split:
+                        await self._delete([split[1]])
+                    if not is_precondition_failed(e):
+                        raise
+                    await self._backoff(attempt)
+                    continue
+                if split:
+                    await self._link(*split)
+
+            leftover: Changes = {}
+            for moved_key, moved_changes in forwarded.items():
+                leftover.update(await self._commit(moved_key, moved_changes))
+            return leftover
+        raise RuntimeError(f"Index partition {key} kept changing; gave up after {self.MAX_ATTEMPTS} attempts")
+
+    async def _split(self, partition: Dict) -> Tuple[Dict, Tuple[str, str]]:
+        """
+        Move the upper part of an oversized partition to a new object
+
+        Uploads append at the newest end, so the lower part keeps a full
+        partition's worth of entries rather than half. Returns the lower
+        part (with a pointer to the new object) to be written in place of
+        the original, and the new partition's (start, key).
+        """
+        image_ids = sorted(partition["images"])
+        keep = self.partition_size if len(image_ids) <= self.partition_size * 2 else len(image_ids) // 2
+        start = image_ids[keep]
+        key = self._new_partition_key()
+
+        upper = {
+            "start": start,
+            "images": {image_id: partition["images"][image_id] for image_id in image_ids[keep:]}
+        }
+        await self._write(key, upper, None)
+
+        lower = dict(
+            partition,
+            images={image_id: partition["images"][image_id] for image_id in image_ids[:keep]},
+            moved=sorted(partition.get("moved", []) + [{"start": start, "key": key}], key=lambda p: p["start"])
+        )
+        return lower, (start, key)
+
+    # Rebuild
+
+    async def _scan(self) -> Dict[str, Dict]:
+        """Compact entries of every metadata object, read page by page"""
+        entries: Dict[str, Dict] = {}
+        kwargs = {"Bucket": self.bucket_name, "Prefix": "metadata/"}
+        while True:
+            page = await self._run(self.s3_client.list_objects_v2, **kwargs)
+            keys = [obj["Key"] for obj in page.get("Contents", [])]
+
+            # Fetch each listing page's metadata concurrently
+            for key, (_, metadata) in zip(keys, await asyncio.gather(*(
+                self._run(self._get_sync, key, None) for key in keys
+            ))):
+                if not metadata or "id" not in metadata:
+                    logger.warning(f"Skipping unreadable metadata: {key}")
+                    continue
+                entries[metadata["id"]] = compact_entry(metadata)
+
+            if not page.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+        return entries
+
+    async def _build(self, etag: Optional[str]) -> int:
+        """
+        Write fresh partitions from metadata/ and swap them in with one conditional manifest write
+
+        If another writer replaced the manifest first, its index is kept
+        and the partitions written here are deleted. Otherwise everything
+        else under the prefix that is older than this build is deleted:
+        the replaced index, and partitions an interrupted split or build
+        left unlinked.
+        """
+        entries = await self._scan()
+        image_ids = sorted(entries)
+
+        partitions = []
+        for offset in range(0, max(len(image_ids), 1), self.partition_size):
+            chunk = image_ids[offset:offset + self.partition_size]
+            start = chunk[0] if offset else ""
+            key = self._new_partition_key()
+            await self._write(key, {"start": start, "images": {i: entries[i] for i in chunk}}, None)
+            partitions.append({"start": start, "key": key})
+
+        manifest = {
+            "version": self.MANIFEST_VERSION,
+            "partitions": partitions,
+            "count": len(image_ids),
+            "built_at": datetime.utcnow().isoformat()
+        }
+        try:
+            await self._write(self.manifest_key, manifest, etag)
+        except ClientError as e:
+            await self._delete([partition["key"] for partition in partitions])
+            if not is_precondition_failed(e):
+                raise
+            logger.info("Metadata index was rebuilt concurrently, keeping that one")
+            return len(image_ids)
+
+        await self._delete(await self._stale_keys({partition["key"] for partition in partitions}))
+        logger.info(f"Rebuilt metadata index: {len(image_ids)} images in {len(partitions)} partitions")
+        return len(image_ids)
+
+    async def _stale_keys(self, current: set) -> List[str]:
+        """
+        Index objects a finished build no longer uses, given the keys of its partitions
+
+        Only objects older than the build's own partitions (by S3's clock)
+        count, so the partitions of a build that started later survive.
+        """
+        objects = []
+        kwargs = {"Bucket": self.bucket_name, "Prefix": self.prefix}
+        while True:
+            page = await self._run(self.s3_client.list_objects_v2, **kwargs)
+            objects.extend(page.get("Contents", []))
+            if not page.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+        built = [obj["LastModified"] for obj in objects if obj["Key"] in current]
+        if not built:
+            return []
+        cutoff = min(built)
+        return [
+            obj["Key"] for obj in objects
+            if obj["Key"] not in current and obj["Key"] != self.manifest_key and obj["LastModified"] < cutoff
+        ]
+
+    async def rebuild(self) -> int:
+        """Rescan metadata/ and replace the whole index; returns the number of images indexed"""
+        async with self._build_lock:
+            etag, _ = await self._read(self.manifest_key)
+            return await self._build(etag)
+
+
+if __name__ == "__main__":
+    # Rebuild/repair the index: python -m app.services.metadata_index rebuild
+    import sys
+    from app.services.s3_service import s3_service
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python -m app.services.metadata_index rebuild")
+        sys.exit(2)
+
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(s3_service.metadata_index.rebuild())
+    print(f"Indexed {total} images")
@@ -0,0 +1,53 @@
+from typing import Optional, Sequence
+
+RENDER_FITS = ('contain', 'cover')
+
+
+class RenderSpec:
+    """
+    Validated parameters of an on-demand render
+
+    Only whitelisted sizes, qualities and formats are accepted, so the
+    number of distinct variants per image (and the work and storage a
+    client can cause) stays bounded.
+    """
+
+    def __init__(self, width: int, height: int, fit: str, fmt: str, quality: int):
+        self.width = width
+        self.height = height
+        self.fit = fit
+        self.format = fmt
+        self.quality = quality
+
+    @classmethod
+    def parse(
+        cls,
+        width: Optional[int],
+        height: Optional[int],
+        fit: str,
+        fmt: str,
+        quality: int,
+        sizes: Sequence[int],
+        qualities: Sequence[int],
+        formats: Sequence[str]
+    ) -> 'RenderSpec':
+        """Build a spec from query parameters, raising ValueError for anything outside the whitelist"""
+        if not width and not height:
+            raise ValueError("At least one of w and h is required")
+        for name, value in (('w', width), ('h', height)):
+            if value and value not in sizes:
+                raise ValueError(f"{name} must be one of {list(sizes)}")
+        if fit not in RENDER_FITS:
+            raise ValueError(f"fit must be one of {list(RENDER_FITS)}")
+        if fmt not in formats:
+            raise ValueError(f"fmt must be one of {list(formats)}")
+        if quality not in qualities:
+            raise ValueError(f"q must be one of {list(qualities)}")
+        # A single dimension has nothing to crop, so both fits render the same image
+        if not (width and height):
+            fit = 'contain'
+        return cls(width or 0, height or 0, fit, fmt, quality)
+
+    def key(self, image_id: str) -> str:
+        """S3 key of this variant (w or h of 0 means it follows the aspect ratio)"""
+        return f"variants/{image_id}/{self.width}x{self.height}-{self.fit}-q{self.quality}.{self.format}"
@@ -0,0 +1,101 @@
+import io
+import time
+from typing import Any, Dict
+
+from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+
+from app.metrics import track_s3_call, track_s3_connection_error
+
+# Keys stored in botocore's per-call request context
+_START = 'metrics_start'
+_BYTES_SENT = 'metrics_bytes_sent'
+
+
+def _body_size(body: Any) -> int:
+    """Bytes a request body will send, without consuming it"""
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if hasattr(body, '__len__'):
+        # s3transfer's ReadFileChunk and similar wrappers
+        return len(body)
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        try:
+            position = body.tell()
+            end = body.seek(0, io.SEEK_END)
+            body.seek(position)
+            return end - position
+        except (OSError, ValueError):
+            return 0
+    return 0
+
+
+def _outcome(status: int) -> str:
+    if status == 304:
+        return 'not_modified'
+    if status < 300:
+        return 'success'
+    if status < 500:
+        return 'client_error'
+    return 'server_error'
+
+
+def _retries(context: Dict) -> int:
+    # botocore counts attempts from 1 in context['retries']
+    return max(0, context.get('retries', {}).get('attempt', 1) - 1)
+
+
+def _before_call(params: Dict, context: Dict, **kwargs):
+    context[_START] = time.perf_counter()
+    context[_BYTES_SENT] = _body_size(params.get('body'))
+
+
+def _after_call(http_response, model, context: Dict, **kwargs):
+    start = context.get(_START)
+    if start is None:
+        return
+    received = http_response.headers.get('Content-Length') if http_response is not None else None
+    track_s3_call(
+        operation=model.name,
+        outcome=_outcome(http_response.status_code if http_response is not None else 0),
+        duration=time.perf_counter() - start,
+        retries=_retries(context),
+        bytes_sent=context.get(_BYTES_SENT, 0),
+        bytes_received=int(received) if received and received.isdigit() else 0
+    )
+
+
+def _after_call_error(exception: Exception, context: Dict, event_name: str, **kwargs):
+    start = context.get(_START)
+    if start is None:
+        return
+    connection_error = isinstance(exception, (BotoConnectionError, HTTPClientError))
+    if connection_error:
+        track_s3_connection_error()
+    track_s3_call(
+        operation=event_name.rsplit('.', 1)[-1],
+        outcome='connection_error' if connection_error else 'error',
+        duration=time.perf_counter() - start,
+        retries=_retries(context),
+        bytes_sent=context.get(_BYTES_SENT, 0),
+        bytes_received=0
+    )
+
+
+def instrument_client(client):
+    """
+    Time and label every API call made by a botocore S3 client
+
+    Hooks run on the calling thread, so this covers direct calls as well
+    as the multipart and ranged calls s3transfer makes for upload_file and
+    download_file. Duration includes retries; bytes are the request body
+    and the response Content-Length (streamed bodies are not read here).
+    """
+    events = client.meta.events
+    events.register('before-call.s3', _before_call, unique_id='metrics-before-call')
+    events.register('after-call.s3', _after_call, unique_id='metrics-after-call')
+    events.register('after-call-error.s3', _after_call_error, unique_id='metrics-after-call-error')
+    return client
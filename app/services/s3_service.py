@@ -1,174 +1,1132 @@
+import asyncio
+import base64
+import binascii
 import boto3
+import contextvars
+import copy
 import json
 import logging
-from typing import List, Optional, Dict
-from datetime import datetime
-from botocore.exceptions import ClientError
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Iterable, List, Optional, Dict, Tuple
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
 from app.config import settings
-from io import BytesIO
-from PIL import Image
+from app.metrics import track_metadata_cache, track_s3_pool_wait
+from app.services.blob_index import BlobIndex
+from app.services.circuit_breaker import CircuitBreaker, S3UnavailableError
+from app.services.conditional import enable_conditional_writes, is_precondition_failed
+from app.services.deadline import DeadlineExceeded, check as check_deadline, enforce_deadlines, remaining
+from app.services.disk_cache import DiskLRUCache
+from app.services.hedging import Hedger
+from app.services.jobs import JobFailed, JobQueue, create_backend as create_job_backend
+from app.services.metadata_cache import MetadataCache
+from app.services.inventory import StorageInventory
+from app.services.metadata_index import MetadataIndex
+from app.services.s3_instrumentation import instrument_client
+from app.services.renders import RenderSpec
+from app.services.search_index import SearchIndex
+from app.services.similarity_index import SimilarityIndex
+from app.services.thumbnails import RENDITION_CONTENT_TYPES, ImageRejectedError, ThumbnailService
+from app.services.uploads import hash_file
+from app.services.url_cache import PresignedUrlCache
 
 logger = logging.getLogger(__name__)
 
+# delete_objects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Error codes that mean S3 is throttling or failing, whatever the status code
+OUTAGE_ERROR_CODES = {'SlowDown', 'ServiceUnavailable', 'InternalError', 'RequestTimeout', 'Throttling'}
+
+# Metadata fields made from the image's pixels (by the upload, or later by a job)
+DERIVATIVE_FIELDS = ('thumbnail_key', 'thumbnail_size', 'renditions', 'phash', 'width', 'height')
+
+# Conditional metadata writes that lose a race are retried this many times in all
+METADATA_WRITE_ATTEMPTS = 5
+
 
 class S3Service:
     """Service for managing images in S3"""
     
     def __init__(self):
         """Initialize S3 client"""
+        # Adaptive mode adds client-side rate limiting on throttling to the standard retries
+        client_config = Config(
+            max_pool_connections=settings.s3_max_pool_connections,
+            connect_timeout=settings.s3_connect_timeout,
+            read_timeout=settings.s3_read_timeout,
+            retries={'mode': settings.s3_retry_mode, 'max_attempts': settings.s3_max_attempts}
+        )
+        
         if settings.use_iam_role:
             # Use IAM role (for EKS/EC2)
-            self.s3_client = boto3.client('s3', region_name=settings.aws_region)
+            self.s3_client = boto3.client(
+                's3',
+                region_name=settings.aws_region,
+                endpoint_url=settings.s3_endpoint_url,
+                config=client_config
+            )
         else:
             # Use access keys (for local development)
             self.s3_client = boto3.client(
                 's3',
                 region_name=settings.aws_region,
                 aws_access_key_id=settings.aws_access_key_id,
-                aws_secret_access_key=settings.aws_secret_access_key
+                aws_secret_access_key=settings.aws_secret_access_key,
+                endpoint_url=settings.s3_endpoint_url,
+                config=client_config
             )
+        instrument_client(self.s3_client)
+        enforce_deadlines(self.s3_client)
+        enable_conditional_writes(self.s3_client)
+        
+        # Originals are streamed from disk, in parts once above the threshold
+        self._transfer_config = TransferConfig(
+            multipart_threshold=settings.s3_multipart_threshold,
+            multipart_chunksize=settings.s3_multipart_chunksize
+        )
+        
+        # boto3 is blocking, so every call runs on a bounded thread pool
+        # instead of the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.s3_max_workers,
+            thread_name_prefix="s3"
+        )
+        
+        # Thumbnails and renditions are CPU bound, so they run on a process pool
+        self.thumbnails = ThumbnailService(
+            workers=settings.thumbnail_workers,
+            max_pixels=settings.max_image_pixels,
+            rendition_widths=settings.rendition_widths,
+            rendition_formats=settings.rendition_formats,
+            rendition_quality=settings.rendition_quality,
+            render_formats=settings.render_formats
+        )
         
         self.bucket_name = settings.s3_bucket_name
+        self.url_cache = PresignedUrlCache(
+            self._presign,
+            ttl=settings.presigned_url_ttl,
+            refresh_margin=settings.presigned_url_refresh_margin,
+            max_size=settings.presigned_url_cache_size
+        )
+        self.metadata_cache = MetadataCache(
+            max_size=settings.metadata_cache_size,
+            max_age=settings.metadata_cache_max_age
+        )
+        self.metadata_index = MetadataIndex(
+            self.s3_client,
+            self.bucket_name,
+            run=self._run,
+            partition_size=settings.metadata_index_partition_size
+        )
+        self.blobs = BlobIndex(self.s3_client, self.bucket_name, run=self._run)
+        # Bumped on every write made through this process; drives list ETags
+        self._instance_id = uuid.uuid4().hex[:8]
+        self.collection_version = 0
+        self.collection_modified = time.time()
+        self.search_index = SearchIndex()
+        self.similarity_index = SimilarityIndex()
+        self.inventory = StorageInventory()
+        # Created on first use, so instances that never proxy or render never touch the disk
+        self._thumbnail_cache: Optional[DiskLRUCache] = None
+        self._variant_cache: Optional[DiskLRUCache] = None
+        self.breaker = CircuitBreaker(
+            "s3",
+            failure_threshold=settings.circuit_breaker_failure_threshold,
+            reset_timeout=settings.circuit_breaker_reset_timeout
+        )
+        self._search_index_lock = asyncio.Lock()
+        # Local search index writes made while a rebuild is loading records
+        self._search_journal: Optional[List[Tuple[Optional[Dict], str]]] = None
+        self._metadata_hedger = Hedger(
+            "GetObject",
+            quantile=settings.s3_hedge_quantile,
+            min_delay=settings.s3_hedge_min_delay,
+            max_ratio=settings.s3_hedge_max_ratio
+        )
+        # Derivatives of deferred uploads are made by job workers
+        self.jobs = JobQueue(
+            create_job_backend(settings.job_backend, settings.job_db_path),
+            max_attempts=settings.job_max_attempts,
+            retry_delay=settings.job_retry_delay,
+            lease=settings.job_lease,
+            poll_interval=settings.job_poll_interval,
+            retention=settings.job_retention
+        )
+        self.jobs.register('derivatives', self._process_derivatives)
+        if settings.defer_derivatives and settings.job_backend == "memory":
+            # Queued jobs would die with the process and leave their images processing
+            raise ValueError("DEFER_DERIVATIVES needs a durable job queue; set JOB_BACKEND=sqlite")
         logger.info(f"S3Service initialized with bucket: {self.bucket_name}")
     
-    async def check_connection(self) -> bool:
-        """Check S3 connection"""
+    async def _execute(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        
+        # A worker holds at most one pooled connection, so with S3_MAX_POOL_CONNECTIONS
+        # >= S3_MAX_WORKERS, queueing for a worker is the connection-pool wait
+        def timed():
+            track_s3_pool_wait(time.perf_counter() - submitted)
+            return func(*args, **kwargs)
+        
+        # The worker runs in the request's context, so botocore hooks see its deadline
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, timed)
+    
+    @staticmethod
+    def _is_outage(error: Exception) -> bool:
+        """Errors that say S3 is unreachable or overloaded, as opposed to a bad request"""
+        if isinstance(error, (BotoConnectionError, HTTPClientError)):
+            return True
+        if isinstance(error, ClientError):
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+            code = error.response.get('Error', {}).get('Code')
+            return status >= 500 or code in OUTAGE_ERROR_CODES
+        return False
+    
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function on the S3 thread pool, behind the circuit breaker
+        
+        Raises S3UnavailableError without calling S3 while the circuit is open,
+        and DeadlineExceeded once the request's deadline (if any) has passed;
+        the blocking call itself then finishes in the background.
+        """
+        operation = getattr(func, '__name__', 'unknown')
+        check_deadline(operation)
+        self.breaker.before_call()
+        try:
+            left = remaining()
+            if left is None:
+                result = await self._execute(func, *args, **kwargs)
+            else:
+                try:
+                    result = await asyncio.wait_for(self._execute(func, *args, **kwargs), timeout=max(left, 0))
+                except DeadlineExceeded:
+                    raise
+                except asyncio.TimeoutError:
+                    check_deadline(operation)
+                    raise
+        except DeadlineExceeded:
+            # Says nothing about S3's health
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if self._is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+    
+    async def _call(self, operation: str, **kwargs) -> Any:
+        """Call an S3 API operation without blocking the event loop"""
+        return await self._run(getattr(self.s3_client, operation), Bucket=self.bucket_name, **kwargs)
+    
+    def _get_json_sync(self, key: str) -> Dict:
+        metadata_obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        return json.loads(metadata_obj['Body'].read())
+    
+    async def _get_json(self, key: str) -> Dict:
+        """Fetch and parse a JSON object; the body is read on the thread pool too"""
+        return await self._run(self._get_json_sync, key)
+    
+    def _get_metadata_sync(self, image_id: str, etag: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+        """GET a metadata object, conditionally when an ETag is known; (etag, None) means unchanged"""
+        kwargs = {'IfNoneMatch': etag} if etag else {}
+        try:
+            metadata_obj = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=f"metadata/{image_id}.json",
+                **kwargs
+            )
+        except ClientError as e:
+            if etag and e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304:
+                return etag, None
+            raise
+        return metadata_obj['ETag'], json.loads(metadata_obj['Body'].read())
+    
+    async def _fetch_metadata(self, image_id: str) -> Optional[Dict]:
+        """Read metadata through the cache, revalidating stale entries by ETag; None if missing"""
+        cached = self.metadata_cache.get(image_id)
+        if cached is not None and cached[2]:
+            track_metadata_cache('hit')
+            return cached[1]
+        
+        def read():
+            return self._run(self._get_metadata_sync, image_id, cached[0] if cached else None)
+        
         try:
-            self.s3_client.head_bucket(Bucket=self.bucket_name)
+            if settings.s3_hedge_reads:
+                etag, metadata = await self._metadata_hedger.run(read)
+            else:
+                etag, metadata = await read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                self.metadata_cache.invalidate(image_id)
+                return None
+            raise
+        
+        if metadata is None:
+            track_metadata_cache('revalidated')
+            self.metadata_cache.touch(image_id)
+            return cached[1]
+        
+        track_metadata_cache('miss')
+        self.metadata_cache.put(image_id, etag, metadata)
+        return metadata
+    
+    async def _put_metadata(self, metadata: Dict, if_match: Optional[str] = None):
+        """Write a metadata object (only if still at `if_match`, when given) and cache it at its new ETag"""
+        response = await self._call(
+            'put_object',
+            Key=f"metadata/{metadata['id']}.json",
+            Body=json.dumps(metadata),
+            ContentType="application/json",
+            **({'IfMatch': if_match} if if_match else {})
+        )
+        self.metadata_cache.put(metadata['id'], response['ETag'], metadata)
+    
+    async def _modify_metadata(
+        self,
+        image_id: str,
+        change: Callable[[Dict], bool],
+        attempts: int = METADATA_WRITE_ATTEMPTS
+    ) -> Optional[Tuple[Dict, Dict]]:
+        """
+        Read, change and write back one metadata object, conditionally on its ETag
+        
+        `change` edits the record in place and returns False to leave it
+        as it is. A write that loses to a concurrent one (a user edit, a
+        finished derivatives job, a recorded variant) is retried on a fresh
+        read, so neither undoes the other. Returns (previous, updated), or
+        None if the image does not exist or nothing was changed; raises the
+        precondition failure once every attempt has lost.
+        """
+        for attempt in range(attempts):
+            metadata = await self._fetch_metadata(image_id)
+            if metadata is None:
+                return None
+            etag = self.metadata_cache.etag(image_id)
+            previous = copy.deepcopy(metadata)
+            if not change(metadata):
+                return None
+            try:
+                await self._put_metadata(metadata, if_match=etag)
+                return previous, metadata
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                    # Deleted since it was read
+                    self.metadata_cache.invalidate(image_id)
+                    return None
+                if not is_precondition_failed(e) or attempt == attempts - 1:
+                    raise
+                self.metadata_cache.invalidate(image_id)
+    
+    async def image_exists(self, image_id: str) -> bool:
+        """Cheap existence check: a fresh cache entry, otherwise a HEAD"""
+        if self.metadata_cache.contains_fresh(image_id):
+            return True
+        try:
+            await self._call('head_object', Key=f"metadata/{image_id}.json")
             return True
         except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                self.metadata_cache.invalidate(image_id)
+                return False
+            raise
+    
+    def close(self):
+        """Release the S3 thread pool, thumbnail workers and job backend"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.thumbnails.close()
+        self.jobs.close()
+    
+    async def check_connection(self) -> bool:
+        """
+        Check S3 connection
+        
+        Bypasses the circuit breaker and reports to it, so a successful
+        probe closes an open circuit without waiting for a trial request.
+        """
+        try:
+            await self._execute(self.s3_client.head_bucket, Bucket=self.bucket_name)
+        except (ClientError, BotoConnectionError, HTTPClientError) as e:
             logger.error(f"S3 connection failed: {e}")
+            if self._is_outage(e):
+                self.breaker.record_failure()
             return False
+        self.breaker.record_success()
+        return True
     
     def _generate_image_id(self, filename: str) -> str:
         """Generate unique image ID"""
         timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
         return f"{timestamp}_{filename}"
     
-    def _create_thumbnail(self, image_data: bytes, max_size: tuple = (300, 300)) -> bytes:
-        """Create thumbnail from image data"""
+    async def upload_image(
+        self,
+        file_path: str,
+        size: int,
+        filename: str,
+        content_type: str,
+        title: str,
+        description: Optional[str] = None,
+        tags: List[str] = [],
+        content_hash: Optional[str] = None
+    ) -> Dict:
+        """
+        Upload image to S3 with metadata, streaming the original from a local file
+        
+        The original and the derivatives are written concurrently; the
+        metadata object is written last and marks the image as visible. If
+        anything fails, the objects written so far are removed again.
+        
+        With DEFER_DERIVATIVES only the original and the metadata are
+        written here (status "processing", the original standing in as
+        thumbnail) and a job makes the derivatives (see
+        `_process_derivatives`); the record carries the job's ID.
+        
+        With a `content_hash` (SHA-256 of the file), content that is
+        already stored is not written again: the new record points at the
+        existing original, thumbnail and renditions and takes a reference.
+        """
+        image_id = self._generate_image_id(filename)
+        if not content_hash or not settings.dedup_uploads:
+            return await self._store_image(
+                image_id, file_path, size, filename, content_type, title, description, tags
+            )
+        return await self._store_deduplicated(
+            image_id, file_path, size, filename, content_type, title, description, tags, content_hash
+        )
+    
+    async def _store_deduplicated(
+        self,
+        image_id: str,
+        file_path: str,
+        size: int,
+        filename: str,
+        content_type: str,
+        title: str,
+        description: Optional[str],
+        tags: List[str],
+        content_hash: str,
+        original_stored: bool = False
+    ) -> Dict:
+        """Reference the stored blob for `content_hash`, or store the image and index it as one"""
+        # Held for the whole upload, so identical concurrent uploads store the file once
+        async with self.blobs.locked(content_hash):
+            blob = await self.blobs.add_reference(content_hash, image_id)
+            if blob is None:
+                return await self._store_image(
+                    image_id, file_path, size, filename, content_type, title, description, tags,
+                    content_hash=content_hash, original_stored=original_stored
+                )
+            
+            logger.info(f"Duplicate upload {image_id}, reusing {blob['image_key']}")
+            try:
+                # A pending blob's job updates this record too once it finishes
+                return await self._commit_metadata(
+                    image_id, blob['size'], filename, blob['content_type'], title, description, tags,
+                    blob, image_key=blob['image_key'], content_hash=content_hash, job_id=blob.get('job_id')
+                )
+            except Exception:
+                released = await self.blobs.remove_references(content_hash, [image_id])
+                if released is not None:
+                    await self._delete_keys(self._object_keys(released))
+                raise
+    
+    async def _store_image(
+        self,
+        image_id: str,
+        file_path: str,
+        size: int,
+        filename: str,
+        content_type: str,
+        title: str,
+        description: Optional[str],
+        tags: List[str],
+        content_hash: Optional[str] = None,
+        original_stored: bool = False
+    ) -> Dict:
+        """
+        Write the original, derivatives and metadata of a new image
+        
+        With a `content_hash` the stored objects are indexed under it
+        before the metadata makes the image visible; the caller holds
+        the hash's lock. With `original_stored` the original is already
+        at images/{id} (a presigned POST) and only the rest is written.
+        """
+        image_key = f"images/{image_id}"
+        written: List[str] = []
+        indexed = False
+        job_id = None
+        
         try:
-            image = Image.open(BytesIO(image_data))
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            if settings.defer_derivatives:
+                # Only the header is read, so oversized images are still refused up front
+                dimensions = await self.thumbnails.probe(file_path)
+                if not original_stored:
+                    await self._upload_original(file_path, image_key, content_type, written)
+                derivatives = {"thumbnail_key": image_key, "thumbnail_size": 0, "renditions": []}
+                if dimensions:
+                    derivatives["width"], derivatives["height"] = dimensions
+                job_id = uuid.uuid4().hex
+            else:
+                # Upload original image while derivatives are generated and uploaded
+                writes = [self._write_derivatives(image_id, file_path, content_type, written)]
+                if not original_stored:
+                    writes.append(self._upload_original(file_path, image_key, content_type, written))
+                derivatives = (await self._gather_all(*writes))[0]
             
-            thumb_io = BytesIO()
-            image.save(thumb_io, format=image.format or 'JPEG')
-            thumb_io.seek(0)
+            if content_hash:
+                await self.blobs.create(content_hash, image_id, dict(
+                    derivatives,
+                    image_key=image_key,
+                    content_type=content_type,
+                    size=size,
+                    job_id=job_id
+                ))
+                indexed = True
+            
+            metadata = await self._commit_metadata(
+                image_id, size, filename, content_type, title, description, tags,
+                derivatives, content_hash=content_hash, job_id=job_id
+            )
             
-            return thumb_io.getvalue()
         except Exception as e:
-            logger.error(f"Failed to create thumbnail: {e}")
-            return image_data
+            logger.error(f"Failed to upload image: {e}")
+            if indexed:
+                try:
+                    await self.blobs.remove_references(content_hash, [image_id])
+                except (ClientError, S3UnavailableError) as cleanup_error:
+                    logger.error(f"Failed to unindex content hash {content_hash}: {cleanup_error}")
+            await self._delete_keys(written)
+            raise
+        
+        if job_id:
+            metadata = await self._enqueue_derivatives(metadata)
+        return metadata
     
-    async def upload_image(
+    @staticmethod
+    async def _gather_all(*aws) -> List[Any]:
+        """Like asyncio.gather, but waits for every awaitable before raising the first error"""
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+    
+    async def _upload_original(self, file_path: str, image_key: str, content_type: str, written: List[str]):
+        await self._run(
+            self.s3_client.upload_file,
+            file_path,
+            self.bucket_name,
+            image_key,
+            ExtraArgs={'ContentType': content_type},
+            Config=self._transfer_config
+        )
+        written.append(image_key)
+        logger.info(f"Uploaded image: {image_key}")
+    
+    async def _put_tracked(self, key: str, body: bytes, content_type: str, written: List[str]):
+        await self._call('put_object', Key=key, Body=body, ContentType=content_type)
+        written.append(key)
+    
+    async def _delete_keys(self, keys: List[str]):
+        """Best-effort removal of orphaned objects after a failed write"""
+        if not keys:
+            return
+        try:
+            await self._call(
+                'delete_objects',
+                Delete={'Objects': [{'Key': key} for key in keys]}
+            )
+            logger.info(f"Removed {len(keys)} orphaned objects")
+        except (ClientError, S3UnavailableError) as e:
+            logger.error(f"Failed to remove orphaned objects {keys}: {e}")
+    
+    async def _write_derivatives(
+        self,
+        image_id: str,
+        file_path: str,
+        content_type: str,
+        written: List[str]
+    ) -> Dict:
+        """
+        Create the thumbnail and renditions and upload them concurrently
+        
+        Returns the metadata fields describing them: thumbnail_key,
+        thumbnail_size, renditions, and phash, width and height when the
+        image could be decoded.
+        """
+        image_key = f"images/{image_id}"
+        thumb_key = f"thumbnails/{image_id}"
+        
+        thumbnail_data, rendered, phash, dimensions = await self.thumbnails.create_derivatives(file_path)
+        
+        renditions = []
+        uploads = []
+        if thumbnail_data is None:
+            # Undecodable image: point the thumbnail at the original
+            thumb_key = image_key
+        else:
+            uploads.append(self._put_tracked(thumb_key, thumbnail_data, content_type, written))
+        for rendition in rendered:
+            rendition_key = f"renditions/{image_id}/{rendition['width']}.{rendition['format']}"
+            rendition_type = RENDITION_CONTENT_TYPES[rendition['format']]
+            uploads.append(self._put_tracked(rendition_key, rendition['data'], rendition_type, written))
+            renditions.append({
+                "key": rendition_key,
+                "width": rendition['width'],
+                "height": rendition['height'],
+                "format": rendition['format'],
+                "content_type": rendition_type,
+                "size": len(rendition['data'])
+            })
+        
+        await self._gather_all(*uploads)
+        logger.info(f"Uploaded thumbnail and {len(renditions)} renditions: {image_id}")
+        
+        derivatives = {
+            "thumbnail_key": thumb_key,
+            "thumbnail_size": len(thumbnail_data or b''),
+            "renditions": renditions
+        }
+        if phash:
+            derivatives["phash"] = phash
+        if dimensions:
+            derivatives["width"], derivatives["height"] = dimensions
+        return derivatives
+    
+    async def _commit_metadata(
         self,
-        file_data: bytes,
+        image_id: str,
+        size: int,
         filename: str,
         content_type: str,
         title: str,
+        description: Optional[str],
+        tags: List[str],
+        derivatives: Dict,
+        image_key: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        job_id: Optional[str] = None
+    ) -> Dict:
+        """
+        Write the metadata object, which makes the image visible, and index it
+        
+        `derivatives` holds the DERIVATIVE_FIELDS (as `_write_derivatives`
+        returns them); with a `job_id` they are placeholders until the job
+        has run, and the status is "processing".
+        """
+        metadata = {
+            "id": image_id,
+            "title": title,
+            "description": description,
+            "tags": tags,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "created_at": datetime.utcnow().isoformat(),
+            "image_key": image_key or f"images/{image_id}",
+            "status": "processing" if job_id else "ready",
+            # Keys of on-demand renders stored in S3 (see _record_variant)
+            "variant_keys": []
+        }
+        metadata.update({
+            field: derivatives[field]
+            for field in DERIVATIVE_FIELDS if derivatives.get(field) is not None
+        })
+        if job_id:
+            metadata["job_id"] = job_id
+        if content_hash:
+            metadata["content_hash"] = content_hash
+        
+        await self._put_metadata(metadata)
+        logger.info(f"Uploaded metadata: metadata/{image_id}.json")
+        
+        self.inventory.add(metadata)
+        await self._update_index(metadata)
+        
+        return metadata
+    
+    async def _enqueue_derivatives(self, metadata: Dict) -> Dict:
+        """Queue the derivatives job of a freshly committed deferred upload"""
+        payload = {"image_id": metadata['id'], "content_hash": metadata.get('content_hash')}
+        try:
+            await self.jobs.enqueue('derivatives', payload, job_id=metadata['job_id'])
+            return metadata
+        except Exception as e:
+            # The image is already visible; make its derivatives now rather than never
+            logger.error(f"Failed to queue derivatives of {metadata['id']}, processing inline: {e}")
+            await self._process_derivatives(payload)
+            return await self._fetch_metadata(metadata['id']) or metadata
+    
+    async def _process_derivatives(self, payload: Dict) -> Dict:
+        """
+        Job handler: make the derivatives of a deferred upload and record them
+        
+        Idempotent, as the queue requires: derivative keys derive from the
+        image ID, and a record that is no longer processing is skipped.
+        Deduplicated content is processed once for every image sharing it.
+        Derivatives made for an image deleted meanwhile are removed again.
+        """
+        metadata = await self._fetch_metadata(payload['image_id'])
+        if metadata is None and payload.get('content_hash'):
+            # The uploader was deleted, but duplicates may still wait for the derivatives
+            metadata = await self._pending_duplicate(payload['content_hash'])
+        if metadata is None or metadata.get('status') != 'processing':
+            return {"image_ids": []}
+        image_id = metadata['id']
+        
+        written: List[str] = []
+        fd, file_path = tempfile.mkstemp(prefix="derivatives-", dir=settings.upload_tmp_dir)
+        os.close(fd)
+        try:
+            await self._run(
+                self.s3_client.download_file,
+                self.bucket_name,
+                metadata['image_key'],
+                file_path,
+                Config=self._transfer_config
+            )
+            derivatives = await self._write_derivatives(image_id, file_path, metadata['content_type'], written)
+        except ImageRejectedError as e:
+            await self._delete_keys(written)
+            await self._apply_derivatives(metadata, {}, status='failed')
+            raise JobFailed(str(e))
+        except Exception:
+            await self._delete_keys(written)
+            raise
+        finally:
+            os.unlink(file_path)
+        
+        # A failure from here on is retried and rewrites the same keys, so nothing is removed
+        updated = await self._apply_derivatives(metadata, derivatives, status='ready')
+        if not updated:
+            await self._delete_keys(written)
+        logger.info(f"Processed derivatives of {image_id} for {len(updated)} images")
+        return {"image_ids": updated}
+    
+    async def _pending_duplicate(self, digest: str) -> Optional[Dict]:
+        """Metadata of an image still waiting for the derivatives of deduplicated content"""
+        record = await self.blobs.get(digest)
+        if record is None or not record.get('job_id'):
+            return None
+        for image_id in record['refs']:
+            metadata = await self._fetch_metadata(image_id)
+            if metadata is not None:
+                return metadata
+        return None
+    
+    async def _apply_derivatives(self, metadata: Dict, derivatives: Dict, status: str) -> List[str]:
+        """Write derivatives and status into a processed image's record and those sharing its content"""
+        digest = metadata.get('content_hash')
+        if not digest:
+            return await self._rewrite_derivatives([metadata['id']], derivatives, status)
+        
+        # Under the hash's lock, so a duplicate uploaded meanwhile is either in refs or sees the result
+        async with self.blobs.locked(digest):
+            record = await self.blobs.set_derivatives(digest, derivatives)
+            if record is None:
+                return []
+            return await self._rewrite_derivatives(record['refs'], derivatives, status)
+    
+    async def _rewrite_derivatives(self, image_ids: List[str], derivatives: Dict, status: str) -> List[str]:
+        """Rewrite metadata objects with new derivatives and reindex them; returns the IDs that still exist"""
+        def change(metadata: Dict) -> bool:
+            metadata.update(derivatives, status=status)
+            return True
+        
+        async def rewrite(image_id: str) -> Optional[Tuple[Dict, Dict]]:
+            return await self._modify_metadata(image_id, change)
+        
+        rewritten = [pair for pair in await asyncio.gather(*(rewrite(image_id) for image_id in image_ids)) if pair]
+        if not rewritten:
+            return []
+        
+        self._bump_version()
+        self.inventory.update(rewritten)
+        for _, metadata in rewritten:
+            self._index_search(metadata)
+        try:
+            await self.metadata_index.upsert_many([metadata for _, metadata in rewritten])
+        except ClientError as e:
+            logger.error(f"Failed to index {len(rewritten)} processed images, run an index rebuild: {e}")
+        return [metadata['id'] for _, metadata in rewritten]
+    
+    async def create_upload(self, filename: str, content_type: str) -> Dict:
+        """
+        Issue a presigned POST so the browser can upload the original straight to S3
+        
+        The policy pins the object key, the content type and the size range,
+        so the only thing the client can do with it is upload one image.
+        """
+        image_id = self._generate_image_id(os.path.basename(filename))
+        image_key = f"images/{image_id}"
+        
+        post = self.s3_client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=image_key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.max_upload_size]
+            ],
+            ExpiresIn=settings.presigned_post_ttl
+        )
+        
+        return {
+            "image_id": image_id,
+            "url": post['url'],
+            "fields": post['fields'],
+            "expires_in": settings.presigned_post_ttl,
+            "max_size": settings.max_upload_size
+        }
+    
+    async def finalize_upload(
+        self,
+        image_id: str,
+        title: str,
         description: Optional[str] = None,
         tags: List[str] = []
-    ) -> Dict:
-        """Upload image to S3 with metadata"""
+    ) -> Optional[Dict]:
+        """
+        Create the metadata and derivatives (or their job) of an original uploaded via presigned POST
+        
+        Returns None when the original is not in images/ (the upload never
+        happened or the policy expired). Finalizing twice returns the
+        existing metadata.
+        
+        The original takes the same path as an upload through the API: it
+        is hashed for deduplication (content already stored is referenced
+        and the new copy deleted) and, with DEFER_DERIVATIVES, its
+        derivatives are left to a job. An original that is the shared blob
+        of other images (its own image was deleted) is only referenced,
+        so deleting this image later cannot remove objects they still use.
+        """
+        image_key = f"images/{image_id}"
+        
         try:
-            image_id = self._generate_image_id(filename)
-            image_key = f"images/{image_id}"
-            thumb_key = f"thumbnails/{image_id}"
-            metadata_key = f"metadata/{image_id}.json"
-            
-            # Upload original image
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=image_key,
-                Body=file_data,
-                ContentType=content_type
+            head = await self._call('head_object', Key=image_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        
+        existing = await self._fetch_metadata(image_id)
+        if existing is not None:
+            return existing
+        
+        # The original has to be local for hashing and the thumbnail workers
+        fd, file_path = tempfile.mkstemp(prefix="finalize-", dir=settings.upload_tmp_dir)
+        os.close(fd)
+        try:
+            await self._run(
+                self.s3_client.download_file,
+                self.bucket_name,
+                image_key,
+                file_path,
+                Config=self._transfer_config
             )
-            logger.info(f"Uploaded image: {image_key}")
-            
-            # Create and upload thumbnail
-            thumbnail_data = self._create_thumbnail(file_data)
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=thumb_key,
-                Body=thumbnail_data,
-                ContentType=content_type
+            content_hash = await asyncio.to_thread(hash_file, file_path)
+            args = (
+                image_id, file_path, head['ContentLength'], image_id.split('_', 1)[-1],
+                head.get('ContentType', 'application/octet-stream'), title, description, tags
             )
-            logger.info(f"Uploaded thumbnail: {thumb_key}")
             
-            # Create metadata
-            metadata = {
-                "id": image_id,
-                "title": title,
-                "description": description,
-                "tags": tags,
-                "filename": filename,
-                "content_type": content_type,
-                "size": len(file_data),
-                "created_at": datetime.utcnow().isoformat(),
-                "image_key": image_key,
-                "thumbnail_key": thumb_key
-            }
-            
-            # Upload metadata
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=metadata_key,
-                Body=json.dumps(metadata),
-                ContentType="application/json"
-            )
-            logger.info(f"Uploaded metadata: {metadata_key}")
+            blob = await self.blobs.get(content_hash)
+            if not settings.dedup_uploads and (blob is None or blob['image_key'] != image_key):
+                return await self._store_image(*args, original_stored=True)
             
+            metadata = await self._store_deduplicated(*args, content_hash, original_stored=True)
+            if metadata['image_key'] != image_key:
+                # The same content was already stored; this copy is not needed
+                await self._delete_keys([image_key])
             return metadata
-            
-        except ClientError as e:
-            logger.error(f"Failed to upload image: {e}")
+        except ImageRejectedError:
+            # Rejected content was never indexed, so no blob shares the original
+            await self._delete_keys([image_key])
             raise
+        finally:
+            os.unlink(file_path)
     
-    async def list_images(self) -> List[Dict]:
-        """List all images from S3"""
+    def _presign(self, key: str, expires_in: int) -> str:
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': key
+            },
+            ExpiresIn=expires_in
+        )
+    
+    @staticmethod
+    def _object_keys(metadata: Dict) -> List[str]:
+        """Every S3 object key an image record points at, except its metadata"""
+        keys = [metadata['image_key'], metadata['thumbnail_key']]
+        keys.extend(rendition['key'] for rendition in metadata.get('renditions', []))
+        return keys
+    
+    def with_urls(self, metadata: Dict) -> Dict:
+        """Attach presigned URLs for the original, thumbnail and renditions (builds the API response)"""
+        urls = self.url_cache.get_many(self._object_keys(metadata))
+        metadata['url'] = urls[metadata['image_key']]
+        # The proxy's thumbnails are immutable, so it only serves finished ones
+        if settings.thumbnail_proxy and metadata.get('status') != 'processing':
+            metadata['thumbnail_url'] = f"/api/images/{quote(metadata['id'], safe='')}/thumbnail"
+        else:
+            metadata['thumbnail_url'] = urls[metadata['thumbnail_key']]
+        
+        # Copy rather than mutate, the records may be shared with the index
+        metadata['renditions'] = [
+            dict(rendition, url=urls[rendition['key']])
+            for rendition in metadata.get('renditions', [])
+        ]
+        
+        return metadata
+    
+    def _bump_version(self):
+        self.collection_version += 1
+        self.collection_modified = time.time()
+    
+    @staticmethod
+    def _cache_window() -> int:
+        return int(time.time() // settings.http_cache_window)
+    
+    def list_etag(self) -> str:
+        """
+        Strong ETag for image listings
+        
+        Combines this process's collection version with the current cache
+        window. The window bounds how long a listing can go unrevalidated
+        (presigned URLs in a cached body stay valid at least that long, and
+        writes made through other replicas show up by the next window).
+        """
+        return f'"{self._instance_id}-{self.collection_version}-{self._cache_window()}"'
+    
+    def list_last_modified(self) -> float:
+        """Last-Modified for listings: the last local write or the start of the cache window"""
+        return max(self.collection_modified, self._cache_window() * settings.http_cache_window)
+    
+    async def get_image_etag(self, image_id: str) -> Optional[str]:
+        """Strong ETag for one image: its metadata ETag and the cache window; None if missing"""
+        if await self._fetch_metadata(image_id) is None:
+            return None
+        metadata_etag = (self.metadata_cache.etag(image_id) or '').strip('"')
+        return f'"{metadata_etag}-{self._cache_window()}"'
+    
+    async def _update_index(self, metadata: Dict):
+        """Keep the metadata and search indexes in sync; a failure here must not fail the write"""
+        self._bump_version()
+        self._index_search(metadata)
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix="metadata/"
-            )
+            await self.metadata_index.upsert(metadata)
+        except ClientError as e:
+            logger.error(f"Failed to index {metadata['id']}, run an index rebuild: {e}")
+    
+    @staticmethod
+    def encode_cursor(image_id: str) -> str:
+        """Encode the last image ID of a page as an opaque cursor"""
+        return base64.urlsafe_b64encode(image_id.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> str:
+        """Decode a cursor back to an image ID, raising ValueError if malformed"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            return base64.b64decode(padded.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+        except (binascii.Error, UnicodeError) as e:
+            raise ValueError("Invalid cursor") from e
+    
+    async def reconcile_indexes(self) -> bool:
+        """
+        Refresh this process's view of the shared metadata index and resume lost jobs
+        
+        Rebuilds the search and similarity indexes, so uploads, updates and
+        deletes made through other replicas show up, and recounts the
+        storage inventory, from one read of the metadata index (no bucket
+        listing).
+        """
+        async with self._search_index_lock:
+            records = await self._build_search_index()
+        self.inventory.reconcile(records)
+        logger.info(f"Storage inventory reconciled: {self.inventory.images} images")
+        await self._resume_derivatives(records)
+        return True
+    
+    async def _resume_derivatives(self, records: Iterable[Dict]) -> int:
+        """
+        Queue again the derivatives jobs of images processing longer than a job lease
+        
+        Covers jobs the queue no longer has (a lost or replaced job
+        database) under their original job ID, so duplicates sharing a
+        job are queued once. The handler is idempotent, so a job still
+        held by another host at worst runs twice. Images whose job has
+        failed for good are marked failed. Returns the number queued.
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=settings.job_lease)).isoformat()
+        requeued = 0
+        for metadata in records:
+            if metadata.get('status') != 'processing' or not metadata.get('job_id'):
+                continue
+            if metadata.get('created_at', '') > cutoff:
+                continue
+            job = await self.jobs.get(metadata['job_id'])
+            if job is None:
+                payload = {"image_id": metadata['id'], "content_hash": metadata.get('content_hash')}
+                await self.jobs.enqueue('derivatives', payload, job_id=metadata['job_id'])
+                requeued += 1
+            elif job['status'] == 'failed':
+                await self._apply_derivatives(metadata, {}, status='failed')
+        if requeued:
+            logger.warning(f"Queued {requeued} lost derivatives jobs again")
+        return requeued
+    
+    def _index_search(self, metadata: Dict):
+        self.search_index.add(metadata)
+        self.similarity_index.add(metadata)
+        if self._search_journal is not None:
+            self._search_journal.append((metadata, metadata['id']))
+    
+    def _unindex_search(self, image_id: str):
+        self.search_index.remove(image_id)
+        self.similarity_index.remove(image_id)
+        if self._search_journal is not None:
+            self._search_journal.append((None, image_id))
+    
+    async def _build_search_index(self) -> List[Dict]:
+        self._search_journal = []
+        try:
+            records = await self.metadata_index.load_all()
+            self.search_index.build(records)
+            self.similarity_index.build(records)
+            # The records may predate writes this process made while they loaded
+            for metadata, image_id in self._search_journal:
+                if metadata is None:
+                    self.search_index.remove(image_id)
+                    self.similarity_index.remove(image_id)
+                else:
+                    self.search_index.add(metadata)
+                    self.similarity_index.add(metadata)
+        finally:
+            self._search_journal = None
+        logger.info(
+            f"Search index built with {len(self.search_index)} images, "
+            f"{len(self.similarity_index)} perceptually hashed"
+        )
+        return records
+    
+    async def _ensure_search_index(self):
+        if not self.search_index.ready:
+            async with self._search_index_lock:
+                if not self.search_index.ready:
+                    await self._build_search_index()
+    
+    async def _search_ids(self, tag: Optional[str], q: Optional[str]) -> List[str]:
+        await self._ensure_search_index()
+        return list(self.search_index.search(tag=tag, q=q))
+    
+    async def similar_images(self, image_id: str, max_distance: int, limit: int) -> Optional[List[Dict]]:
+        """
+        Images whose perceptual hash is within `max_distance` bits of an image's, closest first
+        
+        Returns a list of {image, distance}, or None if the image does not
+        exist. Images uploaded before hashing have no similar images.
+        """
+        await self._ensure_search_index()
+        matches = self.similarity_index.similar(image_id, max_distance, limit)
+        if matches is None:
+            return None if not await self.image_exists(image_id) else []
+        
+        records = await asyncio.gather(*(
+            self._fetch_metadata(match_id) for match_id, _ in matches
+        ))
+        return [
+            {"image": self.with_urls(metadata), "distance": distance}
+            for metadata, (_, distance) in zip(records, matches)
+            if metadata is not None
+        ]
+    
+    async def duplicate_clusters(self, max_distance: int, limit: int) -> Dict:
+        """
+        Groups of near-duplicate images (perceptual hashes linked by at most `max_distance` bits)
+        
+        Clustering is NumPy work on a snapshot of the index, so it runs on
+        a worker thread instead of the event loop.
+        """
+        await self._ensure_search_index()
+        hashes, image_ids = self.similarity_index.snapshot()
+        clusters = await asyncio.get_running_loop().run_in_executor(
+            None, SimilarityIndex.clusters, hashes, image_ids, max_distance
+        )
+        return {
+            "clusters": [{"ids": ids, "size": len(ids)} for ids in clusters[:limit]],
+            "cluster_count": len(clusters),
+            "duplicate_images": sum(len(ids) for ids in clusters),
+            "images_hashed": len(image_ids)
+        }
+    
+    async def list_images(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        tag: Optional[str] = None,
+        q: Optional[str] = None
+    ) -> Dict:
+        """
+        List one page of images, newest first, optionally filtered by tag and text
+        
+        Image IDs start with the upload timestamp, so ordering by ID
+        descending is a stable newest-first order. Unfiltered pages come
+        from the time-ordered metadata index, which reads only the
+        partitions the page falls in. Filters are answered by the
+        in-memory search index, so the same cursor scheme pages through
+        search results; only the records on the requested page are
+        fetched. Either way only the page is signed.
+        """
+        try:
+            after_id = self.decode_cursor(cursor) if cursor else None
             
-            images = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    metadata_key = obj['Key']
-                    
-                    # Get metadata
-                    metadata_obj = self.s3_client.get_object(
-                        Bucket=self.bucket_name,
-                        Key=metadata_key
-                    )
-                    metadata = json.loads(metadata_obj['Body'].read())
-                    
-                    # Generate presigned URLs
-                    metadata['url'] = self.s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={
-                            'Bucket': self.bucket_name,
-                            'Key': metadata['image_key']
-                        },
-                        ExpiresIn=3600
-                    )
-                    
-                    metadata['thumbnail_url'] = self.s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={
-                            'Bucket': self.bucket_name,
-                            'Key': metadata['thumbnail_key']
-                        },
-                        ExpiresIn=3600
-                    )
-                    
-                    images.append(metadata)
+            if tag or q:
+                image_ids = sorted(await self._search_ids(tag, q), reverse=True)
+                if after_id is not None:
+                    image_ids = [image_id for image_id in image_ids if image_id < after_id]
+                
+                page_ids = image_ids[:limit]
+                has_more = len(image_ids) > limit
+                page = await asyncio.gather(*(
+                    self._fetch_metadata(image_id) for image_id in page_ids
+                ))
+                # Deleted by another pod since the index was built
+                page = [metadata for metadata in page if metadata is not None]
+            else:
+                records = await self.metadata_index.page(limit, before=after_id)
+                page_ids = [metadata['id'] for metadata in records[:limit]]
+                has_more = len(records) > limit
+                page = records[:limit]
             
-            # Sort by created_at (newest first)
-            images.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            next_cursor = None
+            if has_more:
+                next_cursor = self.encode_cursor(page_ids[-1])
             
-            return images
+            return {
+                "items": [self.with_urls(metadata) for metadata in page],
+                "next_cursor": next_cursor
+            }
             
         except ClientError as e:
             logger.error(f"Failed to list images: {e}")
@@ -177,38 +1135,168 @@ class S3Service:
     async def get_image(self, image_id: str) -> Optional[Dict]:
         """Get single image metadata"""
         try:
-            metadata_key = f"metadata/{image_id}.json"
+            metadata = await self._fetch_metadata(image_id)
+            if metadata is None:
+                logger.warning(f"Image not found: {image_id}")
+                return None
             
-            metadata_obj = self.s3_client.get_object(
-                Bucket=self.bucket_name,
-                Key=metadata_key
-            )
-            metadata = json.loads(metadata_obj['Body'].read())
+            return self.with_urls(metadata)
             
-            # Generate presigned URLs
-            metadata['url'] = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': metadata['image_key']
-                },
-                ExpiresIn=3600
+        except ClientError as e:
+            logger.warning(f"Failed to get image {image_id}: {e}")
+            return None
+    
+    @property
+    def thumbnail_cache(self) -> DiskLRUCache:
+        if self._thumbnail_cache is None:
+            self._thumbnail_cache = DiskLRUCache(
+                "thumbnails",
+                settings.thumbnail_cache_dir or os.path.join(tempfile.gettempdir(), "gallery-thumbnails"),
+                max_bytes=settings.thumbnail_cache_max_bytes,
+                run=self._run
             )
+        return self._thumbnail_cache
+    
+    async def open_thumbnail(self, image_id: str) -> Optional[Tuple[BinaryIO, str]]:
+        """
+        Open an image's thumbnail from the local disk cache
+        
+        A miss reads the metadata for the thumbnail key and downloads the
+        object straight into the cache. Returns the open file and its
+        content type, or None if the image does not exist or its
+        thumbnail is still being made.
+        """
+        key = f"thumbnails/{image_id}"
+        file = self.thumbnail_cache.open(key)
+        if file is not None:
+            # A content type never changes, so any cached record will do and a hit stays off S3
+            cached = self.metadata_cache.get(image_id)
+            metadata = cached[1] if cached else await self._fetch_metadata(image_id)
+            if metadata is None:
+                file.close()
+                return None
+        else:
+            metadata = await self._fetch_metadata(image_id)
+            if metadata is None or metadata.get('status') == 'processing':
+                return None
+            
+            def download(path: str):
+                self.s3_client.download_file(self.bucket_name, metadata['thumbnail_key'], path)
             
-            metadata['thumbnail_url'] = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': metadata['thumbnail_key']
-                },
-                ExpiresIn=3600
+            try:
+                file = await self.thumbnail_cache.get_or_fill(key, download)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                    logger.warning(f"Thumbnail missing for {image_id}")
+                    return None
+                raise
+        
+        # Thumbnails are stored in their original's format, with its content type
+        return file, metadata.get('content_type') or "application/octet-stream"
+    
+    @property
+    def variant_cache(self) -> DiskLRUCache:
+        if self._variant_cache is None:
+            self._variant_cache = DiskLRUCache(
+                "variants",
+                settings.render_cache_dir or os.path.join(tempfile.gettempdir(), "gallery-variants"),
+                max_bytes=settings.render_cache_max_bytes,
+                run=self._run
             )
+        return self._variant_cache
+    
+    async def open_variant(self, image_id: str, spec: RenderSpec) -> Optional[Tuple[BinaryIO, str]]:
+        """
+        Open an on-demand render of an image, creating it if needed
+        
+        Variants are looked up in the local disk cache, then under their
+        derived key in S3, and only then rendered from the original on the
+        process pool and stored back to S3, so a variant is decoded from
+        the original once for the whole deployment. Returns the open file
+        and its content type, or None if the image does not exist.
+        """
+        key = spec.key(image_id)
+        file = self.variant_cache.open(key)
+        if file is None:
+            metadata = await self._fetch_metadata(image_id)
+            if metadata is None:
+                return None
             
-            return metadata
+            async def fill(path: str):
+                await self._fill_variant(metadata, spec, key, path)
             
+            file = await self.variant_cache.get_or_fill(key, fill)
+        return file, RENDITION_CONTENT_TYPES[spec.format]
+    
+    async def _fill_variant(self, metadata: Dict, spec: RenderSpec, key: str, path: str):
+        """Download a stored variant to `path`, or render it from the original and store it"""
+        try:
+            await self._run(self.s3_client.download_file, self.bucket_name, key, path)
+            return
         except ClientError as e:
-            logger.warning(f"Image not found: {image_id}")
-            return None
+            if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404', 'NotFound'):
+                raise
+        
+        fd, source_path = tempfile.mkstemp(prefix="render-", dir=settings.upload_tmp_dir)
+        os.close(fd)
+        try:
+            await self._run(
+                self.s3_client.download_file,
+                self.bucket_name,
+                metadata['image_key'],
+                source_path,
+                Config=self._transfer_config
+            )
+            await self.thumbnails.render(
+                source_path, path, spec.width, spec.height, spec.fit, spec.format, spec.quality
+            )
+        finally:
+            os.unlink(source_path)
+        
+        # The local copy is served either way; storing it only saves other replicas a render
+        try:
+            await self._run(
+                self.s3_client.upload_file,
+                path,
+                self.bucket_name,
+                key,
+                ExtraArgs={'ContentType': RENDITION_CONTENT_TYPES[spec.format]}
+            )
+            await self._record_variant(metadata['id'], key)
+        except (ClientError, S3UnavailableError) as e:
+            logger.warning(f"Failed to store variant {key}: {e}")
+    
+    async def _record_variant(self, image_id: str, key: str):
+        """
+        Add a stored variant's key to its image's record, so a delete finds it without listing
+        
+        Written conditionally on the record's ETag and retried, so it does
+        not undo a concurrent metadata update.
+        """
+        def change(metadata: Dict) -> bool:
+            if key in metadata.get('variant_keys', [key]):
+                # Already recorded, or a record from before variant keys (listed on delete)
+                return False
+            metadata['variant_keys'].append(key)
+            return True
+        
+        try:
+            await self._modify_metadata(image_id, change)
+        except ClientError as e:
+            if not is_precondition_failed(e):
+                raise
+            logger.warning(f"Could not record variant {key}; it is left behind if {image_id} is deleted")
+    
+    async def _list_keys(self, prefix: str) -> List[str]:
+        keys = []
+        kwargs = {'Prefix': prefix}
+        while True:
+            page = await self._call('list_objects_v2', **kwargs)
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+            if not page.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+        return keys
     
     async def update_metadata(
         self,
@@ -219,65 +1307,215 @@ class S3Service:
     ) -> Optional[Dict]:
         """Update image metadata"""
         try:
-            metadata_key = f"metadata/{image_id}.json"
-            
-            # Get existing metadata
-            metadata_obj = self.s3_client.get_object(
-                Bucket=self.bucket_name,
-                Key=metadata_key
+            metadata = await self._rewrite_metadata(
+                image_id, title=title, description=description, tags=tags
             )
-            metadata = json.loads(metadata_obj['Body'].read())
+            if metadata is None:
+                logger.warning(f"Image not found: {image_id}")
+                return None
             
-            # Update fields
+            logger.info(f"Updated metadata: {image_id}")
+            await self._update_index(metadata)
+            return metadata
+            
+        except ClientError as e:
+            logger.error(f"Failed to update metadata: {e}")
+            return None
+    
+    async def _rewrite_metadata(
+        self,
+        image_id: str,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        add_tags: Optional[List[str]] = None,
+        remove_tags: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """Read, modify and conditionally write one metadata object (the index is left to the caller)"""
+        def change(metadata: Dict) -> bool:
             if title is not None:
                 metadata['title'] = title
             if description is not None:
                 metadata['description'] = description
             if tags is not None:
                 metadata['tags'] = tags
-            
+            if add_tags:
+                metadata['tags'] = metadata.get('tags', []) + [
+                    tag for tag in add_tags if tag not in metadata.get('tags', [])
+                ]
+            if remove_tags:
+                metadata['tags'] = [tag for tag in metadata.get('tags', []) if tag not in remove_tags]
             metadata['updated_at'] = datetime.utcnow().isoformat()
-            
-            # Save updated metadata
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=metadata_key,
-                Body=json.dumps(metadata),
-                ContentType="application/json"
-            )
-            
-            logger.info(f"Updated metadata: {image_id}")
-            return metadata
-            
+            return True
+        
+        outcome = await self._modify_metadata(image_id, change)
+        return outcome[1] if outcome else None
+    
+    async def update_images(
+        self,
+        image_ids: List[str],
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        add_tags: Optional[List[str]] = None,
+        remove_tags: Optional[List[str]] = None
+    ) -> Dict[str, str]:
+        """
+        Apply the same metadata change to many images
+        
+        Metadata objects are rewritten concurrently (bounded by
+        BULK_UPDATE_CONCURRENCY) and the index is updated once per touched
+        partition. Returns a status per image ID: updated, not_found or failed.
+        """
+        semaphore = asyncio.Semaphore(settings.bulk_update_concurrency)
+        
+        async def update_one(image_id: str) -> Tuple[str, Optional[Dict]]:
+            async with semaphore:
+                try:
+                    metadata = await self._rewrite_metadata(
+                        image_id, title, description, tags, add_tags, remove_tags
+                    )
+                except ClientError as e:
+                    logger.error(f"Failed to update metadata {image_id}: {e}")
+                    return 'failed', None
+                return ('updated' if metadata else 'not_found'), metadata
+        
+        unique_ids = list(dict.fromkeys(image_ids))
+        outcomes = await asyncio.gather(*(update_one(image_id) for image_id in unique_ids))
+        
+        updated = [metadata for _, metadata in outcomes if metadata]
+        if updated:
+            self._bump_version()
+        for metadata in updated:
+            self._index_search(metadata)
+        try:
+            await self.metadata_index.upsert_many(updated)
         except ClientError as e:
-            logger.error(f"Failed to update metadata: {e}")
-            return None
+            logger.error(f"Failed to index {len(updated)} updated images, run an index rebuild: {e}")
+        
+        logger.info(f"Updated metadata of {len(updated)}/{len(unique_ids)} images")
+        return {image_id: outcome for image_id, (outcome, _) in zip(unique_ids, outcomes)}
+    
+    async def _release_blobs(self, references: Dict[str, List[str]]):
+        """Drop image references to deduplicated content, deleting blobs nobody references"""
+        async def release(digest: str, image_ids: List[str]):
+            try:
+                record = await self.blobs.release(digest, image_ids)
+            except (ClientError, S3UnavailableError) as e:
+                logger.error(f"Failed to release content {digest} for {image_ids}, objects may leak: {e}")
+                return
+            if record is not None:
+                keys = self._object_keys(record)
+                await self._delete_keys(keys)
+                for key in keys:
+                    self.url_cache.invalidate(key)
+        
+        await asyncio.gather(*(
+            release(digest, image_ids) for digest, image_ids in references.items() if image_ids
+        ))
     
     async def delete_image(self, image_id: str) -> bool:
         """Delete image and its metadata from S3"""
-        try:
-            image_key = f"images/{image_id}"
-            thumb_key = f"thumbnails/{image_id}"
-            metadata_key = f"metadata/{image_id}.json"
-            
-            # Delete all objects
-            objects_to_delete = [
-                {'Key': image_key},
-                {'Key': thumb_key},
-                {'Key': metadata_key}
-            ]
-            
-            self.s3_client.delete_objects(
-                Bucket=self.bucket_name,
-                Delete={'Objects': objects_to_delete}
-            )
-            
-            logger.info(f"Deleted image: {image_id}")
-            return True
+        results = await self.delete_images([image_id])
+        return results[image_id] != 'failed'
+    
+    async def delete_images(self, image_ids: List[str]) -> Dict[str, str]:
+        """
+        Delete many images with as few S3 requests as possible
+        
+        Every object of every image is packed into delete_objects batches
+        of up to 1000 keys, sent concurrently, and the index is updated
+        once per touched partition. Objects of deduplicated uploads are only
+        deleted with their last reference. Returns a status per image ID:
+        deleted, not_found (no metadata, leftover objects are still
+        removed) or failed.
+        """
+        unique_ids = list(dict.fromkeys(image_ids))
+        statuses: Dict[str, str] = {}
+        owner: Dict[str, str] = {}
+        records: Dict[str, Dict] = {}
+        shared: Dict[str, List[str]] = {}
+        
+        # Rendition and variant keys are recorded in the metadata; only records
+        # from before variant keys were recorded (or none at all) list variants/
+        async def collect_keys(image_id: str):
+            try:
+                metadata = await self._fetch_metadata(image_id)
+                if metadata is not None and 'variant_keys' in metadata:
+                    variant_keys = metadata['variant_keys']
+                else:
+                    variant_keys = await self._list_keys(f"variants/{image_id}/")
+            except ClientError as e:
+                logger.error(f"Failed to read metadata {image_id}: {e}")
+                statuses[image_id] = 'failed'
+                return
             
+            keys = [f"metadata/{image_id}.json"] + variant_keys
+            base_keys = [f"images/{image_id}", f"thumbnails/{image_id}"]
+            if metadata is not None:
+                if metadata.get('content_hash'):
+                    # Possibly shared with duplicates; released below
+                    shared.setdefault(metadata['content_hash'], []).append(image_id)
+                else:
+                    keys.extend(base_keys + self._object_keys(metadata))
+                records[image_id] = metadata
+                statuses[image_id] = 'deleted'
+            else:
+                # With deduplication the base objects may belong to other images
+                if not settings.dedup_uploads:
+                    keys.extend(base_keys)
+                logger.warning(f"No metadata for {image_id}, deleting leftover objects only")
+                statuses[image_id] = 'not_found'
+            for key in keys:
+                owner[key] = image_id
+        
+        await asyncio.gather(*(collect_keys(image_id) for image_id in unique_ids))
+        
+        async def delete_batch(keys: List[str]):
+            try:
+                response = await self._call(
+                    'delete_objects',
+                    Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+                )
+                failed_keys = [error['Key'] for error in response.get('Errors', [])]
+            except ClientError as e:
+                logger.error(f"Failed to delete batch of {len(keys)} objects: {e}")
+                failed_keys = keys
+            for key in failed_keys:
+                statuses[owner[key]] = 'failed'
+        
+        keys = list(owner)
+        await asyncio.gather(*(
+            delete_batch(keys[i:i + DELETE_BATCH_SIZE])
+            for i in range(0, len(keys), DELETE_BATCH_SIZE)
+        ))
+        
+        for key, image_id in owner.items():
+            self.url_cache.invalidate(key)
+            if self._variant_cache is not None and key.startswith("variants/"):
+                self._variant_cache.invalidate(key)
+        removed = [image_id for image_id, outcome in statuses.items() if outcome != 'failed']
+        await self._release_blobs({
+            digest: [image_id for image_id in ids if statuses[image_id] != 'failed']
+            for digest, ids in shared.items()
+        })
+        if removed:
+            self._bump_version()
+        for image_id in removed:
+            self.metadata_cache.invalidate(image_id)
+            if self._thumbnail_cache is not None:
+                self._thumbnail_cache.invalidate(f"thumbnails/{image_id}")
+            self._unindex_search(image_id)
+            if image_id in records:
+                self.inventory.remove(records[image_id])
+        
+        try:
+            await self.metadata_index.remove_many(removed)
         except ClientError as e:
-            logger.error(f"Failed to delete image: {e}")
-            return False
+            logger.error(f"Failed to unindex {len(removed)} images, run an index rebuild: {e}")
+        
+        logger.info(f"Deleted {len(removed)}/{len(unique_ids)} images")
+        return {image_id: statuses[image_id] for image_id in unique_ids}
 
 
 # Create singleton instance
@@ -0,0 +1,122 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    """Lower-cased word tokens of a piece of text"""
+    if not text:
+        return set()
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lower()
+
+
+class SearchIndex:
+    """
+    In-process inverted index over image titles, descriptions and tags
+
+    Title and description words map to the set of image IDs containing
+    them; tags are indexed separately and matched whole. A query is the
+    intersection of the posting sets of its terms (smallest first), so a
+    lookup costs a few set operations regardless of gallery size. Every
+    word of `q` must match as a whole token or as a prefix of one.
+
+    The index lives in one process and is rebuilt from the metadata index
+    at startup; writes made by other pods show up after their next rebuild.
+    """
+
+    def __init__(self):
+        self._terms: Dict[str, Set[str]] = defaultdict(set)
+        self._tags: Dict[str, Set[str]] = defaultdict(set)
+        self._documents: Dict[str, Dict[str, Set[str]]] = {}
+        self._vocabulary: Optional[List[str]] = None
+        self.ready = False
+
+    def build(self, records: Iterable[Dict]):
+        """Replace the index contents with `records`"""
+        self._terms.clear()
+        self._tags.clear()
+        self._documents.clear()
+        self._vocabulary = None
+        for metadata in records:
+            self.add(metadata)
+        self.ready = True
+
+    def add(self, metadata: Dict):
+        """Index a new or updated metadata record"""
+        image_id = metadata['id']
+        self.remove(image_id)
+
+        terms = tokenize(metadata.get('title')) | tokenize(metadata.get('description'))
+        tags = {normalize_tag(tag) for tag in metadata.get('tags') or [] if tag.strip()}
+        self._documents[image_id] = {'terms': terms, 'tags': tags}
+        for term in terms:
+            if term not in self._terms:
+                self._vocabulary = None
+            self._terms[term].add(image_id)
+        for tag in tags:
+            self._tags[tag].add(image_id)
+
+    def remove(self, image_id: str):
+        """Drop an image from the index (no-op if it is not indexed)"""
+        document = self._documents.pop(image_id, None)
+        if document is None:
+            return
+        for term in document['terms']:
+            postings = self._terms[term]
+            postings.discard(image_id)
+            if not postings:
+                del self._terms[term]
+                self._vocabulary = None
+        for tag in document['tags']:
+            postings = self._tags[tag]
+            postings.discard(image_id)
+            if not postings:
+                del self._tags[tag]
+
+    def _term_matches(self, word: str) -> Set[str]:
+        """
+        IDs whose title or description has a token equal to or starting with `word`
+
+        The returned set may be a posting set of the index; do not mutate it.
+        """
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._terms)
+
+        # The sorted vocabulary makes every token with this prefix one contiguous run
+        postings: List[Set[str]] = []
+        position = bisect_left(self._vocabulary, word)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(word):
+            postings.append(self._terms[self._vocabulary[position]])
+            position += 1
+
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def search(self, tag: Optional[str] = None, q: Optional[str] = None) -> Set[str]:
+        """IDs of images that have `tag` and match every word of `q`"""
+        candidates: List[Set[str]] = []
+        if tag and normalize_tag(tag):
+            candidates.append(self._tags.get(normalize_tag(tag), set()))
+        for word in tokenize(q):
+            candidates.append(self._term_matches(word))
+
+        if not candidates:
+            return set(self._documents)
+        candidates.sort(key=len)
+        result = set(candidates[0])
+        for postings in candidates[1:]:
+            if not result:
+                break
+            result &= postings
+        return result
+
+    def __len__(self) -> int:
+        return len(self._documents)
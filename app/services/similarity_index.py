@@ -0,0 +1,176 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+HASH_BITS = 64
+
+# Per-byte popcounts, for NumPy builds without np.bitwise_count (< 2.0)
+_POPCOUNT8 = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def _connected_components(size: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Component label (smallest member) of each node, by min-label hooking and pointer jumping"""
+    labels = np.arange(size)
+    while True:
+        left_labels, right_labels = labels[left], labels[right]
+        pending = left_labels != right_labels
+        if not pending.any():
+            return labels
+        left_labels, right_labels = left_labels[pending], right_labels[pending]
+        lowest = np.minimum(left_labels, right_labels)
+        np.minimum.at(labels, left_labels, lowest)
+        np.minimum.at(labels, right_labels, lowest)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+class SimilarityIndex:
+    """
+    In-process index of 64-bit perceptual hashes for near-duplicate search
+
+    Hashes are packed into one uint64 array, so a lookup is a single
+    vectorized XOR and popcount over every image (about a millisecond
+    per 100k). Rows of removed images are reused by later additions.
+
+    Duplicate clusters use the pigeonhole principle: two hashes within
+    `d` bits agree exactly on at least one of `d + 1` bit bands, so only
+    images sharing a band value are compared, and the matches are joined
+    into connected components, all without per-pair Python loops.
+
+    Like the search index, it is built from the metadata index at startup
+    and kept current by this process's writes.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.ready = False
+
+    def build(self, records: Iterable[Dict]):
+        """Replace the index contents with the hashed images among `records`"""
+        hashed = [(metadata["id"], metadata["phash"]) for metadata in records if metadata.get("phash")]
+        capacity = max(1024, len(hashed))
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._hashes[:len(hashed)] = [int(phash, 16) for _, phash in hashed]
+        self._alive[:len(hashed)] = True
+        self._ids = [image_id for image_id, _ in hashed]
+        self._rows = {image_id: row for row, image_id in enumerate(self._ids)}
+        self._free = []
+        self.ready = True
+
+    def add(self, metadata: Dict):
+        """Index a new or updated metadata record (records without a hash are dropped)"""
+        image_id = metadata["id"]
+        phash = metadata.get("phash")
+        if not phash:
+            self.remove(image_id)
+            return
+
+        row = self._rows.get(image_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._ids[row] = image_id
+            else:
+                row = len(self._ids)
+                if row == len(self._hashes):
+                    self._grow()
+                self._ids.append(image_id)
+            self._rows[image_id] = row
+        self._hashes[row] = int(phash, 16)
+        self._alive[row] = True
+
+    def _grow(self):
+        self._hashes = np.concatenate([self._hashes, np.zeros(len(self._hashes), dtype=np.uint64)])
+        self._alive = np.concatenate([self._alive, np.zeros(len(self._alive), dtype=bool)])
+
+    def remove(self, image_id: str):
+        """Drop an image from the index (no-op if it is not indexed)"""
+        row = self._rows.pop(image_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._ids[row] = None
+        self._free.append(row)
+
+    def similar(self, image_id: str, max_distance: int, limit: int) -> Optional[List[Tuple[str, int]]]:
+        """
+        Images within `max_distance` bits of an image's hash, closest first
+
+        Returns (image ID, distance) pairs, or None if the image has no hash.
+        """
+        row = self._rows.get(image_id)
+        if row is None:
+            return None
+        size = len(self._ids)
+        distances = popcount(self._hashes[:size] ^ self._hashes[row])
+        matches = np.flatnonzero(self._alive[:size] & (distances <= max_distance))
+        matches = matches[matches != row]
+        if len(matches) > limit:
+            matches = matches[np.argpartition(distances[matches], limit - 1)[:limit]]
+        matches = matches[np.argsort(distances[matches], kind="stable")]
+        return [(self._ids[match], int(distances[match])) for match in matches]
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Copy of the live hashes and their image IDs (safe to use from another thread)"""
+        rows = np.flatnonzero(self._alive[:len(self._ids)])
+        return self._hashes[rows], [self._ids[row] for row in rows]
+
+    @staticmethod
+    def clusters(hashes: np.ndarray, image_ids: List[str], max_distance: int) -> List[List[str]]:
+        """
+        Groups of images whose hashes are connected by links of at most `max_distance` bits
+
+        Works on a `snapshot()`, largest cluster first.
+        """
+        size = len(hashes)
+        bounds = np.linspace(0, HASH_BITS, max_distance + 2).astype(int)
+        left_parts, right_parts = [], []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            band = (hashes >> np.uint64(start)) & np.uint64((1 << int(stop - start)) - 1)
+            order = np.argsort(band, kind="stable")
+            band = band[order]
+            # Positions whose band still equals the one `offset` places later;
+            # this only shrinks, so large groups cost what their pairs cost
+            active = np.arange(size - 1)
+            offset = 1
+            while len(active):
+                active = active[active + offset < size]
+                active = active[band[active] == band[active + offset]]
+                if not len(active):
+                    break
+                left, right = order[active], order[active + offset]
+                close = popcount(hashes[left] ^ hashes[right]) <= max_distance
+                left_parts.append(left[close])
+                right_parts.append(right[close])
+                offset += 1
+
+        if not left_parts:
+            return []
+        labels = _connected_components(size, np.concatenate(left_parts), np.concatenate(right_parts))
+        order = np.argsort(labels, kind="stable")
+        _, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+        groups = [
+            [image_ids[member] for member in order[start:start + count]]
+            for start, count in zip(starts, counts) if count > 1
+        ]
+        groups.sort(key=len, reverse=True)
+        return groups
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
@@ -0,0 +1,413 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.metrics import track_thumbnail_stages
+
+logger = logging.getLogger(__name__)
+
+RENDITION_CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'jpeg': 'image/jpeg',
+}
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload cannot be decoded safely"""
+
+
+def _init_worker(max_pixels: int):
+    """Process pool initializer"""
+    # Let Pillow's own bomb check agree with our explicit cap
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+    # AVIF support is optional (pillow-avif-plugin)
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+
+
+def available_formats(formats: Sequence[str]) -> List[str]:
+    """Filter rendition formats down to the ones this Pillow build can encode"""
+    Image.init()
+    return [fmt for fmt in formats if fmt.upper() in Image.SAVE]
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """DCT-II basis (unnormalised; only the ordering of coefficients matters here)"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+
+_PHASH_DCT = _dct_matrix(32)
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """
+    64-bit DCT perceptual hash, as 16 hex digits
+
+    The image is reduced to 32x32 grey levels; each of the 8x8 lowest
+    frequency DCT coefficients becomes one bit, set when it is above
+    their median. Resized or recompressed copies of a picture land
+    within a few bits of each other.
+    """
+    pixels = np.asarray(
+        image.convert('L').resize((32, 32), Image.Resampling.LANCZOS, reducing_gap=3.0),
+        dtype=np.float64
+    )
+    low = (_PHASH_DCT @ pixels @ _PHASH_DCT.T)[:8, :8].ravel()
+    # The DC term is the mean brightness; leave it out of the median
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes().hex()
+
+
+def _for_encoding(image: Image.Image) -> Image.Image:
+    """Convert palette/CMYK/etc. images to a mode WebP and AVIF accept"""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('LA', 'PA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def create_derivatives(
+    source: Union[str, bytes],
+    thumbnail_size: Tuple[int, int] = (300, 300),
+    rendition_widths: Sequence[int] = (),
+    rendition_formats: Sequence[str] = (),
+    quality: int = 80,
+    max_pixels: int = 50_000_000
+) -> Tuple[Optional[bytes], List[Dict], Optional[str], Optional[Tuple[int, int]], Dict[str, float]]:
+    """
+    Create the thumbnail, every rendition and the perceptual hash from one decode
+
+    Runs inside a worker process. `source` is a file path (preferred, so
+    the upload is not pickled across processes) or the raw bytes. Returns
+    the encoded thumbnail in the original format (None if the image could
+    not be processed), a list of renditions (width, height, format and
+    encoded data), the perceptual hash, the original's dimensions and the
+    time spent in each stage in seconds.
+    """
+    timings: Dict[str, float] = {'decode': 0.0, 'hash': 0.0, 'resize': 0.0, 'encode': 0.0}
+
+    try:
+        start = time.perf_counter()
+        image = Image.open(source if isinstance(source, str) else BytesIO(source))
+        image_format = image.format or 'JPEG'
+
+        # Only the header has been read so far, so this check is cheap
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ImageRejectedError(
+                f"Image is {width}x{height}, larger than the {max_pixels} pixel limit"
+            )
+
+        # Renditions never upscale; below the smallest width keep one at native size
+        widths = sorted({min(w, width) for w in rendition_widths}, reverse=True)
+
+        # JPEG can decode straight to a reduced scale (1/2, 1/4, 1/8)
+        largest = widths[0] if widths else thumbnail_size[0]
+        if image_format == 'JPEG':
+            image.draft(None, (largest, largest * height // width))
+        image.load()
+        timings['decode'] += time.perf_counter() - start
+    except (ImageRejectedError, Image.DecompressionBombError) as e:
+        raise ImageRejectedError(str(e)) from None
+    except Exception as e:
+        logger.error(f"Failed to decode image: {e}")
+        return None, [], None, None, timings
+
+    try:
+        start = time.perf_counter()
+        phash = perceptual_hash(image)
+        timings['hash'] += time.perf_counter() - start
+    except Exception as e:
+        logger.error(f"Failed to hash image: {e}")
+        phash = None
+
+    # Largest first, so each resize starts from the previous, smaller source
+    renditions = []
+    current = _for_encoding(image) if rendition_formats else image
+    for target_width in widths:
+        start = time.perf_counter()
+        target_height = max(1, round(current.height * target_width / current.width))
+        if current.size != (target_width, target_height):
+            current = current.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        timings['resize'] += time.perf_counter() - start
+
+        for fmt in rendition_formats:
+            start = time.perf_counter()
+            out = BytesIO()
+            try:
+                current.save(out, format=fmt.upper(), quality=quality)
+            except Exception as e:
+                logger.error(f"Failed to encode {fmt} rendition: {e}")
+                continue
+            finally:
+                timings['encode'] += time.perf_counter() - start
+            renditions.append({
+                'width': current.width,
+                'height': current.height,
+                'format': fmt,
+                'data': out.getvalue()
+            })
+
+    try:
+        start = time.perf_counter()
+        image.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+        timings['resize'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        thumb_io = BytesIO()
+        image.save(thumb_io, format=image_format)
+        timings['encode'] += time.perf_counter() - start
+        thumbnail_data = thumb_io.getvalue()
+    except Exception as e:
+        logger.error(f"Failed to create thumbnail: {e}")
+        thumbnail_data = None
+
+    return thumbnail_data, renditions, phash, (width, height), timings
+
+
+def probe_image(source: str, max_pixels: int = 50_000_000) -> Optional[Tuple[int, int]]:
+    """
+    Read an image's dimensions from its header, without decoding the pixels
+
+    Runs inside a worker process. Raises ImageRejectedError for images
+    `create_derivatives` would reject; returns None for files Pillow
+    cannot read (they are stored anyway, with the original as thumbnail).
+    """
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError(str(e)) from None
+    except Exception as e:
+        logger.error(f"Failed to read image header: {e}")
+        return None
+    if width * height > max_pixels:
+        raise ImageRejectedError(
+            f"Image is {width}x{height}, larger than the {max_pixels} pixel limit"
+        )
+    return width, height
+
+
+def render_variant(
+    source: str,
+    destination: str,
+    width: int,
+    height: int,
+    fit: str,
+    fmt: str,
+    quality: int,
+    max_pixels: int = 50_000_000
+) -> Tuple[int, Dict[str, float]]:
+    """
+    Render one on-demand variant of an image and write it to `destination`
+
+    Runs inside a worker process, reading and writing files so neither
+    image crosses the process boundary. A width or height of 0 follows
+    the aspect ratio. `contain` fits the image inside the box, `cover`
+    fills the box and crops the overflow, centred. Images are never
+    upscaled; a cover box larger than the image shrinks to its ratio.
+    Returns the encoded size and the time spent in each stage. Raises
+    ImageRejectedError for images that are too large or cannot be decoded.
+    """
+    timings: Dict[str, float] = {'decode': 0.0, 'resize': 0.0, 'encode': 0.0}
+
+    start = time.perf_counter()
+    try:
+        image = Image.open(source)
+        source_width, source_height = image.size
+        if source_width * source_height > max_pixels:
+            raise ImageRejectedError(
+                f"Image is {source_width}x{source_height}, larger than the {max_pixels} pixel limit"
+            )
+    except (ImageRejectedError, Image.DecompressionBombError) as e:
+        raise ImageRejectedError(str(e)) from None
+    except Exception as e:
+        # Stored anyway at upload (see probe_image), but there is nothing to render from
+        logger.error(f"Failed to decode image: {e}")
+        raise ImageRejectedError("Image cannot be decoded") from None
+
+    if fit == 'cover' and width and height:
+        scale = max(width / source_width, height / source_height)
+        if scale > 1:
+            width, height = max(1, round(width / scale)), max(1, round(height / scale))
+            scale = 1
+        box = (width, height)
+    else:
+        scale = min(
+            width / source_width if width else 1,
+            height / source_height if height else 1,
+            1
+        )
+        box = (max(1, round(source_width * scale)), max(1, round(source_height * scale)))
+
+    # JPEG can decode straight to a reduced scale, as long as it stays above the box
+    if image.format == 'JPEG':
+        image.draft(None, (round(source_width * scale), round(source_height * scale)))
+    try:
+        image.load()
+    except Exception as e:
+        logger.error(f"Failed to decode image: {e}")
+        raise ImageRejectedError("Image cannot be decoded") from None
+    timings['decode'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = image.convert('RGB') if fmt == 'jpeg' and image.mode != 'RGB' else _for_encoding(image)
+    if fit == 'cover' and width and height:
+        image = ImageOps.fit(image, box, Image.Resampling.LANCZOS)
+    elif image.size != box:
+        image = image.resize(box, Image.Resampling.LANCZOS)
+    timings['resize'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    image.save(destination, format=fmt.upper(), quality=quality)
+    timings['encode'] += time.perf_counter() - start
+    return os.path.getsize(destination), timings
+
+
+def default_worker_count() -> int:
+    """Number of CPUs this process may run on (respects cgroup/affinity limits)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class ThumbnailService:
+    """Runs thumbnail and rendition generation on a process pool, off the event loop"""
+
+    def __init__(
+        self,
+        workers: int = 0,
+        max_pixels: int = 50_000_000,
+        rendition_widths: Sequence[int] = (),
+        rendition_formats: Sequence[str] = (),
+        rendition_quality: int = 80,
+        render_formats: Sequence[str] = ()
+    ):
+        self.workers = workers or default_worker_count()
+        self.max_pixels = max_pixels
+        self.rendition_widths = list(rendition_widths)
+        self.rendition_formats = list(rendition_formats)
+        self.rendition_quality = rendition_quality
+        self._render_formats = list(render_formats)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created lazily; spawn avoids forking a process that owns S3 threads
+        if self._pool is None:
+            _init_worker(self.max_pixels)
+            unsupported = set(self.rendition_formats) - set(available_formats(self.rendition_formats))
+            if unsupported:
+                logger.warning(f"Skipping unsupported rendition formats: {sorted(unsupported)}")
+                self.rendition_formats = available_formats(self.rendition_formats)
+            self._render_formats = available_formats(self._render_formats)
+
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.max_pixels,)
+            )
+        return self._pool
+
+    async def _submit(self, fn, *args):
+        """Run `fn` on the process pool, replacing the pool and retrying once if a worker died"""
+        pool = self._get_pool()
+        try:
+            return await self._await_task(pool, fn, *args)
+        except BrokenProcessPool:
+            logger.warning("Thumbnail worker pool broke; restarting it")
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            return await self._await_task(self._get_pool(), fn, *args)
+
+    @staticmethod
+    async def _await_task(pool: ProcessPoolExecutor, fn, *args):
+        """
+        Await one pool task; if cancelled, withdraw it or let it finish before re-raising
+
+        A running task may still be reading files the caller is about to
+        delete on the way out, so the cancellation waits for it.
+        """
+        future = pool.submit(fn, *args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                await asyncio.wait([asyncio.wrap_future(future)])
+            raise
+
+    async def create_derivatives(
+        self,
+        source: Union[str, bytes],
+        thumbnail_size: Tuple[int, int] = (300, 300)
+    ) -> Tuple[Optional[bytes], List[Dict], Optional[str], Optional[Tuple[int, int]]]:
+        """Create the thumbnail, renditions and perceptual hash on the process pool and record stage timings"""
+        thumbnail_data, renditions, phash, dimensions, timings = await self._submit(
+            create_derivatives,
+            source,
+            thumbnail_size,
+            self.rendition_widths,
+            self.rendition_formats,
+            self.rendition_quality,
+            self.max_pixels
+        )
+        track_thumbnail_stages(timings)
+        return thumbnail_data, renditions, phash, dimensions
+
+    async def probe(self, source: str) -> Optional[Tuple[int, int]]:
+        """Dimensions of an image file from its header (see `probe_image`), on the process pool"""
+        return await self._submit(probe_image, source, self.max_pixels)
+
+    @property
+    def render_formats(self) -> List[str]:
+        """Formats on-demand renders may use (the configured ones this Pillow build can encode)"""
+        self._get_pool()
+        return self._render_formats
+
+    async def render(
+        self,
+        source: str,
+        destination: str,
+        width: int,
+        height: int,
+        fit: str,
+        fmt: str,
+        quality: int
+    ) -> int:
+        """Render one variant file on the process pool and record stage timings; returns its size"""
+        size, timings = await self._submit(
+            render_variant,
+            source,
+            destination,
+            width,
+            height,
+            fit,
+            fmt,
+            quality,
+            self.max_pixels
+        )
+        track_thumbnail_stages(timings)
+        return size
+
+    def close(self):
+        """Shut down the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
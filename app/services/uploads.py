@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiofiles
+from fastapi import UploadFile
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class MalformedUploadError(ValueError):
+    """Raised when an upload body is not the multipart form expected"""
+
+
+class SpooledUpload:
+    """An upload copied to a local temporary file, with the SHA-256 of its content"""
+
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        sha256: Optional[str] = None,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None
+    ):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+    def close(self):
+        """Remove the temporary file"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+async def spool_upload(
+    upload: UploadFile,
+    max_size: int,
+    chunk_size: int = 1024 * 1024,
+    tmp_dir: Optional[str] = None
+) -> SpooledUpload:
+    """
+    Copy an upload to a temporary file in fixed-size chunks
+
+    The size limit is enforced while copying, so an oversized file is
+    never held in memory as a whole. Starlette has already received and
+    spooled the request body by then; `spool_form` parses the body as it
+    arrives instead. The content hash is computed on the way.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=tmp_dir)
+    os.close(fd)
+
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(
+                        f"File size must be less than {max_size // (1024 * 1024)}MB"
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return SpooledUpload(path, size, digest.hexdigest())
+
+
+class UploadForm:
+    """The text fields and the file of a multipart upload (see `spool_form`)"""
+
+    def __init__(self, fields: Dict[str, str], file: Optional[SpooledUpload]):
+        self.fields = fields
+        self.file = file
+
+
+async def spool_form(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    file_field: str,
+    max_size: int,
+    max_fields_size: int = 64 * 1024,
+    tmp_dir: Optional[str] = None
+) -> UploadForm:
+    """
+    Parse a multipart/form-data body as it is received, writing its file to a temporary file
+
+    Only one file, in `file_field`, is accepted. Its bytes go straight
+    from the request to disk, once, and are hashed on the way. Limits
+    are checked as the body arrives: a file over `max_size`, or text
+    fields over `max_fields_size` together, raise UploadTooLargeError
+    without the rest being read.
+    """
+    _, params = parse_options_header(content_type)
+    if not content_type.startswith("multipart/form-data") or b"boundary" not in params:
+        raise MalformedUploadError("Expected a multipart/form-data body")
+
+    fields: Dict[str, str] = {}
+    part: Dict = {}
+    header: Dict[str, bytes] = {"name": b"", "value": b""}
+    pending: List = []
+    state = {"fields_size": 0, "file_size": 0, "files": 0, "complete": False}
+    digest = hashlib.sha256()
+    spooled: Optional[SpooledUpload] = None
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, data=b"", is_file=False)
+
+    def on_header_field(data, start, end):
+        header["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["name"].lower()] = header["value"]
+        header["name"] = header["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MalformedUploadError("A form part has no name")
+        part["name"] = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            state["files"] += 1
+            if part["name"] != file_field or state["files"] > 1:
+                raise MalformedUploadError(f"Only one file is accepted, as {file_field}")
+            part["is_file"] = True
+            pending.append(("open", options[b"filename"].decode("utf-8", "replace"),
+                            part["headers"].get(b"content-type", b"").decode("latin-1")))
+
+    def on_part_data(data, start, end):
+        chunk = data[start:end]
+        if part["is_file"]:
+            state["file_size"] += len(chunk)
+            if state["file_size"] > max_size:
+                raise UploadTooLargeError(f"File size must be less than {max_size // (1024 * 1024)}MB")
+            digest.update(chunk)
+            pending.append(("write", chunk))
+            return
+        state["fields_size"] += len(chunk)
+        if state["fields_size"] > max_fields_size:
+            raise UploadTooLargeError("Form fields are too large")
+        part["data"] += chunk
+
+    def on_part_end():
+        if not part["is_file"]:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+
+    def on_end():
+        state["complete"] = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_end": on_end,
+    })
+
+    out = None
+    try:
+        async for chunk in stream:
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise MalformedUploadError(f"Malformed multipart body: {e}") from None
+            # The parser's callbacks are synchronous; file I/O happens here
+            for event in pending:
+                if event[0] == "open":
+                    fd, path = tempfile.mkstemp(prefix="upload-", dir=tmp_dir)
+                    os.close(fd)
+                    spooled = SpooledUpload(path, 0, filename=event[1], content_type=event[2])
+                    out = await aiofiles.open(path, "wb")
+                else:
+                    await out.write(event[1])
+            pending.clear()
+        if not state["complete"]:
+            raise MalformedUploadError("Multipart body ended early")
+    except BaseException:
+        if out is not None:
+            await out.close()
+        if spooled is not None:
+            spooled.close()
+        raise
+
+    if out is not None:
+        await out.close()
+        spooled.size = state["file_size"]
+        spooled.sha256 = digest.hexdigest()
+    return UploadForm(fields, spooled)
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a local file, read in fixed-size chunks (blocking)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as src:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_zip_images(archive_path: str, max_members: int) -> List[zipfile.ZipInfo]:
+    """List the image members of a zip archive (by extension), skipping directories"""
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and (mimetypes.guess_type(info.filename)[0] or "").startswith("image/")
+        ]
+    if len(members) > max_members:
+        raise UploadTooLargeError(f"Archive contains more than {max_members} images")
+    return members
+
+
+def extract_zip_member(
+    archive_path: str,
+    member: zipfile.ZipInfo,
+    max_size: int,
+    chunk_size: int = 1024 * 1024,
+    tmp_dir: Optional[str] = None
+) -> SpooledUpload:
+    """
+    Extract one archive member to a temporary file (blocking)
+
+    The declared size is checked first and the decompressed stream is
+    counted as well, so a forged header cannot inflate past `max_size`.
+    """
+    if member.file_size > max_size:
+        raise UploadTooLargeError(
+            f"File size must be less than {max_size // (1024 * 1024)}MB"
+        )
+
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=tmp_dir)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out, zipfile.ZipFile(archive_path) as archive:
+            with archive.open(member) as src:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise UploadTooLargeError(
+                            f"File size must be less than {max_size // (1024 * 1024)}MB"
+                        )
+                    digest.update(chunk)
+                    out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return SpooledUpload(path, size, digest.hexdigest())
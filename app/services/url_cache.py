@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Tuple
+
+from app.metrics import track_presigned_url_cache
+
+
+class PresignedUrlCache:
+    """
+    Bounded LRU of presigned GET URLs keyed by object key
+
+    A URL is handed out again until less than `refresh_margin` seconds of
+    its `ttl` remain, so every URL returned is valid for at least
+    `refresh_margin` seconds. Reusing the same URL skips the HMAC signing
+    and lets browsers and CDNs cache the object it points at.
+    """
+
+    def __init__(
+        self,
+        sign: Callable[[str, int], str],
+        ttl: int = 3600,
+        refresh_margin: int = 600,
+        max_size: int = 50_000
+    ):
+        if refresh_margin >= ttl:
+            raise ValueError("refresh_margin must be smaller than ttl")
+        self._sign = sign
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_size = max_size
+        self._urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, key: str) -> str:
+        """Return a cached URL for `key`, signing a new one when needed"""
+        now = time.monotonic()
+        cached = self._urls.get(key)
+        if cached is not None and cached[1] > now:
+            self._urls.move_to_end(key)
+            track_presigned_url_cache('hit')
+            return cached[0]
+
+        track_presigned_url_cache('miss')
+        url = self._sign(key, self.ttl)
+        self._urls[key] = (url, now + self.ttl - self.refresh_margin)
+        self._urls.move_to_end(key)
+        while len(self._urls) > self.max_size:
+            self._urls.popitem(last=False)
+        return url
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Return URLs for several keys, signing only the missing or stale ones"""
+        return {key: self.get(key) for key in keys}
+
+    def invalidate(self, key: str):
+        """Forget the URL for a deleted or replaced object"""
+        self._urls.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._urls)
@@ -0,0 +1,67 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+
+Prints throughput and latency changes per image count and operation.
+Exits with status 1 if any p95 latency got worse by more than
+--threshold percent (if given), so it can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional, Tuple
+
+
+def _load(path: str) -> Dict[Tuple[int, str], Dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {
+        (run['images'], operation): result
+        for run in report['runs']
+        for operation, result in run['operations'].items()
+    }
+
+
+def _change(before: float, after: float) -> Optional[float]:
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def _format_change(change: Optional[float]) -> str:
+    return '     n/a' if change is None else f'{change:+7.1f}%'
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, help='fail if p95 latency regresses by more than this percent')
+    args = parser.parse_args(argv)
+
+    baseline = _load(args.baseline)
+    candidate = _load(args.candidate)
+
+    print(f"{'images':>8} {'operation':<8} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    regressions = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[key], candidate[key]
+        p95 = _change(before['latency_ms']['p95'], after['latency_ms']['p95'])
+        print(
+            f"{key[0]:>8} {key[1]:<8}"
+            f" {_format_change(_change(before['throughput_rps'], after['throughput_rps']))}"
+            f" {_format_change(_change(before['latency_ms']['p50'], after['latency_ms']['p50']))}"
+            f" {_format_change(p95)}"
+            f" {_format_change(_change(before['latency_ms']['p99'], after['latency_ms']['p99']))}"
+        )
+        if args.threshold is not None and p95 is not None and p95 > args.threshold:
+            regressions.append(key)
+
+    for images, operation in regressions:
+        print(f"p95 regression: {operation} with {images} images", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
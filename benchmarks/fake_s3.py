@@ -0,0 +1,189 @@
+import hashlib
+import io
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import botocore.session
+from botocore.exceptions import ClientError
+
+
+def _error(code: str, status: int, operation: str) -> ClientError:
+    return ClientError(
+        {
+            'Error': {'Code': code, 'Message': code},
+            'ResponseMetadata': {'HTTPStatusCode': status, 'RetryAttempts': 0}
+        },
+        operation
+    )
+
+
+class _Object:
+    __slots__ = ('body', 'content_type', 'etag', 'last_modified')
+
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.content_type = content_type
+        self.etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.last_modified = datetime.now(timezone.utc)
+
+
+class FakeS3Client:
+    """
+    In-process stand-in for the parts of the boto3 S3 client the app uses
+
+    Objects live in a dict, so results measure the application rather
+    than the network. `latency` (seconds) is slept once per API call to
+    model a round trip; the sleep happens on the calling thread, exactly
+    where a real client would block. Presigned URLs and POST policies are
+    produced by a real botocore client with dummy credentials, so signing
+    costs what it costs in production.
+    """
+
+    def __init__(self, region_name: str = 'us-east-1', latency: float = 0.0):
+        self.latency = latency
+        self._objects: Dict[str, _Object] = {}
+        self._lock = threading.Lock()
+        self._signer = botocore.session.get_session().create_client(
+            's3',
+            region_name=region_name,
+            aws_access_key_id='benchmark',
+            aws_secret_access_key='benchmark'
+        )
+        self.meta = self._signer.meta
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, key: str, operation: str, missing_code: str = 'NoSuchKey') -> _Object:
+        obj = self._objects.get(key)
+        if obj is None:
+            raise _error(missing_code, 404, operation)
+        return obj
+
+    def seed(self, key: str, body: bytes, content_type: str = 'application/octet-stream'):
+        """Store an object without the simulated round trip"""
+        with self._lock:
+            self._objects[key] = _Object(body, content_type)
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    # API operations
+
+    def head_bucket(self, Bucket: str, **kwargs) -> Dict:
+        self._round_trip()
+        return {}
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body=b'',
+        ContentType: str = 'binary/octet-stream',
+        IfMatch: Optional[str] = None,
+        IfNoneMatch: Optional[str] = None,
+        **kwargs
+    ) -> Dict:
+        self._round_trip()
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        obj = _Object(bytes(Body), ContentType)
+        with self._lock:
+            current = self._objects.get(Key)
+            if IfMatch is not None and current is None:
+                raise _error('NoSuchKey', 404, 'PutObject')
+            if (IfMatch is not None and IfMatch != current.etag) or (IfNoneMatch == '*' and current is not None):
+                raise _error('PreconditionFailed', 412, 'PutObject')
+            self._objects[Key] = obj
+        return {'ETag': obj.etag}
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: Optional[str] = None, **kwargs) -> Dict:
+        self._round_trip()
+        obj = self._get(Key, 'GetObject')
+        if IfNoneMatch is not None and IfNoneMatch == obj.etag:
+            raise _error('304', 304, 'GetObject')
+        return {
+            'Body': io.BytesIO(obj.body),
+            'ContentLength': len(obj.body),
+            'ContentType': obj.content_type,
+            'ETag': obj.etag,
+            'LastModified': obj.last_modified
+        }
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._round_trip()
+        obj = self._get(Key, 'HeadObject', missing_code='404')
+        return {
+            'ContentLength': len(obj.body),
+            'ContentType': obj.content_type,
+            'ETag': obj.etag,
+            'LastModified': obj.last_modified
+        }
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        self._round_trip()
+        with self._lock:
+            self._objects.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: Dict, **kwargs) -> Dict:
+        self._round_trip()
+        objects = Delete.get('Objects', [])
+        if not 1 <= len(objects) <= 1000:
+            raise _error('MalformedXML', 400, 'DeleteObjects')
+        with self._lock:
+            for entry in objects:
+                self._objects.pop(entry['Key'], None)
+        response = {'Errors': []}
+        if not Delete.get('Quiet'):
+            response['Deleted'] = [{'Key': entry['Key']} for entry in objects]
+        return response
+
+    def list_objects_v2(
+        self,
+        Bucket: str,
+        Prefix: str = '',
+        ContinuationToken: Optional[str] = None,
+        StartAfter: Optional[str] = None,
+        MaxKeys: int = 1000,
+        **kwargs
+    ) -> Dict:
+        self._round_trip()
+        start = ContinuationToken or StartAfter
+        with self._lock:
+            keys = sorted(key for key in self._objects if key.startswith(Prefix) and (not start or key > start))
+            page = keys[:MaxKeys]
+            contents = [
+                {
+                    'Key': key,
+                    'Size': len(self._objects[key].body),
+                    'ETag': self._objects[key].etag,
+                    'LastModified': self._objects[key].last_modified
+                }
+                for key in page
+            ]
+        response = {'Contents': contents, 'KeyCount': len(page), 'IsTruncated': len(keys) > MaxKeys}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = page[-1]
+        return response
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[Dict] = None, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket, Key, f.read(), **(ExtraArgs or {}))
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        response = self.get_object(Bucket, Key)
+        with open(Filename, 'wb') as f:
+            shutil.copyfileobj(response['Body'], f)
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Optional[Dict] = None, ExpiresIn: int = 3600, **kwargs) -> str:
+        return self._signer.generate_presigned_url(ClientMethod, Params=Params, ExpiresIn=ExpiresIn, **kwargs)
+
+    def generate_presigned_post(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        return self._signer.generate_presigned_post(Bucket, Key, **kwargs)
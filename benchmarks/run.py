@@ -0,0 +1,335 @@
+"""
+Benchmark the image API against a local S3 stand-in
+
+    python -m benchmarks.run --images 1000 10000 100000 --output results.json
+
+Each image count runs in a fresh process: the bucket is seeded, the
+metadata index is built, and then every operation is driven through the
+FastAPI app (in process, via httpx's ASGI transport) by `--concurrency`
+clients. Results are written as JSON; compare two runs with
+`python -m benchmarks.compare`.
+
+By default S3 is the in-process FakeS3Client. With --endpoint-url the app
+talks to an S3-compatible server (MinIO, LocalStack) instead; the bucket
+must exist.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+OPERATIONS = ['list', 'search', 'get', 'update', 'upload', 'delete']
+DEFAULT_OPERATIONS = ['list', 'get', 'update', 'upload', 'delete']
+TAGS = ['nature', 'city', 'people', 'food', 'travel', 'night', 'sea', 'mountain']
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (90, 140, 200)).save(out, format='JPEG', quality=85)
+    return out.getvalue()
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _summary(latencies: List[float], errors: int, duration: float) -> Dict:
+    values = sorted(latencies)
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'duration_seconds': round(duration, 4),
+        'throughput_rps': round(len(values) / duration, 2) if duration else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(values, 50) * 1000, 3),
+            'p95': round(_percentile(values, 95) * 1000, 3),
+            'p99': round(_percentile(values, 99) * 1000, 3),
+            'mean': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            'max': round(values[-1] * 1000, 3) if values else 0.0
+        }
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _seed_record(index: int, base: datetime, original: bytes, thumbnail: bytes, rng: random.Random) -> Dict:
+    # IDs sort like real ones: a microsecond timestamp, then the file name
+    image_id = f"{base.strftime('%Y%m%d%H%M%S')}{index:06d}_seed-{index}.jpg"
+    return {
+        "id": image_id,
+        "title": f"Seeded image {index}",
+        "description": f"Benchmark image number {index} of the {rng.choice(TAGS)} collection",
+        "tags": rng.sample(TAGS, 2),
+        "filename": f"seed-{index}.jpg",
+        "content_type": "image/jpeg",
+        "size": len(original),
+        "created_at": base.isoformat(),
+        "image_key": f"images/{image_id}",
+        "thumbnail_key": f"thumbnails/{image_id}",
+        "thumbnail_size": len(thumbnail),
+        "renditions": [
+            {
+                "key": f"renditions/{image_id}/{width}.webp",
+                "width": width,
+                "height": width * 3 // 4,
+                "format": "webp",
+                "content_type": "image/webp",
+                "size": len(thumbnail)
+            }
+            for width in (160, 480)
+        ]
+    }
+
+
+async def _seed(s3_service, fake, count: int, rng: random.Random) -> List[str]:
+    """Write `count` images (original, thumbnail, renditions, metadata) and build the index"""
+    original = _jpeg(64, 48)
+    thumbnail = _jpeg(32, 24)
+    base = datetime(2024, 1, 1)
+    records = [_seed_record(i, base, original, thumbnail, rng) for i in range(count)]
+
+    def objects(record):
+        yield record['image_key'], original, 'image/jpeg'
+        yield record['thumbnail_key'], thumbnail, 'image/jpeg'
+        for rendition in record['renditions']:
+            yield rendition['key'], thumbnail, 'image/webp'
+        yield f"metadata/{record['id']}.json", json.dumps(record).encode(), 'application/json'
+
+    if fake is not None:
+        for record in records:
+            for key, body, content_type in objects(record):
+                fake.seed(key, body, content_type)
+    else:
+        semaphore = asyncio.Semaphore(64)
+
+        async def put(key, body, content_type):
+            async with semaphore:
+                await s3_service._call('put_object', Key=key, Body=body, ContentType=content_type)
+
+        await asyncio.gather(*(
+            put(*obj) for record in records for obj in objects(record)
+        ))
+
+    await s3_service.metadata_index.rebuild()
+    return [record['id'] for record in records]
+
+
+async def _drive(
+    client,
+    make_request: Callable,
+    count: int,
+    concurrency: int
+) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while True:
+            index = next(counter)
+            if index >= count:
+                return
+            method, url, kwargs = make_request(index)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summary(latencies, errors, time.perf_counter() - start)
+
+
+async def run_benchmark(args) -> Dict:
+    """Seed one image count and benchmark every requested operation"""
+    os.environ.setdefault('S3_BUCKET_NAME', args.bucket)
+    if args.endpoint_url:
+        os.environ['S3_ENDPOINT_URL'] = args.endpoint_url
+
+    import httpx
+    from app.config import settings
+    from app.services.s3_service import s3_service
+    from benchmarks.fake_s3 import FakeS3Client
+    from main import app
+
+    fake = None
+    if not args.endpoint_url:
+        fake = FakeS3Client(region_name=settings.aws_region, latency=args.s3_latency_ms / 1000)
+        s3_service.s3_client = fake
+        s3_service.metadata_index.s3_client = fake
+        s3_service.blobs.s3_client = fake
+
+    rng = random.Random(args.seed)
+    seed_start = time.perf_counter()
+    image_ids = await _seed(s3_service, fake, args.images, rng)
+    seed_seconds = time.perf_counter() - seed_start
+
+    requests = min(args.requests, args.images // 2) if 'delete' in args.operations else args.requests
+    # Deletes use their own IDs so reads and updates never hit a deleted image
+    delete_ids = image_ids[-requests:] if 'delete' in args.operations else []
+    live_ids = image_ids[:len(image_ids) - len(delete_ids)]
+    upload_body = _jpeg(1024, 768)
+
+    def pick() -> str:
+        return rng.choice(live_ids)
+
+    builders = {
+        'list': lambda i: ('GET', '/api/images/', {'params': (
+            {'limit': 50} if i % 2 == 0 else {'limit': 50, 'cursor': s3_service.encode_cursor(pick())}
+        )}),
+        'search': lambda i: ('GET', '/api/images/', {'params': {'tag': TAGS[i % len(TAGS)], 'limit': 50}}),
+        'get': lambda i: ('GET', f'/api/images/{pick()}', {}),
+        'update': lambda i: ('PUT', f'/api/images/{pick()}', {'json': {'title': f'Updated {i}'}}),
+        # A trailer after the JPEG end marker makes every body unique, so uploads are never deduplicated
+        'upload': lambda i: ('POST', '/api/images/', {
+            'files': {'file': (f'bench-{i}.jpg', upload_body + i.to_bytes(4, 'big'), 'image/jpeg')},
+            'data': {'title': f'Benchmark upload {i}', 'tags': 'benchmark'}
+        }),
+        'delete': lambda i: ('DELETE', f'/api/images/{delete_ids[i]}', {}),
+    }
+
+    await app.router.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            for operation in args.operations:
+                count = requests if operation == 'delete' else args.requests
+                if operation != 'delete' and args.warmup:
+                    await _drive(client, builders[operation], args.warmup, args.concurrency)
+                results[operation] = await _drive(client, builders[operation], count, args.concurrency)
+                print(_format_row(args.images, operation, results[operation]), file=sys.stderr)
+    finally:
+        await app.router.shutdown()
+
+    return {
+        'images': args.images,
+        'seed_seconds': round(seed_seconds, 3),
+        'operations': results
+    }
+
+
+def _format_row(images: int, operation: str, result: Dict) -> str:
+    latency = result['latency_ms']
+    return (
+        f"{images:>8} {operation:<8} {result['throughput_rps']:>10.1f} rps"
+        f"  p50 {latency['p50']:>9.2f} ms  p95 {latency['p95']:>9.2f} ms"
+        f"  p99 {latency['p99']:>9.2f} ms  errors {result['errors']}"
+    )
+
+
+def _environment(args) -> Dict:
+    from app.config import settings
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        's3': args.endpoint_url or 'fake',
+        's3_latency_ms': args.s3_latency_ms if not args.endpoint_url else None,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'seed': args.seed,
+        'settings': {
+            's3_max_workers': settings.s3_max_workers,
+            's3_max_pool_connections': settings.s3_max_pool_connections,
+            'thumbnail_workers': settings.thumbnail_workers,
+            'defer_derivatives': settings.defer_derivatives,
+            'metadata_index_partition_size': settings.metadata_index_partition_size,
+            'default_page_size': settings.default_page_size
+        }
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, nargs='+', default=[1000], help='image counts to seed (one run each)')
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=DEFAULT_OPERATIONS)
+    parser.add_argument('--requests', type=int, default=500, help='requests per operation')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per operation')
+    parser.add_argument('--s3-latency-ms', type=float, default=0.0, help='simulated round trip per fake S3 call')
+    parser.add_argument('--endpoint-url', help='use an S3-compatible server instead of the in-process fake')
+    parser.add_argument('--bucket', default='benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('S3_BUCKET_NAME', args.bucket)
+
+    runs = []
+    if len(args.images) == 1:
+        args.images = args.images[0]
+        runs.append(asyncio.run(run_benchmark(args)))
+    else:
+        # Fresh process per size, so caches and indexes never carry over
+        argv = list(argv if argv is not None else sys.argv[1:])
+        for count in args.images:
+            with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as out:
+                path = out.name
+            try:
+                child = _without_option(_without_option(argv, '--images'), '--output')
+                child += ['--images', str(count), '--output', path]
+                subprocess.run([sys.executable, '-m', 'benchmarks.run'] + child, check=True)
+                with open(path) as f:
+                    runs.extend(json.load(f)['runs'])
+            finally:
+                os.unlink(path)
+
+    report = json.dumps({'environment': _environment(args), 'runs': runs}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+def _without_option(argv: List[str], option: str) -> List[str]:
+    """Drop an option and its values from an argument list"""
+    result, skipping = [], False
+    for arg in argv:
+        if arg == option or arg.startswith(option + '='):
+            skipping = arg == option
+            continue
+        if skipping and not arg.startswith('--'):
+            continue
+        skipping = False
+        result.append(arg)
+    return result
+
+
+if __name__ == '__main__':
+    main()
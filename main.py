@@ -2,11 +2,16 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
-from app.routers import images
+from app.config import settings
+from app.routers import images, jobs
 from app.models.schemas import HealthResponse
+from app.services.health import HealthProber
+from app.services.inventory import reconcile_periodically
 from app.services.s3_service import s3_service
 from datetime import datetime
+import asyncio
 import logging
 import sys
 
@@ -37,11 +42,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# S3 status is refreshed in the background; /health only reads the cached result
+s3_prober = HealthProber(
+    s3_service.check_connection,
+    interval=settings.health_check_interval,
+    timeout=settings.health_check_timeout
+)
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """
+    GZip, except for image bodies served by this app
+
+    Images are already compressed, byte ranges must address the stored
+    file, and zero-copy sends have to reach the server untouched.
+    """
+
+    uncompressed_suffixes = ("/thumbnail", "/render")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith(self.uncompressed_suffixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress JSON and other large responses for clients that accept gzip
+app.add_middleware(JSONGZipMiddleware, minimum_size=settings.gzip_minimum_size)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Include routers
 app.include_router(images.router)
+app.include_router(jobs.router)
 
 # Setup Prometheus metrics
 instrumentator = Instrumentator(
@@ -78,8 +111,8 @@ async def health_check():
     # Update uptime
     update_uptime()
     
-    # Check S3
-    s3_status = await s3_service.check_connection()
+    # Last background probe result; no S3 call here
+    s3_status = s3_prober.healthy
     
     # Track health check
     track_health_check(s3_status)
@@ -87,7 +120,9 @@ async def health_check():
     return HealthResponse(
         status="healthy" if s3_status else "degraded",
         timestamp=datetime.utcnow().isoformat(),
-        s3_connection=s3_status
+        s3_connection=s3_status,
+        s3_checked_at=s3_prober.checked_at.isoformat() if s3_prober.checked_at else None,
+        circuit_breaker=s3_service.breaker.state
     )
 
 
@@ -101,18 +136,36 @@ async def startup_event():
     update_uptime()
     logger.info("✅ Custom metrics initialized")
     
-    # Check S3 connection
-    s3_status = await s3_service.check_connection()
+    # Check S3 connection, then keep checking in the background
+    s3_status = await s3_prober.start()
     if s3_status:
         logger.info("✅ S3 connection successful")
     else:
         logger.warning("⚠️  S3 connection failed")
+    
+    # Build the search indexes and count stored images and bytes, then keep
+    # them in step with other replicas; on failure search builds on first use
+    try:
+        await s3_service.reconcile_indexes()
+        logger.info("✅ Search index and storage inventory loaded")
+    except Exception as e:
+        logger.warning(f"⚠️  Search index and storage inventory not loaded: {e}")
+    app.state.inventory_task = asyncio.create_task(
+        reconcile_periodically(s3_service.reconcile_indexes, settings.inventory_reconcile_interval)
+    )
+    
+    # Post-upload jobs; with the sqlite backend, worker processes may run them instead
+    s3_service.jobs.start(settings.job_workers)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     logger.info("Shutting down Image Gallery application...")
+    await s3_prober.stop()
+    app.state.inventory_task.cancel()
+    await s3_service.jobs.stop()
+    s3_service.close()
 
 
 if __name__ == "__main__":
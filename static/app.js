@@ -1,7 +1,13 @@
 // Image Gallery Frontend JavaScript
 
 const API_BASE = '/api/images';
+const PAGE_SIZE = 48;
+// Preferred rendition formats, best compression first
+const RENDITION_FORMATS = ['avif', 'webp'];
+const CARD_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 100vw';
 let currentImages = [];
+let nextCursor = null;
+let searchFilters = { q: '', tag: '' };
 
 // Initialize app
 document.addEventListener('DOMContentLoaded', () => {
@@ -18,30 +24,54 @@ function setupEventListeners() {
     // Edit form
     document.getElementById('saveEditBtn').addEventListener('click', saveEdit);
     
+    // Search
+    document.getElementById('searchForm').addEventListener('submit', searchImages);
+    document.getElementById('galleryGrid').addEventListener('click', (event) => {
+        const badge = event.target.closest('[data-tag]');
+        if (badge) filterByTag(badge.dataset.tag);
+    });
+    
+    // Pagination
+    document.getElementById('loadMoreBtn').addEventListener('click', loadMoreImages);
+    
     // Reset form when modal closes
     document.getElementById('uploadModal').addEventListener('hidden.bs.modal', resetUploadForm);
 }
 
-// Load all images
+// Fetch one page of images
+async function fetchImagePage(cursor) {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) params.set('cursor', cursor);
+    if (searchFilters.q) params.set('q', searchFilters.q);
+    if (searchFilters.tag) params.set('tag', searchFilters.tag);
+    
+    const response = await fetch(`${API_BASE}?${params}`);
+    
+    if (!response.ok) {
+        throw new Error('Failed to load images');
+    }
+    
+    return response.json();
+}
+
+// Load first page of images
 async function loadImages() {
     showLoading(true);
     hideEmptyState();
     hideGallery();
+    showLoadMore(false);
     
     try {
-        const response = await fetch(API_BASE);
-        
-        if (!response.ok) {
-            throw new Error('Failed to load images');
-        }
-        
-        currentImages = await response.json();
+        const page = await fetchImagePage(null);
+        currentImages = page.items;
+        nextCursor = page.next_cursor;
         
         if (currentImages.length === 0) {
             showEmptyState();
         } else {
             displayImages(currentImages);
         }
+        showLoadMore(Boolean(nextCursor));
     } catch (error) {
         console.error('Error loading images:', error);
         showAlert('שגיאה בטעינת התמונות', 'danger');
@@ -50,27 +80,72 @@ async function loadImages() {
     }
 }
 
+// Reload the gallery with the current search filters
+function searchImages(event) {
+    if (event) event.preventDefault();
+    searchFilters = {
+        q: document.getElementById('searchQuery').value.trim(),
+        tag: document.getElementById('searchTag').value.trim()
+    };
+    loadImages();
+}
+
+// Filter the gallery by a tag badge
+function filterByTag(tag) {
+    document.getElementById('searchTag').value = tag;
+    searchImages();
+}
+
+// Append the next page of images
+async function loadMoreImages() {
+    if (!nextCursor) return;
+    
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    loadMoreBtn.disabled = true;
+    
+    try {
+        const page = await fetchImagePage(nextCursor);
+        currentImages = currentImages.concat(page.items);
+        nextCursor = page.next_cursor;
+        appendImages(page.items);
+        showLoadMore(Boolean(nextCursor));
+    } catch (error) {
+        console.error('Error loading images:', error);
+        showAlert('שגיאה בטעינת התמונות', 'danger');
+    } finally {
+        loadMoreBtn.disabled = false;
+    }
+}
+
 // Display images in grid
 function displayImages(images) {
     const gallery = document.getElementById('galleryGrid');
     gallery.innerHTML = '';
     
+    appendImages(images);
+    
+    showGallery();
+}
+
+// Append image cards to grid
+function appendImages(images) {
+    const gallery = document.getElementById('galleryGrid');
+    
     images.forEach(image => {
         const card = createImageCard(image);
         gallery.appendChild(card);
     });
-    
-    showGallery();
 }
 
 // Create image card
 function createImageCard(image) {
     const col = document.createElement('div');
     col.className = 'col';
+    col.dataset.imageId = image.id;
     
     const tagsHTML = image.tags && image.tags.length > 0
         ? `<div class="tags-container">
-            ${image.tags.map(tag => `<span class="badge bg-secondary">${tag}</span>`).join('')}
+            ${image.tags.map(tag => `<span class="badge bg-secondary" role="button" data-tag="${escapeHtml(tag)}">${escapeHtml(tag)}</span>`).join('')}
            </div>`
         : '';
     
@@ -83,8 +158,11 @@ function createImageCard(image) {
     
     col.innerHTML = `
         <div class="card h-100">
-            <img src="${image.thumbnail_url}" class="card-img-top" alt="${escapeHtml(image.title)}" 
-                 onclick="viewImage('${image.id}')">
+            <picture>
+                ${buildPictureSources(image, CARD_SIZES)}
+                <img src="${image.thumbnail_url}" class="card-img-top" alt="${escapeHtml(image.title)}" 
+                     loading="lazy" onclick="viewImage('${image.id}')">
+            </picture>
             <div class="card-body">
                 <h5 class="card-title">${escapeHtml(image.title)}</h5>
                 ${descriptionHTML}
@@ -115,6 +193,25 @@ function createImageCard(image) {
     return col;
 }
 
+// Build a srcset string from the renditions of one format
+function buildSrcset(image, format) {
+    return (image.renditions || [])
+        .filter(rendition => rendition.format === format)
+        .map(rendition => `${rendition.url} ${rendition.width}w`)
+        .join(', ');
+}
+
+// Build <source> elements for each available rendition format
+function buildPictureSources(image, sizes) {
+    return RENDITION_FORMATS
+        .map(format => {
+            const rendition = (image.renditions || []).find(r => r.format === format);
+            if (!rendition) return '';
+            return `<source type="${rendition.content_type}" srcset="${buildSrcset(image, format)}" sizes="${sizes}">`;
+        })
+        .join('');
+}
+
 // Preview image before upload
 function previewImage(event) {
     const file = event.target.files[0];
@@ -145,25 +242,25 @@ async function uploadImage() {
         return;
     }
     
-    const formData = new FormData();
-    formData.append('file', fileInput.files[0]);
-    formData.append('title', title);
-    if (description) formData.append('description', description);
-    if (tags) formData.append('tags', tags);
-    
     const uploadBtn = document.getElementById('uploadBtn');
     uploadBtn.disabled = true;
     uploadBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> מעלה...';
     
     try {
-        const response = await fetch(API_BASE, {
-            method: 'POST',
-            body: formData
-        });
+        const file = fileInput.files[0];
+        const tagsList = tags ? tags.split(',').map(t => t.trim()).filter(t => t) : [];
         
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || 'Upload failed');
+        // Prefer uploading straight to S3; fall back to the API if that fails
+        let uploaded = false;
+        try {
+            uploaded = await uploadDirect(file, title, description, tagsList);
+        } catch (error) {
+            if (error.fatal) throw error;
+            console.warn('Direct upload failed, uploading through the API:', error);
+        }
+        
+        if (!uploaded) {
+            await uploadViaApi(file, title, description, tags);
         }
         
         showAlert('התמונה הועלתה בהצלחה!', 'success');
@@ -184,13 +281,75 @@ async function uploadImage() {
     }
 }
 
+// Upload straight to S3 with a presigned POST, then finalize through the API
+async function uploadDirect(file, title, description, tagsList) {
+    const ticketResponse = await fetch(`${API_BASE}/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, content_type: file.type })
+    });
+    if (!ticketResponse.ok) return false;
+    const ticket = await ticketResponse.json();
+    
+    if (file.size > ticket.max_size) {
+        const error = new Error(`File size must be less than ${Math.floor(ticket.max_size / (1024 * 1024))}MB`);
+        error.fatal = true;
+        throw error;
+    }
+    
+    // The file must be the last field of the POST form
+    const s3Form = new FormData();
+    Object.entries(ticket.fields).forEach(([name, value]) => s3Form.append(name, value));
+    s3Form.append('file', file);
+    
+    const s3Response = await fetch(ticket.url, { method: 'POST', body: s3Form });
+    if (!s3Response.ok) {
+        throw new Error('Direct upload to storage failed');
+    }
+    
+    const completeResponse = await fetch(`${API_BASE}/uploads/${encodeURIComponent(ticket.image_id)}/complete`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ title, description: description || null, tags: tagsList })
+    });
+    if (!completeResponse.ok) {
+        const error = new Error((await completeResponse.json()).detail || 'Upload failed');
+        error.fatal = true;
+        throw error;
+    }
+    
+    return true;
+}
+
+// Upload through the API (multipart form)
+async function uploadViaApi(file, title, description, tags) {
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('title', title);
+    if (description) formData.append('description', description);
+    if (tags) formData.append('tags', tags);
+    
+    const response = await fetch(API_BASE, {
+        method: 'POST',
+        body: formData
+    });
+    
+    if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.detail || 'Upload failed');
+    }
+}
+
 // View image
 async function viewImage(imageId) {
     const image = currentImages.find(img => img.id === imageId);
     if (!image) return;
     
     document.getElementById('viewTitle').textContent = image.title;
-    document.getElementById('viewImage').src = image.url;
+    const viewImg = document.getElementById('viewImage');
+    viewImg.srcset = buildSrcset(image, 'webp');
+    viewImg.sizes = '(min-width: 992px) 800px, 100vw';
+    viewImg.src = image.url;
     document.getElementById('viewDescription').textContent = image.description || '';
     
     const tagsHTML = image.tags && image.tags.length > 0
@@ -239,7 +398,7 @@ async function saveEdit() {
     saveBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> שומר...';
     
     try {
-        const response = await fetch(`${API_BASE}/${imageId}`, {
+        const response = await fetch(`${API_BASE}/${encodeURIComponent(imageId)}`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json'
@@ -279,7 +438,7 @@ async function deleteImage(imageId) {
     }
     
     try {
-        const response = await fetch(`${API_BASE}/${imageId}`, {
+        const response = await fetch(`${API_BASE}/${encodeURIComponent(imageId)}`, {
             method: 'DELETE'
         });
         
@@ -289,8 +448,8 @@ async function deleteImage(imageId) {
         
         showAlert('התמונה נמחקה בהצלחה!', 'success');
         
-        // Reload images
-        await loadImages();
+        // Remove the card instead of reloading the gallery
+        removeImageCard(imageId);
         
     } catch (error) {
         console.error('Delete error:', error);
@@ -298,6 +457,18 @@ async function deleteImage(imageId) {
     }
 }
 
+// Remove a deleted image from the grid and local state
+function removeImageCard(imageId) {
+    currentImages = currentImages.filter(img => img.id !== imageId);
+    const card = document.querySelector(`#galleryGrid [data-image-id="${CSS.escape(imageId)}"]`);
+    if (card) card.remove();
+    
+    if (currentImages.length === 0 && !nextCursor) {
+        hideGallery();
+        showEmptyState();
+    }
+}
+
 // Reset upload form
 function resetUploadForm() {
     document.getElementById('uploadForm').reset();
@@ -327,6 +498,11 @@ function hideGallery() {
     document.getElementById('galleryGrid').style.display = 'none';
 }
 
+// Show/hide load more button
+function showLoadMore(show) {
+    document.getElementById('loadMoreContainer').style.display = show ? 'block' : 'none';
+}
+
 // Show alert
 function showAlert(message, type = 'info') {
     const alertContainer = document.getElementById('alertContainer');
@@ -0,0 +1,4 @@
+import os
+
+# Settings require a bucket name; nothing in the tests talks to S3
+os.environ.setdefault("S3_BUCKET_NAME", "test-bucket")
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.blob_index import BlobIndex
+from benchmarks.fake_s3 import FakeS3Client
+
+DIGEST = "ab" * 32
+METADATA = {
+    "image_key": "images/first",
+    "thumbnail_key": "thumbnails/first",
+    "thumbnail_size": 120,
+    "renditions": [],
+    "content_type": "image/jpeg",
+    "size": 4000,
+}
+
+
+async def run(fn, *args, **kwargs):
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client()
+
+
+@pytest.fixture
+def blobs(client):
+    return BlobIndex(client, "test-bucket", run)
+
+
+def stored_refs(client):
+    body = client.get_object(Bucket="test-bucket", Key=f"blobs/sha256/{DIGEST}.json")["Body"].read()
+    return json.loads(body)["refs"]
+
+
+def test_an_unknown_hash_has_no_record(blobs):
+    assert asyncio.run(blobs.add_reference(DIGEST, "second")) is None
+    assert asyncio.run(blobs.get(DIGEST)) is None
+
+
+def test_add_reference_records_each_image_once(blobs, client):
+    async def scenario():
+        async with blobs.locked(DIGEST):
+            await blobs.create(DIGEST, "first", METADATA)
+        async with blobs.locked(DIGEST):
+            record = await blobs.add_reference(DIGEST, "second")
+        async with blobs.locked(DIGEST):
+            await blobs.add_reference(DIGEST, "second")
+        return record
+
+    record = asyncio.run(scenario())
+    assert record["image_key"] == "images/first"
+    assert record["size"] == 4000
+    assert stored_refs(client) == ["first", "second"]
+
+
+def test_release_keeps_the_blob_while_it_is_referenced(blobs, client):
+    async def scenario():
+        await blobs.create(DIGEST, "first", METADATA)
+        await blobs.add_reference(DIGEST, "second")
+        await blobs.add_reference(DIGEST, "third")
+        return await blobs.release(DIGEST, ["first", "third"])
+
+    assert asyncio.run(scenario()) is None
+    assert stored_refs(client) == ["second"]
+
+
+def test_the_last_release_returns_the_record_and_drops_it(blobs, client):
+    async def scenario():
+        await blobs.create(DIGEST, "first", METADATA)
+        await blobs.add_reference(DIGEST, "second")
+        await blobs.release(DIGEST, ["first"])
+        return await blobs.release(DIGEST, ["second"])
+
+    record = asyncio.run(scenario())
+    assert record["image_key"] == "images/first"
+    assert record["refs"] == []
+    assert len(client) == 0
+    assert asyncio.run(blobs.get(DIGEST)) is None
+
+
+def test_releasing_an_unindexed_hash_keeps_the_objects(blobs):
+    assert asyncio.run(blobs.release(DIGEST, ["first"])) is None
+
+
+def test_locks_are_dropped_once_released(blobs):
+    async def scenario():
+        async with blobs.locked(DIGEST):
+            assert DIGEST in blobs._locks
+
+    asyncio.run(scenario())
+    assert blobs._locks == {}
+
+
+def test_set_derivatives_clears_the_pending_job(blobs):
+    async def scenario():
+        await blobs.create(DIGEST, "first", {**METADATA, "job_id": "job-1"})
+        await blobs.add_reference(DIGEST, "second")
+        return await blobs.set_derivatives(DIGEST, {"thumbnail_size": 300})
+
+    record = asyncio.run(scenario())
+    assert "job_id" not in record
+    assert record["thumbnail_size"] == 300
+    assert record["refs"] == ["first", "second"]
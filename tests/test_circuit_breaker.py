@@ -0,0 +1,90 @@
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, S3UnavailableError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def open_breaker(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30.0)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(S3UnavailableError):
+        breaker.before_call()
+
+
+def test_a_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_lets_one_trial_call_through_after_the_reset_timeout(clock):
+    breaker = open_breaker(clock)
+    clock.now += 29.9
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 0.1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(S3UnavailableError):
+        breaker.before_call()
+
+
+def test_a_successful_trial_closes_the_circuit(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30.0
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_a_failed_trial_opens_the_circuit_again(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30.0
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 29.0
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 1.0
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_a_released_trial_lets_the_next_call_try(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30.0
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
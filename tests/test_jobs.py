@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from app.services.jobs import JobFailed, JobQueue, SQLiteJobBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteJobBackend(str(tmp_path / "jobs.sqlite3"))
+    yield backend
+    backend.close()
+
+
+def make_job(job_id: str, now: float = 1000.0, max_attempts: int = 3) -> dict:
+    return {
+        "id": job_id, "kind": "work", "payload": {"n": 1}, "status": "queued", "attempts": 0,
+        "max_attempts": max_attempts, "error": None, "result": None,
+        "created_at": now, "updated_at": now, "run_at": now
+    }
+
+
+def test_a_job_is_claimed_once(backend):
+    async def scenario():
+        await backend.add(make_job("a"))
+        first = await backend.claim(1000.0, lease=60)
+        second = await backend.claim(1000.0, lease=60)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["id"] == "a"
+    assert first["status"] == "running"
+    assert first["attempts"] == 1
+    assert second is None
+
+
+def test_a_job_whose_lease_expired_is_claimed_again(backend):
+    async def scenario():
+        await backend.add(make_job("a"))
+        await backend.claim(1000.0, lease=60)
+        during = await backend.claim(1059.0, lease=60)
+        after = await backend.claim(1060.0, lease=60)
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert during is None
+    assert after["id"] == "a"
+    assert after["attempts"] == 2
+    assert after["lease_until"] == 1120.0
+
+
+def test_a_job_is_not_claimed_before_it_is_due(backend):
+    async def scenario():
+        await backend.add(make_job("a"))
+        await backend.claim(1000.0, lease=60)
+        await backend.requeue("a", "boom", run_at=1010.0, now=1001.0)
+        early = await backend.claim(1005.0, lease=60)
+        due = await backend.claim(1010.0, lease=60)
+        return early, due
+
+    early, due = asyncio.run(scenario())
+    assert early is None
+    assert due["attempts"] == 2
+    assert due["error"] == "boom"
+
+
+def test_a_refunded_requeue_does_not_use_up_an_attempt(backend):
+    async def scenario():
+        await backend.add(make_job("a"))
+        await backend.claim(1000.0, lease=60)
+        await backend.requeue("a", None, run_at=1000.0, now=1000.0, refund=True)
+        return await backend.get("a")
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+
+
+def test_a_failing_job_is_retried_until_it_runs_out_of_attempts(backend):
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        queue = JobQueue(backend, max_attempts=2, retry_delay=0.0)
+        queue.register("work", handler)
+        job = await queue.enqueue("work", {"n": 1})
+        states = []
+        while (claimed := await backend.claim(job["created_at"] + 1, queue.lease)) is not None:
+            await queue._execute(claimed)
+            states.append(await queue.get(job["id"]))
+        return states
+
+    states = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [state["status"] for state in states] == ["queued", "failed"]
+    assert states[-1]["attempts"] == 2
+    assert states[-1]["error"] == "RuntimeError: boom"
+
+
+def test_job_failed_is_not_retried(backend):
+    async def handler(payload):
+        raise JobFailed("bad input")
+
+    async def scenario():
+        queue = JobQueue(backend, max_attempts=5, retry_delay=0.0)
+        queue.register("work", handler)
+        job = await queue.enqueue("work", {})
+        await queue._execute(await backend.claim(job["created_at"] + 1, queue.lease))
+        return await queue.get(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["attempts"] == 1
+    assert job["error"] == "bad input"
+
+
+def test_a_job_that_keeps_losing_its_worker_fails(backend):
+    async def handler(payload):
+        return {"ok": True}
+
+    async def scenario():
+        queue = JobQueue(backend, max_attempts=1, lease=10)
+        queue.register("work", handler)
+        await backend.add(make_job("a", max_attempts=1))
+        await backend.claim(1000.0, lease=10)
+        # The worker died; the expired lease hands the job out past its last attempt
+        await queue._execute(await backend.claim(1010.0, lease=10))
+        return await queue.get("a")
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["result"] is None
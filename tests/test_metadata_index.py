@@ -0,0 +1,84 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import pytest
+
+from app.services.metadata_index import MetadataIndex, compact_entry, expand_entry
+from benchmarks.fake_s3 import FakeS3Client
+
+
+async def run(fn, *args, **kwargs):
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+def record(image_id: str, **fields) -> dict:
+    return {
+        "id": image_id,
+        "title": image_id,
+        "description": None,
+        "tags": [],
+        "filename": image_id.partition("_")[2],
+        "content_type": "image/jpeg",
+        "size": 100,
+        "created_at": "2026-01-01T00:00:00",
+        "image_key": f"images/{image_id}",
+        "thumbnail_key": f"thumbnails/{image_id}",
+        "status": "ready",
+        "variant_keys": [],
+        **fields
+    }
+
+
+@pytest.fixture
+def client():
+    client = FakeS3Client()
+    for n in range(5):
+        image_id = f"2026010100000000000{n}_{n}.jpg"
+        client.seed(f"metadata/{image_id}.json", json.dumps(record(image_id)).encode())
+    return client
+
+
+def test_compact_entries_expand_to_the_indexed_record():
+    metadata = record("20260101000000000000_a.jpg", tags=["sea"], renditions=[{
+        "key": "renditions/20260101000000000000_a.jpg/320.webp",
+        "width": 320, "height": 240, "format": "webp", "content_type": "image/webp", "size": 900
+    }])
+    entry = compact_entry(metadata)
+    assert "image_key" not in entry
+    assert entry["renditions"] == [[320, 240, "webp", 900]]
+    expected = {key: value for key, value in metadata.items() if key != "variant_keys"}
+    assert expand_entry(metadata["id"], entry) == expected
+
+
+def test_rebuild_deletes_objects_left_unlinked(client):
+    client.seed("index/part-orphan.json", b'{"start": "", "images": {}}')
+    client.seed("index/shard-000.json", b"{}")
+    index = MetadataIndex(client, "test-bucket", run, partition_size=2)
+
+    assert asyncio.run(index.rebuild()) == 5
+
+    keys = sorted(key for key in client._objects if key.startswith("index/"))
+    manifest = json.loads(client.get_object(Bucket="test-bucket", Key="index/manifest.json")["Body"].read())
+    assert keys == sorted(["index/manifest.json"] + [p["key"] for p in manifest["partitions"]])
+    assert len(manifest["partitions"]) == 3
+
+
+def test_rebuild_keeps_objects_newer_than_itself(client):
+    client.seed("index/part-later.json", b'{"start": "", "images": {}}')
+    client._objects["index/part-later.json"].last_modified += timedelta(hours=1)
+    index = MetadataIndex(client, "test-bucket", run)
+
+    asyncio.run(index.rebuild())
+
+    assert "index/part-later.json" in client._objects
+
+
+def test_pages_run_newest_first_after_a_rebuild(client):
+    index = MetadataIndex(client, "test-bucket", run, partition_size=2)
+    asyncio.run(index.rebuild())
+
+    page = asyncio.run(index.page(limit=3))
+    assert [metadata["id"] for metadata in page][:3] == [
+        "20260101000000000004_4.jpg", "20260101000000000003_3.jpg", "20260101000000000002_2.jpg"
+    ]
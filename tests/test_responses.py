@@ -0,0 +1,52 @@
+import pytest
+
+from app.routers.responses import parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-499", (0, 499)),
+    ("bytes=500-999", (500, 999)),
+    ("bytes=9500-", (9500, 9999)),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=9999-", (9999, 9999)),
+    ("bytes=-500", (9500, 9999)),
+    ("bytes=-1", (9999, 9999)),
+    ("bytes=-20000", (0, 9999)),
+    ("bytes=9500-20000", (9500, 9999)),
+    ("bytes= 10-20 ", (10, 20)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 10_000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-10",
+    "bytes=0-10,20-30",
+    "bytes=",
+    "bytes=-",
+    "bytes=10",
+    "bytes=abc-",
+    "bytes=-abc",
+    "bytes=+1-2",
+    "bytes=1-+2",
+    "bytes=1_0-20",
+    "bytes=-1_0",
+    "bytes=١-٢",
+    "bytes=20-10",
+])
+def test_ignored_headers_send_the_whole_file(header):
+    assert parse_range(header, 10_000) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=-0", 10_000),
+    ("bytes=10000-", 10_000),
+    ("bytes=10000-10005", 10_000),
+    ("bytes=0-", 0),
+    ("bytes=-5", 0),
+])
+def test_unsatisfiable_ranges(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
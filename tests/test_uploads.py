@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.services.uploads import MalformedUploadError, UploadTooLargeError, spool_form
+
+CONTENT_TYPE = "multipart/form-data; boundary=B"
+
+
+def form_body(content: bytes, title: bytes = b"Sunset") -> bytes:
+    return (
+        b'--B\r\nContent-Disposition: form-data; name="title"\r\n\r\n' + title + b"\r\n"
+        b'--B\r\nContent-Disposition: form-data; name="file"; filename="a b.jpg"\r\n'
+        b"Content-Type: image/jpeg\r\n\r\n" + content + b"\r\n--B--\r\n"
+    )
+
+
+async def chunks(body: bytes, size: int = 1000, consumed: list = None):
+    for start in range(0, len(body), size):
+        if consumed is not None:
+            consumed.append(start)
+        yield body[start:start + size]
+
+
+def parse(stream, tmp_path, **kwargs):
+    kwargs.setdefault("max_size", 10_000)
+    return asyncio.run(spool_form(stream, CONTENT_TYPE, "file", tmp_dir=str(tmp_path), **kwargs))
+
+
+def test_streams_the_file_to_disk_and_keeps_the_fields(tmp_path):
+    content = bytes(range(256)) * 20
+    form = parse(chunks(form_body(content), size=7), tmp_path)
+    with form.file as upload:
+        assert form.fields == {"title": "Sunset"}
+        assert upload.filename == "a b.jpg"
+        assert upload.content_type == "image/jpeg"
+        assert upload.size == len(content)
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        with open(upload.path, "rb") as f:
+            assert f.read() == content
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stops_reading_once_the_file_is_too_large(tmp_path):
+    consumed = []
+    body = form_body(b"x" * 100_000)
+    with pytest.raises(UploadTooLargeError):
+        parse(chunks(body, consumed=consumed), tmp_path)
+    assert len(consumed) < 15
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limits_the_text_fields(tmp_path):
+    with pytest.raises(UploadTooLargeError):
+        parse(chunks(form_body(b"x", title=b"t" * 5000)), tmp_path, max_fields_size=4096)
+
+
+@pytest.mark.parametrize("body", [
+    form_body(b"x")[:-10],
+    form_body(b"x").replace(b'name="file"', b'name="other"'),
+    form_body(b"x").replace(b"--B--", b"--B\r\nContent-Disposition: form-data; name=\"file\"; filename=\"b\"\r\n\r\ny\r\n--B--"),
+])
+def test_rejects_malformed_forms(tmp_path, body):
+    with pytest.raises(MalformedUploadError):
+        parse(chunks(body), tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rejects_other_content_types(tmp_path):
+    with pytest.raises(MalformedUploadError):
+        asyncio.run(spool_form(chunks(b"{}"), "application/json", "file", max_size=10))